@@ -0,0 +1,27 @@
+from app.core.configs import config
+from app.core.helpers.circuit_breaker import CircuitBreaker
+
+EMBEDDING_PROTOCOLS = ("http", "http-octet", "grpc")
+
+
+def make_embedding_breaker() -> CircuitBreaker:
+    slow_call_ms = config.EMBEDDING_BREAKER_SLOW_CALL_MS
+    return CircuitBreaker(
+        window_seconds=config.EMBEDDING_BREAKER_WINDOW_SECONDS,
+        min_calls=config.EMBEDDING_BREAKER_MIN_CALLS,
+        failure_rate=config.EMBEDDING_BREAKER_FAILURE_RATE,
+        slow_call_seconds=slow_call_ms / 1000 if slow_call_ms else None,
+        reset_seconds=config.EMBEDDING_BREAKER_RESET_SECONDS,
+    )
+
+
+# One breaker per protocol and process
+embedding_breakers: dict[str, CircuitBreaker] = {
+    protocol: make_embedding_breaker() for protocol in EMBEDDING_PROTOCOLS
+}
+
+
+def get_hedge_delay(breaker: CircuitBreaker) -> float:
+    """Seconds to wait before hedging: the recent p95, floored at the minimum"""
+    p95 = breaker.percentile(95) or 0.0
+    return max(p95, config.EMBEDDING_HEDGE_MIN_DELAY_MS / 1000)
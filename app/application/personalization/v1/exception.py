@@ -25,6 +25,54 @@ class UserFeatureAlreadyExistException(CustomException):
     message = "user feature is already exists"
 
 
+class FeatureJobNotFoundException(CustomException):
+    code = 404
+    error_code = "FEATURE_JOB__NOT_FOUND"
+    message = "feature job not found"
+
+
+class FeatureFormatNotAcceptableException(CustomException):
+    code = 406
+    error_code = "USER_FEATURE__NOT_ACCEPTABLE"
+    message = "none of the accepted vector formats can be served"
+
+
+class FeatureSizeMismatchException(CustomException):
+    code = 409
+    error_code = "USER_FEATURE__SIZE_MISMATCH"
+    message = "user features of different sizes cannot be stacked"
+
+
+class FeatureImportException(CustomException):
+    code = 400
+    error_code = "USER_FEATURE__CANNOT_IMPORT"
+    message = "the uploaded features cannot be imported"
+
+
+class FeatureImportMediaTypeException(CustomException):
+    code = 415
+    error_code = "USER_FEATURE__UNSUPPORTED_IMPORT_TYPE"
+    message = "features are imported as application/octet-stream or arrow stream"
+
+
+class FeatureSearchDisabledException(CustomException):
+    code = 404
+    error_code = "USER_FEATURE__SEARCH_DISABLED"
+    message = "user feature search is disabled"
+
+
+class FeatureIndexNotReadyException(CustomException):
+    code = 503
+    error_code = "USER_FEATURE__INDEX_NOT_READY"
+    message = "user feature search index is not loaded"
+
+
+class FeatureCodebookTrainException(CustomException):
+    code = 400
+    error_code = "FEATURE_CODEBOOK__CANNOT_TRAIN"
+    message = "cannot train a codebook with these parameters"
+
+
 class EmbeddingGrpcException(CustomException):
     code = 404
     error_code = "Embedding GRPC server ERROR"
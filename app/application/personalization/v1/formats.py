@@ -0,0 +1,500 @@
+import base64
+import io
+from functools import cache
+from importlib.util import find_spec
+from typing import AsyncIterator, Iterator
+
+import numpy as np
+from fastapi.responses import Response
+
+from app.application.personalization.v1.exception import (
+    FeatureFormatNotAcceptableException,
+    FeatureImportException,
+    FeatureImportMediaTypeException,
+)
+from app.application.personalization.v1.proto.embedding_pb2 import EmbeddingUserResponse
+from app.domain.personalization.repository.feature import (
+    UserFeatureBytes,
+    decompress_feature_bytes,
+    feature_numpy_dtype,
+)
+
+JSON = "application/json"
+OCTET = "application/octet-stream"
+NPY = "application/x-npy"
+MSGPACK = "application/msgpack"
+PROTOBUF = "application/x-protobuf"
+ARROW = "application/vnd.apache.arrow.stream"
+
+# Preference when the client accepts several equally
+VECTOR_MEDIA_TYPES = (JSON, OCTET, NPY, MSGPACK, PROTOBUF, ARROW)
+# Batch matrices only come as numbers, with the row mask in a header
+MATRIX_MEDIA_TYPES = (OCTET, NPY)
+# Exports describe their own layout, one self-contained record per chunk
+EXPORT_MEDIA_TYPES = (NPY, ARROW)
+# Bulk uploads: fixed-size records, or Arrow batches like the export's
+IMPORT_MEDIA_TYPES = (OCTET, ARROW)
+# Arrow uploads are parsed a message at a time, each held in memory whole
+IMPORT_ARROW_MESSAGE_BYTES = 64 * 1024 * 1024
+MEDIA_TYPE_ALIASES = {
+    "application/x-msgpack": MSGPACK,
+    "application/vnd.msgpack": MSGPACK,
+    "application/protobuf": PROTOBUF,
+}
+# Formats that carry the vector bytes as they are, in a byte order the client
+# has to know; the others describe it (npy, arrow) or decode the vector (json)
+RAW_BYTE_MEDIA_TYPES = (OCTET, MSGPACK, PROTOBUF)
+# Formats whose encoder needs a package of its own, see check_formats()
+FORMAT_MODULES = {MSGPACK: "msgpack", ARROW: "pyarrow"}
+# Stored codecs and the Content-Encoding octet responses carry them under.
+# Only plain zstd is a registered coding, the others need a client that knows
+# to unshuffle (and decompress) the body itself.
+CONTENT_ENCODINGS = {
+    "zstd": "zstd",
+    "lz4": "x-lz4",
+    "shuffle-zstd": "x-shuffle-zstd",
+    "shuffle-lz4": "x-shuffle-lz4",
+}
+
+
+@cache
+def is_available(media_type: str) -> bool:
+    module = FORMAT_MODULES.get(media_type)
+    return module is None or find_spec(module) is not None
+
+
+def check_formats() -> None:
+    """Raise ImportError if a package a vector format needs is not
+    installed, rather than answer 406 for that format later"""
+    for media_type, module in FORMAT_MODULES.items():
+        if not is_available(media_type):
+            raise ImportError(f"{media_type} needs {module!r}, which is not installed")
+
+
+def _parse_quality_list(header: str) -> list[tuple[str, float]]:
+    """Lowercased values of an Accept-style header with their q, q=0 dropped"""
+    accepted = []
+    for part in header.split(","):
+        value, *params = (p.strip() for p in part.split(";"))
+        quality = 1.0
+        for param in params:
+            name, _, q = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(q)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.append((value.lower(), quality))
+    return accepted
+
+
+def negotiate_vector_format(
+    accept: str | None, media_types: tuple[str, ...] = VECTOR_MEDIA_TYPES
+) -> str:
+    """Pick the best of `media_types` for an Accept header, the first one
+    without it"""
+    if not accept:
+        return media_types[0]
+
+    ranked: list[tuple[float, int, str]] = []
+    for media_type, quality in _parse_quality_list(accept):
+        media_type = MEDIA_TYPE_ALIASES.get(media_type, media_type)
+        if media_type in ("*/*", "application/*"):
+            candidates = media_types
+        elif media_type in media_types:
+            candidates = (media_type,)
+        else:
+            continue
+        for candidate in candidates:
+            ranked.append((quality, -media_types.index(candidate), candidate))
+
+    if not ranked:
+        raise FeatureFormatNotAcceptableException
+    return max(ranked)[2]
+
+
+def accepted_codecs(accept_encoding: str | None) -> tuple[str, ...]:
+    """Stored codecs a client takes as they are, from its Accept-Encoding"""
+    if not accept_encoding:
+        return ()
+
+    accepted = {coding for coding, _ in _parse_quality_list(accept_encoding)}
+    # No wildcard: "*" does not promise the client can unshuffle
+    return tuple(
+        codec for codec, coding in CONTENT_ENCODINGS.items() if coding in accepted
+    )
+
+
+def feature_headers(feature: UserFeatureBytes) -> dict[str, str]:
+    headers = {
+        "X-Vector-Dtype": feature.dtype,
+        "X-Vector-Size": str(feature.size),
+        "X-Vector-Byteorder": feature.byteorder,
+    }
+    if feature.codec != "none":
+        headers["Content-Encoding"] = CONTENT_ENCODINGS[feature.codec]
+    return headers
+
+
+def encode_feature(feature: UserFeatureBytes, media_type: str) -> Response:
+    if media_type != OCTET:
+        # Only the raw bytes can be sent compressed as stored
+        feature = decompress_feature_bytes(feature)
+    content = ENCODERS[media_type](feature)
+    return Response(
+        content=content,
+        media_type=media_type,
+        headers={**feature_headers(feature), "Vary": "Accept, Accept-Encoding"},
+    )
+
+
+def encode_feature_matrix(
+    matrix: np.ndarray, present: np.ndarray, media_type: str
+) -> Response:
+    """A batch matrix, its present mask packed into X-Vector-Present as
+    base64 bits (first row in the high bit)"""
+    return _encode_array(
+        matrix, present, media_type, headers={"X-Vector-Size": str(matrix.shape[1])}
+    )
+
+
+def encode_feature_scores(
+    scores: np.ndarray, present: np.ndarray, media_type: str
+) -> Response:
+    """One score per candidate as a flat array, with the present mask of
+    encode_feature_matrix"""
+    return _encode_array(scores, present, media_type)
+
+
+def _encode_array(
+    array: np.ndarray,
+    present: np.ndarray,
+    media_type: str,
+    *,
+    headers: dict[str, str] | None = None,
+) -> Response:
+    if media_type == NPY:
+        buffer = io.BytesIO()
+        np.save(buffer, array, allow_pickle=False)
+        content = buffer.getvalue()
+    else:
+        content = array.tobytes()
+    return Response(
+        content=content,
+        media_type=media_type,
+        headers={
+            "X-Vector-Dtype": array.dtype.name,
+            **(headers or {}),
+            "X-Vector-Byteorder": "little" if array.dtype.str[0] == "<" else "big",
+            "X-Vector-Count": str(array.shape[0]),
+            "X-Vector-Present": base64.b64encode(np.packbits(present)).decode(),
+            "Vary": "Accept",
+        },
+    )
+
+
+async def encode_feature_export(
+    chunks: AsyncIterator[tuple[np.ndarray, np.ndarray, np.ndarray]],
+    media_type: str,
+    *,
+    size: int,
+    dtype: str,
+) -> AsyncIterator[bytes]:
+    """Export chunks as consecutive .npy arrays, or one Arrow IPC stream of
+    record batches, each with `id`, `user_id` and `user_vector`.
+
+    np.load called repeatedly on the npy body reads one chunk per call.
+    """
+    if media_type == NPY:
+        record = np.dtype(
+            [
+                ("id", "<i8"),
+                ("user_id", "<i8"),
+                ("user_vector", feature_numpy_dtype(dtype, "little"), (size,)),
+            ]
+        )
+        async for ids, user_ids, matrix in chunks:
+            array = np.empty(len(ids), dtype=record)
+            array["id"], array["user_id"], array["user_vector"] = ids, user_ids, matrix
+            buffer = io.BytesIO()
+            np.save(buffer, array, allow_pickle=False)
+            yield buffer.getvalue()
+        return
+
+    import pyarrow as pa
+
+    schema = pa.schema(
+        [
+            ("id", pa.int64()),
+            ("user_id", pa.int64()),
+            ("user_vector", pa.list_(pa.from_numpy_dtype(np.dtype(dtype)), size)),
+        ]
+    )
+    buffer = io.BytesIO()
+    with pa.ipc.new_stream(buffer, schema) as writer:
+        async for ids, user_ids, matrix in chunks:
+            writer.write_batch(
+                pa.record_batch(
+                    [
+                        pa.array(ids),
+                        pa.array(user_ids),
+                        pa.FixedSizeListArray.from_arrays(
+                            pa.array(matrix.reshape(-1)), size
+                        ),
+                    ],
+                    schema=schema,
+                )
+            )
+            # Hand each batch on as soon as it is written
+            yield _drain(buffer)
+    yield _drain(buffer)
+
+
+async def decode_feature_import(
+    body: AsyncIterator[bytes],
+    content_type: str | None,
+    *,
+    size: int,
+    dtype: str,
+    byteorder: str = "big",
+    chunk_size: int = 1000,
+) -> AsyncIterator[tuple[np.ndarray, np.ndarray]]:
+    """(user_ids, (n, size) matrix) chunks of an upload, read as it arrives.
+
+    An octet upload is a run of records, each a signed 64-bit user id
+    followed by the vector, both in `byteorder`. An Arrow stream has a
+    `user_id` integer column and a `user_vector` fixed size list of floats;
+    its values are converted to `dtype`.
+    """
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    if media_type == OCTET:
+        chunks = _decode_octet_import(
+            body, size=size, dtype=dtype, byteorder=byteorder, chunk_size=chunk_size
+        )
+    elif media_type == ARROW:
+        chunks = _decode_arrow_import(
+            body, size=size, dtype=dtype, chunk_size=chunk_size
+        )
+    else:
+        raise FeatureImportMediaTypeException
+    async for user_ids, vectors in chunks:
+        yield user_ids, vectors
+
+
+async def _decode_octet_import(
+    body: AsyncIterator[bytes],
+    *,
+    size: int,
+    dtype: str,
+    byteorder: str,
+    chunk_size: int,
+) -> AsyncIterator[tuple[np.ndarray, np.ndarray]]:
+    prefix = "<" if byteorder == "little" else ">"
+    record = np.dtype(
+        [
+            ("user_id", f"{prefix}i8"),
+            ("user_vector", feature_numpy_dtype(dtype, byteorder), (size,)),
+        ]
+    )
+    chunk_bytes = record.itemsize * chunk_size
+    buffer = bytearray()
+    async for part in body:
+        buffer += part
+        while len(buffer) >= chunk_bytes:
+            records = np.frombuffer(bytes(buffer[:chunk_bytes]), dtype=record)
+            del buffer[:chunk_bytes]
+            yield records["user_id"], records["user_vector"]
+    if len(buffer) % record.itemsize:
+        raise FeatureImportException(
+            message=f"upload does not split into records of {record.itemsize} "
+            f"bytes (user id + {size} {dtype})"
+        )
+    if buffer:
+        records = np.frombuffer(bytes(buffer), dtype=record)
+        yield records["user_id"], records["user_vector"]
+
+
+async def _decode_arrow_import(
+    body: AsyncIterator[bytes],
+    *,
+    size: int,
+    dtype: str,
+    chunk_size: int,
+) -> AsyncIterator[tuple[np.ndarray, np.ndarray]]:
+    schema = None
+    async for message in _read_arrow_messages(body):
+        if schema is None:
+            schema = _read_arrow_import_schema(message, size=size)
+            continue
+        for chunk in _arrow_import_chunks(
+            message, schema, size=size, dtype=dtype, chunk_size=chunk_size
+        ):
+            yield chunk
+    if schema is None:
+        raise FeatureImportException(message="not an Arrow stream: no schema")
+
+
+async def _read_arrow_messages(body: AsyncIterator[bytes]) -> AsyncIterator:
+    """The IPC messages of an Arrow stream upload, each once it has arrived.
+
+    Only the message being received is held in memory, up to
+    IMPORT_ARROW_MESSAGE_BYTES.
+    """
+    pending = bytearray()
+    # Parsing an incomplete message fails, so retry only once the bytes
+    # pending have doubled: every byte is parsed a bounded number of times
+    parse_at = 8
+    async for part in body:
+        pending += part
+        if len(pending) < parse_at:
+            continue
+        messages, consumed, ended = _parse_arrow_messages(pending)
+        for message in messages:
+            yield message
+        if ended:
+            # Bytes after the end-of-stream marker are ignored
+            return
+        if not messages and len(pending) > IMPORT_ARROW_MESSAGE_BYTES:
+            raise FeatureImportException(
+                message=f"Arrow messages over {IMPORT_ARROW_MESSAGE_BYTES >> 20} MB "
+                "are not supported, write smaller record batches"
+            )
+        del pending[:consumed]
+        parse_at = max(8, 2 * len(pending))
+
+    messages, consumed, _ = _parse_arrow_messages(pending)
+    if consumed < len(pending):
+        raise FeatureImportException(message="truncated or invalid Arrow stream")
+    for message in messages:
+        yield message
+
+
+def _parse_arrow_messages(data: bytearray) -> tuple[list, int, bool]:
+    """The complete IPC messages at the start of `data`, the bytes they take
+    and whether the end-of-stream marker was reached"""
+    import pyarrow as pa
+
+    # A copy: the messages' buffers must not pin `data`, which gets resized
+    reader = pa.BufferReader(bytes(data))
+    messages, consumed = [], 0
+    while True:
+        try:
+            message = pa.ipc.read_message(reader)
+        except EOFError:
+            return messages, reader.tell(), True
+        except (pa.ArrowInvalid, OSError):
+            # Incomplete, unless the upload ends here
+            return messages, consumed, False
+        messages.append(message)
+        consumed = reader.tell()
+
+
+def _read_arrow_import_schema(message, *, size: int):
+    import pyarrow as pa
+
+    if message.type != "schema":
+        raise FeatureImportException(message="not an Arrow stream: no schema")
+    schema = pa.ipc.read_schema(message)
+    names = set(schema.names)
+    if not {"user_id", "user_vector"} <= names:
+        raise FeatureImportException(
+            message="Arrow stream needs user_id and user_vector columns"
+        )
+    id_type = schema.field("user_id").type
+    vector_type = schema.field("user_vector").type
+    if (
+        not pa.types.is_integer(id_type)
+        or not pa.types.is_fixed_size_list(vector_type)
+        or vector_type.list_size != size
+        or not pa.types.is_floating(vector_type.value_type)
+    ):
+        raise FeatureImportException(
+            message=f"user_vector must be a fixed size list of {size} floats "
+            f"and user_id an integer, got {vector_type} and {id_type}"
+        )
+    return schema
+
+
+def _arrow_import_chunks(
+    message, schema, *, size: int, dtype: str, chunk_size: int
+) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    import pyarrow as pa
+
+    if message.type != "record batch":
+        raise FeatureImportException(
+            message=f"unexpected Arrow {message.type} message, dictionaries "
+            "are not supported"
+        )
+    batch = pa.ipc.read_record_batch(message, schema)
+    vectors = batch.column("user_vector")
+    values = vectors.flatten()
+    if batch.column("user_id").null_count or vectors.null_count or values.null_count:
+        raise FeatureImportException(message="null user_id or user_vector")
+    user_ids = batch.column("user_id").to_numpy().astype(np.int64)
+    matrix = values.to_numpy().reshape(-1, size).astype(dtype, copy=False)
+    for start in range(0, len(user_ids), chunk_size):
+        yield user_ids[start : start + chunk_size], matrix[start : start + chunk_size]
+
+
+def _drain(buffer: io.BytesIO) -> bytes:
+    content = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return content
+
+
+def _as_array(feature: UserFeatureBytes) -> np.ndarray:
+    return np.frombuffer(
+        feature.bvector, dtype=feature_numpy_dtype(feature.dtype, feature.byteorder)
+    )
+
+
+def _encode_octet(feature: UserFeatureBytes) -> bytes | memoryview:
+    return feature.bvector
+
+
+def _encode_npy(feature: UserFeatureBytes) -> bytes:
+    buffer = io.BytesIO()
+    np.save(buffer, _as_array(feature)[np.newaxis], allow_pickle=False)
+    return buffer.getvalue()
+
+
+def _encode_msgpack(feature: UserFeatureBytes) -> bytes:
+    import msgpack
+
+    return msgpack.packb(
+        {
+            "size": feature.size,
+            "dtype": feature.dtype,
+            "byteorder": feature.byteorder,
+            "bvector": feature.bvector,
+        }
+    )
+
+
+def _encode_protobuf(feature: UserFeatureBytes) -> bytes:
+    return EmbeddingUserResponse(bvector=bytes(feature.bvector)).SerializeToString()
+
+
+def _encode_arrow(feature: UserFeatureBytes) -> bytes:
+    import pyarrow as pa
+
+    # Arrow buffers are little-endian
+    values = pa.array(_as_array(feature).astype(feature.dtype))
+    column = pa.FixedSizeListArray.from_arrays(values, feature.size)
+    batch = pa.record_batch([column], names=["user_vector"])
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+ENCODERS = {
+    OCTET: _encode_octet,
+    NPY: _encode_npy,
+    MSGPACK: _encode_msgpack,
+    PROTOBUF: _encode_protobuf,
+    ARROW: _encode_arrow,
+}
@@ -0,0 +1,36 @@
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator
+
+import httpx
+
+from app.core.configs import config
+
+
+def get_embedding_http_client() -> httpx.AsyncClient:
+    # HTTP/2 is negotiated through ALPN, so it only kicks in for https:// URLs.
+    # Plain http:// still benefits from the keep-alive pool.
+    limits = httpx.Limits(
+        max_connections=config.EMBEDDING_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=config.EMBEDDING_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=config.EMBEDDING_HTTP_KEEPALIVE_EXPIRY,
+    )
+    client = httpx.AsyncClient(
+        http2=config.EMBEDDING_HTTP2,
+        limits=limits,
+        timeout=config.EMBEDDING_HTTP_TIMEOUT,
+    )
+
+    return client
+
+
+@asynccontextmanager
+async def borrow_embedding_http_client(
+    client: httpx.AsyncClient | None = None,
+) -> AsyncGenerator[httpx.AsyncClient, None]:
+    """Yield the app-scoped client, or a short-lived one outside the lifespan"""
+    if client is not None:
+        yield client
+        return
+
+    async with get_embedding_http_client() as client:
+        yield client
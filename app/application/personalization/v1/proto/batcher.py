@@ -0,0 +1,124 @@
+import asyncio
+import logging
+
+import grpc
+
+from app.application.personalization.v1.proto.embedding_pb2 import (
+    EmbeddingUserRequest,
+    EmbeddingUserResponse,
+    EmbeddingUsersRequest,
+)
+from app.application.personalization.v1.proto.embedding_pb2_grpc import (
+    EmbeddingServiceStub,
+)
+
+
+class EmbeddingBatcher:
+    """Coalesce concurrent EmbeddingUser calls into EmbeddingUsers RPCs.
+
+    Exposes the same `EmbeddingUser` coroutine as `EmbeddingServiceStub`, so it
+    can be handed to the service in place of the stub.
+    """
+
+    def __init__(
+        self,
+        stub: EmbeddingServiceStub,
+        *,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+    ):
+        self.stub = stub
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.batch_supported = True
+        self._pending: list[tuple[EmbeddingUserRequest, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        pass
+
+    async def EmbeddingUser(
+        self, request: EmbeddingUserRequest, **kwargs
+    ) -> EmbeddingUserResponse:
+        if not self.batch_supported:
+            return await self.stub.EmbeddingUser(request, **kwargs)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((request, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        task = asyncio.create_task(self._send(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(
+        self, batch: list[tuple[EmbeddingUserRequest, asyncio.Future]]
+    ) -> None:
+        requests = [request for request, _ in batch]
+        try:
+            response = await self.stub.EmbeddingUsers(
+                EmbeddingUsersRequest(requests=requests)
+            )
+            bvectors = list(response.bvectors)
+            if len(bvectors) != len(batch):
+                raise ValueError(
+                    f"EmbeddingUsers returned {len(bvectors)} vectors "
+                    f"for {len(batch)} requests"
+                )
+        except grpc.aio.AioRpcError as e:
+            if e.code() != grpc.StatusCode.UNIMPLEMENTED:
+                self._reject(batch, e)
+                return
+            # Older model servers only speak the unary RPC
+            logging.warning("EmbeddingUsers is not implemented, batching disabled")
+            self.batch_supported = False
+            await asyncio.gather(*(self._send_unary(*item) for item in batch))
+            return
+        except Exception as e:
+            self._reject(batch, e)
+            return
+
+        for (_, future), bvector in zip(batch, bvectors):
+            if not future.done():
+                future.set_result(EmbeddingUserResponse(bvector=bvector))
+
+    async def _send_unary(
+        self, request: EmbeddingUserRequest, future: asyncio.Future
+    ) -> None:
+        try:
+            response = await self.stub.EmbeddingUser(request)
+        except Exception as e:
+            self._reject([(request, future)], e)
+            return
+        if not future.done():
+            future.set_result(response)
+
+    @staticmethod
+    def _reject(
+        batch: list[tuple[EmbeddingUserRequest, asyncio.Future]], exc: Exception
+    ) -> None:
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(exc)
+
+    async def close(self) -> None:
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
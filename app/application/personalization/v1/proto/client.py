@@ -1,13 +1,118 @@
+import asyncio
+import itertools
+import logging
+
 import grpc
 
+from app.application.personalization.v1.proto.batcher import EmbeddingBatcher
+from app.application.personalization.v1.proto.embedding_pb2 import (
+    EmbeddingUserRequest,
+    EmbeddingUserResponse,
+    EmbeddingUsersRequest,
+    EmbeddingUsersResponse,
+)
 from app.application.personalization.v1.proto.embedding_pb2_grpc import (
     EmbeddingServiceStub,
 )
+from app.application.personalization.v1.proto.stream import EmbeddingStream
 from app.core.configs import config
 
+COMPRESSION = {
+    "none": grpc.Compression.NoCompression,
+    "gzip": grpc.Compression.Gzip,
+    "deflate": grpc.Compression.Deflate,
+}
+
+
+class EmbeddingChannelPool:
+    """Round-robin EmbeddingService calls over several gRPC channels.
+
+    Each channel gets its own subchannel pool, so the pool really opens `size`
+    HTTP/2 connections instead of sharing one.
+    """
+
+    def __init__(
+        self,
+        target: str,
+        *,
+        size: int = 1,
+        options: list[tuple[str, int]] | None = None,
+        compression: grpc.Compression | None = None,
+    ):
+        options = [*(options or []), ("grpc.use_local_subchannel_pool", 1)]
+        self.channels = [
+            grpc.aio.insecure_channel(target, options=options, compression=compression)
+            for _ in range(max(size, 1))
+        ]
+        self.stubs = [EmbeddingServiceStub(channel) for channel in self.channels]
+        self._cycle = itertools.cycle(range(len(self.stubs)))
+
+    @property
+    def stub(self) -> EmbeddingServiceStub:
+        return self.stubs[next(self._cycle)]
+
+    async def EmbeddingUser(
+        self, request: EmbeddingUserRequest, **kwargs
+    ) -> EmbeddingUserResponse:
+        return await self.stub.EmbeddingUser(request, **kwargs)
+
+    async def EmbeddingUsers(
+        self, request: EmbeddingUsersRequest, **kwargs
+    ) -> EmbeddingUsersResponse:
+        return await self.stub.EmbeddingUsers(request, **kwargs)
+
+    def EmbeddingUserStream(self, request_iterator, **kwargs):
+        return self.stub.EmbeddingUserStream(request_iterator, **kwargs)
+
+    async def connect(self, *, timeout: float) -> bool:
+        """Eagerly connect every channel so the first requests skip the handshake"""
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(c.channel_ready() for c in self.channels)),
+                timeout=timeout,
+            )
+        except asyncio.TimeoutError:
+            logging.warning(
+                f"gRPC channels not ready after {timeout}s, connecting lazily"
+            )
+            return False
+        return True
+
+    async def close(self) -> None:
+        await asyncio.gather(*(channel.close() for channel in self.channels))
+
+
+def get_embedding_channel_pool() -> EmbeddingChannelPool:
+    options = [
+        ("grpc.keepalive_time_ms", config.EMBEDDING_GRPC_KEEPALIVE_TIME_MS),
+        ("grpc.keepalive_timeout_ms", config.EMBEDDING_GRPC_KEEPALIVE_TIMEOUT_MS),
+        ("grpc.keepalive_permit_without_calls", 1),
+        ("grpc.http2.max_pings_without_data", 0),
+        ("grpc.max_send_message_length", config.EMBEDDING_GRPC_MAX_MESSAGE_LENGTH),
+        ("grpc.max_receive_message_length", config.EMBEDDING_GRPC_MAX_MESSAGE_LENGTH),
+    ]
+    return EmbeddingChannelPool(
+        config.EMBEDDING_GRPC_URL,
+        size=config.EMBEDDING_GRPC_POOL_SIZE,
+        options=options,
+        compression=COMPRESSION[config.EMBEDDING_GRPC_COMPRESSION],
+    )
 
-def get_embedding_channel_stub():
-    channel = grpc.aio.insecure_channel(config.EMBEDDING_GRPC_URL)
-    stub = EmbeddingServiceStub(channel)
 
-    return channel, stub
+def get_embedding_client(
+    stub: EmbeddingServiceStub | EmbeddingChannelPool,
+) -> EmbeddingBatcher | EmbeddingStream | None:
+    """Wrap the stub for EMBEDDING_GRPC_MODE, None for plain unary calls"""
+    if config.EMBEDDING_GRPC_MODE == "batch":
+        return EmbeddingBatcher(
+            stub,
+            max_batch_size=config.EMBEDDING_GRPC_BATCH_MAX_SIZE,
+            max_wait_ms=config.EMBEDDING_GRPC_BATCH_MAX_WAIT_MS,
+        )
+    if config.EMBEDDING_GRPC_MODE == "stream":
+        return EmbeddingStream(
+            stub,
+            backoff_ms=config.EMBEDDING_GRPC_STREAM_BACKOFF_MS,
+            max_backoff_ms=config.EMBEDDING_GRPC_STREAM_MAX_BACKOFF_MS,
+        )
+    return None
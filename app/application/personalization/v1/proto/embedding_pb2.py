@@ -24,7 +24,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0f\x65mbedding.proto\"\x80\x01\n\x14\x45mbeddingUserRequest\x12\r\n\x05\x64type\x18\x01 \x01(\t\x12\x0c\n\x04size\x18\x02 \x01(\x05\x12\r\n\x05\x65mail\x18\x03 \x01(\t\x12\x10\n\x08nickname\x18\x04 \x01(\t\x12\x10\n\x08\x66\x61vorite\x18\x05 \x01(\t\x12\x0b\n\x03lat\x18\x06 \x01(\x02\x12\x0b\n\x03lng\x18\x07 \x01(\x02\"(\n\x15\x45mbeddingUserResponse\x12\x0f\n\x07\x62vector\x18\x01 \x01(\x0c\x32R\n\x10\x45mbeddingService\x12>\n\rEmbeddingUser\x12\x15.EmbeddingUserRequest\x1a\x16.EmbeddingUserResponseb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0f\x65mbedding.proto\"\x80\x01\n\x14\x45mbeddingUserRequest\x12\r\n\x05\x64type\x18\x01 \x01(\t\x12\x0c\n\x04size\x18\x02 \x01(\x05\x12\r\n\x05\x65mail\x18\x03 \x01(\t\x12\x10\n\x08nickname\x18\x04 \x01(\t\x12\x10\n\x08\x66\x61vorite\x18\x05 \x01(\t\x12\x0b\n\x03lat\x18\x06 \x01(\x02\x12\x0b\n\x03lng\x18\x07 \x01(\x02\"(\n\x15\x45mbeddingUserResponse\x12\x0f\n\x07\x62vector\x18\x01 \x01(\x0c\"@\n\x15\x45mbeddingUsersRequest\x12\'\n\x08requests\x18\x01 \x03(\x0b\x32\x15.EmbeddingUserRequest\"*\n\x16\x45mbeddingUsersResponse\x12\x10\n\x08\x62vectors\x18\x01 \x03(\x0c\"X\n\x1a\x45mbeddingUserStreamRequest\x12\x12\n\nrequest_id\x18\x01 \x01(\x04\x12&\n\x07request\x18\x02 \x01(\x0b\x32\x15.EmbeddingUserRequest\"Q\n\x1b\x45mbeddingUserStreamResponse\x12\x12\n\nrequest_id\x18\x01 \x01(\x04\x12\x0f\n\x07\x62vector\x18\x02 \x01(\x0c\x12\r\n\x05\x65rror\x18\x03 \x01(\t2\xeb\x01\n\x10\x45mbeddingService\x12>\n\rEmbeddingUser\x12\x15.EmbeddingUserRequest\x1a\x16.EmbeddingUserResponse\x12\x41\n\x0e\x45mbeddingUsers\x12\x16.EmbeddingUsersRequest\x1a\x17.EmbeddingUsersResponse\x12T\n\x13\x45mbeddingUserStream\x12\x1b.EmbeddingUserStreamRequest\x1a\x1c.EmbeddingUserStreamResponse(\x01\x30\x01\x62\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -35,6 +35,14 @@ if not _descriptor._USE_C_DESCRIPTORS:
   _globals['_EMBEDDINGUSERREQUEST']._serialized_end=148
   _globals['_EMBEDDINGUSERRESPONSE']._serialized_start=150
   _globals['_EMBEDDINGUSERRESPONSE']._serialized_end=190
-  _globals['_EMBEDDINGSERVICE']._serialized_start=192
-  _globals['_EMBEDDINGSERVICE']._serialized_end=274
+  _globals['_EMBEDDINGUSERSREQUEST']._serialized_start=192
+  _globals['_EMBEDDINGUSERSREQUEST']._serialized_end=256
+  _globals['_EMBEDDINGUSERSRESPONSE']._serialized_start=258
+  _globals['_EMBEDDINGUSERSRESPONSE']._serialized_end=300
+  _globals['_EMBEDDINGUSERSTREAMREQUEST']._serialized_start=302
+  _globals['_EMBEDDINGUSERSTREAMREQUEST']._serialized_end=390
+  _globals['_EMBEDDINGUSERSTREAMRESPONSE']._serialized_start=392
+  _globals['_EMBEDDINGUSERSTREAMRESPONSE']._serialized_end=473
+  _globals['_EMBEDDINGSERVICE']._serialized_start=476
+  _globals['_EMBEDDINGSERVICE']._serialized_end=711
 # @@protoc_insertion_point(module_scope)
@@ -1,6 +1,7 @@
+from google.protobuf.internal import containers as _containers
 from google.protobuf import descriptor as _descriptor
 from google.protobuf import message as _message
-from typing import ClassVar as _ClassVar, Optional as _Optional
+from typing import ClassVar as _ClassVar, Iterable as _Iterable, Mapping as _Mapping, Optional as _Optional, Union as _Union
 
 DESCRIPTOR: _descriptor.FileDescriptor
 
@@ -27,3 +28,33 @@ class EmbeddingUserResponse(_message.Message):
     BVECTOR_FIELD_NUMBER: _ClassVar[int]
     bvector: bytes
     def __init__(self, bvector: _Optional[bytes] = ...) -> None: ...
+
+class EmbeddingUsersRequest(_message.Message):
+    __slots__ = ("requests",)
+    REQUESTS_FIELD_NUMBER: _ClassVar[int]
+    requests: _containers.RepeatedCompositeFieldContainer[EmbeddingUserRequest]
+    def __init__(self, requests: _Optional[_Iterable[_Union[EmbeddingUserRequest, _Mapping]]] = ...) -> None: ...
+
+class EmbeddingUsersResponse(_message.Message):
+    __slots__ = ("bvectors",)
+    BVECTORS_FIELD_NUMBER: _ClassVar[int]
+    bvectors: _containers.RepeatedScalarFieldContainer[bytes]
+    def __init__(self, bvectors: _Optional[_Iterable[bytes]] = ...) -> None: ...
+
+class EmbeddingUserStreamRequest(_message.Message):
+    __slots__ = ("request_id", "request")
+    REQUEST_ID_FIELD_NUMBER: _ClassVar[int]
+    REQUEST_FIELD_NUMBER: _ClassVar[int]
+    request_id: int
+    request: EmbeddingUserRequest
+    def __init__(self, request_id: _Optional[int] = ..., request: _Optional[_Union[EmbeddingUserRequest, _Mapping]] = ...) -> None: ...
+
+class EmbeddingUserStreamResponse(_message.Message):
+    __slots__ = ("request_id", "bvector", "error")
+    REQUEST_ID_FIELD_NUMBER: _ClassVar[int]
+    BVECTOR_FIELD_NUMBER: _ClassVar[int]
+    ERROR_FIELD_NUMBER: _ClassVar[int]
+    request_id: int
+    bvector: bytes
+    error: str
+    def __init__(self, request_id: _Optional[int] = ..., bvector: _Optional[bytes] = ..., error: _Optional[str] = ...) -> None: ...
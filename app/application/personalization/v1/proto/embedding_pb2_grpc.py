@@ -44,6 +44,18 @@ class EmbeddingServiceStub(object):
             response_deserializer=embedding__pb2.EmbeddingUserResponse.FromString,
             _registered_method=True,
         )
+        self.EmbeddingUsers = channel.unary_unary(
+            "/EmbeddingService/EmbeddingUsers",
+            request_serializer=embedding__pb2.EmbeddingUsersRequest.SerializeToString,
+            response_deserializer=embedding__pb2.EmbeddingUsersResponse.FromString,
+            _registered_method=True,
+        )
+        self.EmbeddingUserStream = channel.stream_stream(
+            "/EmbeddingService/EmbeddingUserStream",
+            request_serializer=embedding__pb2.EmbeddingUserStreamRequest.SerializeToString,
+            response_deserializer=embedding__pb2.EmbeddingUserStreamResponse.FromString,
+            _registered_method=True,
+        )
 
 
 class EmbeddingServiceServicer(object):
@@ -55,6 +67,18 @@ class EmbeddingServiceServicer(object):
         context.set_details("Method not implemented!")
         raise NotImplementedError("Method not implemented!")
 
+    def EmbeddingUsers(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details("Method not implemented!")
+        raise NotImplementedError("Method not implemented!")
+
+    def EmbeddingUserStream(self, request_iterator, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details("Method not implemented!")
+        raise NotImplementedError("Method not implemented!")
+
 
 def add_EmbeddingServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -63,6 +87,16 @@ def add_EmbeddingServiceServicer_to_server(servicer, server):
             request_deserializer=embedding__pb2.EmbeddingUserRequest.FromString,
             response_serializer=embedding__pb2.EmbeddingUserResponse.SerializeToString,
         ),
+        "EmbeddingUsers": grpc.unary_unary_rpc_method_handler(
+            servicer.EmbeddingUsers,
+            request_deserializer=embedding__pb2.EmbeddingUsersRequest.FromString,
+            response_serializer=embedding__pb2.EmbeddingUsersResponse.SerializeToString,
+        ),
+        "EmbeddingUserStream": grpc.stream_stream_rpc_method_handler(
+            servicer.EmbeddingUserStream,
+            request_deserializer=embedding__pb2.EmbeddingUserStreamRequest.FromString,
+            response_serializer=embedding__pb2.EmbeddingUserStreamResponse.SerializeToString,
+        ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
         "EmbeddingService", rpc_method_handlers
@@ -104,3 +138,63 @@ class EmbeddingService(object):
             metadata,
             _registered_method=True,
         )
+
+    @staticmethod
+    def EmbeddingUsers(
+        request,
+        target,
+        options=(),
+        channel_credentials=None,
+        call_credentials=None,
+        insecure=False,
+        compression=None,
+        wait_for_ready=None,
+        timeout=None,
+        metadata=None,
+    ):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            "/EmbeddingService/EmbeddingUsers",
+            embedding__pb2.EmbeddingUsersRequest.SerializeToString,
+            embedding__pb2.EmbeddingUsersResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True,
+        )
+
+    @staticmethod
+    def EmbeddingUserStream(
+        request_iterator,
+        target,
+        options=(),
+        channel_credentials=None,
+        call_credentials=None,
+        insecure=False,
+        compression=None,
+        wait_for_ready=None,
+        timeout=None,
+        metadata=None,
+    ):
+        return grpc.experimental.stream_stream(
+            request_iterator,
+            target,
+            "/EmbeddingService/EmbeddingUserStream",
+            embedding__pb2.EmbeddingUserStreamRequest.SerializeToString,
+            embedding__pb2.EmbeddingUserStreamResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True,
+        )
@@ -0,0 +1,139 @@
+import asyncio
+import itertools
+import logging
+import random
+from typing import AsyncIterator
+
+import grpc
+
+from app.application.personalization.v1.proto.embedding_pb2 import (
+    EmbeddingUserRequest,
+    EmbeddingUserResponse,
+    EmbeddingUserStreamRequest,
+)
+from app.application.personalization.v1.proto.embedding_pb2_grpc import (
+    EmbeddingServiceStub,
+)
+
+
+class EmbeddingStreamDisconnected(Exception):
+    """The stream broke before the response for a request arrived"""
+
+
+class EmbeddingStream:
+    """Multiplex EmbeddingUser calls onto one long-lived EmbeddingUserStream.
+
+    Requests are tagged with a correlation id and matched to responses as they
+    come back. While the stream is down, calls go through the unary RPC of the
+    wrapped stub and the stream reconnects in the background with exponential
+    backoff.
+    """
+
+    def __init__(
+        self,
+        stub: EmbeddingServiceStub,
+        *,
+        backoff_ms: float = 100,
+        max_backoff_ms: float = 10_000,
+    ):
+        self.stub = stub
+        self.backoff = backoff_ms / 1000
+        self.max_backoff = max_backoff_ms / 1000
+        self.connected = False
+        self._closed = False
+        self._ids = itertools.count(1)
+        self._inflight: dict[int, asyncio.Future] = {}
+        self._queue: asyncio.Queue[EmbeddingUserStreamRequest | None] = asyncio.Queue()
+        self._call = None
+        self._task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def EmbeddingUser(
+        self, request: EmbeddingUserRequest, **kwargs
+    ) -> EmbeddingUserResponse:
+        if not self.connected:
+            return await self.stub.EmbeddingUser(request, **kwargs)
+
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[request_id] = future
+        self._queue.put_nowait(
+            EmbeddingUserStreamRequest(request_id=request_id, request=request)
+        )
+        try:
+            return await future
+        except EmbeddingStreamDisconnected:
+            return await self.stub.EmbeddingUser(request, **kwargs)
+        finally:
+            self._inflight.pop(request_id, None)
+
+    async def _requests(self) -> AsyncIterator[EmbeddingUserStreamRequest]:
+        while True:
+            message = await self._queue.get()
+            if message is None:
+                return
+            # Callers that already fell back to unary are skipped
+            if message.request_id in self._inflight:
+                yield message
+
+    async def _run(self) -> None:
+        backoff = self.backoff
+        while not self._closed:
+            try:
+                self._call = self.stub.EmbeddingUserStream(self._requests())
+                await self._call.wait_for_connection()
+                self.connected = True
+                logging.info("Embedding stream connected")
+
+                async for response in self._call:
+                    backoff = self.backoff
+                    self._resolve(response)
+            except asyncio.CancelledError:
+                raise
+            except grpc.aio.AioRpcError as e:
+                logging.warning(f"Embedding stream error: {e.code()} - {e.details()}")
+            except Exception as e:
+                logging.warning(f"Embedding stream error: {e}")
+            finally:
+                self.connected = False
+                self._disconnect_inflight()
+
+            if self._closed:
+                break
+            await asyncio.sleep(backoff * random.uniform(0.5, 1.5))
+            backoff = min(backoff * 2, self.max_backoff)
+
+    def _resolve(self, response) -> None:
+        future = self._inflight.get(response.request_id)
+        if future is None or future.done():
+            return
+        if response.error:
+            future.set_exception(
+                grpc.aio.AioRpcError(
+                    grpc.StatusCode.INTERNAL,
+                    grpc.aio.Metadata(),
+                    grpc.aio.Metadata(),
+                    details=response.error,
+                )
+            )
+        else:
+            future.set_result(EmbeddingUserResponse(bvector=response.bvector))
+
+    def _disconnect_inflight(self) -> None:
+        for future in self._inflight.values():
+            if not future.done():
+                future.set_exception(EmbeddingStreamDisconnected())
+
+    async def close(self) -> None:
+        self._closed = True
+        self._queue.put_nowait(None)
+        if self._call is not None:
+            self._call.cancel()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
@@ -1,68 +1,264 @@
+from typing import Literal
+
 from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 
+from app.application.personalization.v1.formats import (
+    EXPORT_MEDIA_TYPES,
+    IMPORT_MEDIA_TYPES,
+    JSON,
+    MATRIX_MEDIA_TYPES,
+    OCTET,
+    RAW_BYTE_MEDIA_TYPES,
+    VECTOR_MEDIA_TYPES,
+    accepted_codecs,
+    decode_feature_import,
+    encode_feature,
+    encode_feature_export,
+    encode_feature_matrix,
+    encode_feature_scores,
+    feature_headers,
+    negotiate_vector_format,
+)
 from app.application.personalization.v1.schema.request import (
+    ConvertFeatureByteorderRequest,
     CreateUserFeatureRequest,
+    GetUserFeatureBatchRequest,
+    ScoreCandidatesRequest,
+    TrainFeatureCodebookRequest,
     UpdateUserFeatureRequest,
 )
 from app.application.personalization.v1.schema.response import (
+    FeatureCodebookResponse,
+    FeatureJobResponse,
+    GetEmbeddingStatsResponse,
     GetUserFeatureResponse,
+    ImportUserFeaturesResponse,
+    SimilarUsersResponse,
     UserEmbeddingResponse,
 )
-from app.application.personalization.v1.service import get_personalization_service
-from app.core.dto import OctetStreamResponse
+from app.application.personalization.v1.service import (
+    get_embedding_transport,
+    get_personalization_service,
+)
+from app.core.configs import config
+from app.core.dto import OctetStreamResponse, VectorJSONResponse
 from app.core.fastapi.dependencies import IsAdmin, IsAuthenticated, PermissionDependency
 from app.domain.personalization.usecase.personalization import PersonalizationUseCase
 
 personalization_router = APIRouter(prefix="/api/v1/personalization")
 
+VectorDtype = Literal["float16", "float32", "float64"]
+DTYPE_DESCRIPTION = "Convert the stored vector to this dtype (default: as stored)"
+VectorByteorder = Literal["big", "little"]
+BYTEORDER_DESCRIPTION = (
+    "Byte order of raw vector bytes (default: big). "
+    "Little-endian clients skip the byteswap with little"
+)
+
+
+def feature_job_accepted(job: FeatureJobResponse) -> JSONResponse:
+    return JSONResponse(
+        status_code=202,
+        content=job.model_dump(mode="json"),
+        headers={"Location": f"{personalization_router.prefix}/jobs/{job.job_id}"},
+    )
+
 
 @personalization_router.get(
     "/user",
     response_model=GetUserFeatureResponse,
+    responses={
+        200: {
+            "description": "Vector in the format named by Accept",
+            "content": {
+                media_type: {}
+                for media_type in VECTOR_MEDIA_TYPES
+                if media_type != JSON
+            },
+        },
+        406: {"description": "No acceptable vector format"},
+    },
     dependencies=[Depends(PermissionDependency([IsAuthenticated]))],
 )
 async def get_user_feature(
     request: Request,
+    dtype: VectorDtype | None = Query(default=None, description=DTYPE_DESCRIPTION),
+    byteorder: VectorByteorder = Query(
+        default="big", description=BYTEORDER_DESCRIPTION
+    ),
     usecase: PersonalizationUseCase = Depends(get_personalization_service),
 ) -> GetUserFeatureResponse:
     user_id = request.scope["user"].id
-    response_model = await usecase.get_user_feature(user_id=user_id)
-    return response_model
+    media_type = negotiate_vector_format(request.headers.get("accept"))
+    if media_type != JSON:
+        feature = await usecase.get_user_feature_bytes(
+            user_id=user_id,
+            dtype=dtype,
+            codecs=(
+                accepted_codecs(request.headers.get("accept-encoding"))
+                if media_type == OCTET
+                else ()
+            ),
+            # npy and arrow record the byte order, no need to swap for them
+            byteorder=byteorder if media_type in RAW_BYTE_MEDIA_TYPES else None,
+        )
+        return encode_feature(feature, media_type)
+
+    # response_model only documents the schema, the vector skips validation
+    content = await usecase.get_user_feature_vector(user_id=user_id, dtype=dtype)
+    return VectorJSONResponse(content=content, headers={"Vary": "Accept"})
 
 
 @personalization_router.get(
     "/user/octet",
     response_class=OctetStreamResponse,
+    deprecated=True,
     dependencies=[Depends(PermissionDependency([IsAuthenticated]))],
 )
 async def get_user_feature_binary(
     request: Request,
+    dtype: VectorDtype | None = Query(default=None, description=DTYPE_DESCRIPTION),
+    byteorder: VectorByteorder = Query(
+        default="big", description=BYTEORDER_DESCRIPTION
+    ),
     usecase: PersonalizationUseCase = Depends(get_personalization_service),
 ) -> UserEmbeddingResponse:
     scope = request.scope
     current_user = scope["user"]
     user_id = current_user.id
 
-    bvector = await usecase.get_user_feature_binary(user_id=user_id)
-    return OctetStreamResponse(content=bvector)
+    # Cached bytes are sliced, not copied, on their way to the socket, and
+    # stay compressed for clients that accept the stored codec
+    feature = await usecase.get_user_feature_bytes(
+        user_id=user_id,
+        dtype=dtype,
+        codecs=accepted_codecs(request.headers.get("accept-encoding")),
+        byteorder=byteorder,
+    )
+    return OctetStreamResponse(
+        content=feature.bvector,
+        headers={**feature_headers(feature), "Vary": "Accept-Encoding"},
+    )
+
+
+@personalization_router.post(
+    "/users/batch",
+    response_class=Response,
+    responses={
+        200: {
+            "description": "(n, size) matrix in the order of user_ids, zero rows "
+            "for users without a feature as marked in X-Vector-Present",
+            "content": {media_type: {} for media_type in MATRIX_MEDIA_TYPES},
+        },
+        406: {"description": "No acceptable matrix format"},
+        409: {"description": "The users' features have different sizes"},
+    },
+    dependencies=[Depends(PermissionDependency([IsAdmin]))],
+)
+async def get_user_feature_batch(
+    request: Request,
+    command: GetUserFeatureBatchRequest,
+    usecase: PersonalizationUseCase = Depends(get_personalization_service),
+) -> Response:
+    media_type = negotiate_vector_format(
+        request.headers.get("accept"), MATRIX_MEDIA_TYPES
+    )
+    matrix, present = await usecase.get_user_feature_matrix(
+        user_ids=command.user_ids, dtype=command.dtype, byteorder=command.byteorder
+    )
+    return encode_feature_matrix(matrix, present, media_type)
+
+
+@personalization_router.post(
+    "/user/scores",
+    response_class=Response,
+    responses={
+        200: {
+            "description": "float32 score of every candidate in the order of "
+            "user_ids, NaN for candidates without a feature as marked in "
+            "X-Vector-Present",
+            "content": {media_type: {} for media_type in MATRIX_MEDIA_TYPES},
+        },
+        404: {"description": "The caller has no feature"},
+        406: {"description": "No acceptable score format"},
+        409: {"description": "Candidate features have another size"},
+    },
+    dependencies=[Depends(PermissionDependency([IsAuthenticated]))],
+)
+async def score_candidates(
+    request: Request,
+    command: ScoreCandidatesRequest,
+    usecase: PersonalizationUseCase = Depends(get_personalization_service),
+) -> Response:
+    media_type = negotiate_vector_format(
+        request.headers.get("accept"), MATRIX_MEDIA_TYPES
+    )
+    scores, present = await usecase.score_candidates(
+        user_id=request.scope["user"].id,
+        user_ids=command.user_ids,
+        metric=command.metric,
+        byteorder=command.byteorder,
+    )
+    return encode_feature_scores(scores, present, media_type)
+
+
+@personalization_router.get(
+    "/user/similar",
+    response_model=SimilarUsersResponse,
+    responses={
+        404: {"description": "Search disabled (FEATURE_SEARCH_ENABLED)"},
+        503: {"description": "Search index still loading"},
+    },
+    dependencies=[Depends(PermissionDependency([IsAuthenticated]))],
+)
+async def get_similar_users(
+    request: Request,
+    k: int = Query(default=10, ge=1, le=1000, description="Users to return"),
+    metric: Literal["cosine", "dot"] = Query(
+        default="cosine", description="cosine similarity or dot product"
+    ),
+    nprobe: int | None = Query(
+        default=None, ge=1, description="IVF lists to scan, more is slower"
+    ),
+    ef: int | None = Query(
+        default=None, ge=1, le=4096, description="HNSW beam width, more is slower"
+    ),
+    usecase: PersonalizationUseCase = Depends(get_personalization_service),
+) -> SimilarUsersResponse:
+    user_id = request.scope["user"].id
+    return await usecase.get_similar_users(
+        user_id=user_id, k=k, metric=metric, nprobe=nprobe, ef=ef
+    )
 
 
 @personalization_router.post(
     "/user",
     response_model=UserEmbeddingResponse,
+    responses={202: {"model": FeatureJobResponse}},
     dependencies=[Depends(PermissionDependency([IsAuthenticated]))],
 )
 async def create_user_feature(
     request: Request,
     command: CreateUserFeatureRequest,
+    mode: Literal["sync", "async"] = Query(
+        default=config.FEATURE_COMPUTE_MODE,
+        description="async: queue the job and answer 202 with a job id",
+    ),
     usecase: PersonalizationUseCase = Depends(get_personalization_service),
 ) -> UserEmbeddingResponse:
     scope = request.scope
     current_user = scope["user"]
     user_id = current_user.id
+    if mode == "async":
+        job = await usecase.submit_user_feature_job(
+            user_id=user_id, op="create", command=command
+        )
+        return feature_job_accepted(job)
     response_model = await usecase.create_user_feature(
         user_id=user_id,
         command=command,
+        **get_embedding_transport(request.app.state, command.protocol),
     )
     return response_model
 
@@ -80,13 +276,10 @@ async def create_user_feature_binary(
     scope = request.scope
     current_user = scope["user"]
     user_id = current_user.id
-    stub = None
-    if command.protocol == "grpc":
-        stub = request.app.state.embedding_stub
     bvector = await usecase.create_user_feature(
         user_id=user_id,
         command=command,
-        stub=stub,
+        **get_embedding_transport(request.app.state, command.protocol),
         return_binary=True,
     )
     return OctetStreamResponse(content=bvector)
@@ -95,23 +288,31 @@ async def create_user_feature_binary(
 @personalization_router.patch(
     "/user",
     response_model=UserEmbeddingResponse,
+    responses={202: {"model": FeatureJobResponse}},
     dependencies=[Depends(PermissionDependency([IsAuthenticated]))],
 )
 async def update_user_feature(
     request: Request,
     command: UpdateUserFeatureRequest,
+    mode: Literal["sync", "async"] = Query(
+        default=config.FEATURE_COMPUTE_MODE,
+        description="async: queue the job and answer 202 with a job id",
+    ),
     usecase: PersonalizationUseCase = Depends(get_personalization_service),
 ) -> UserEmbeddingResponse:
     scope = request.scope
     current_user = scope["user"]
     user_id = current_user.id
-    stub = None
-    if command.protocol == "grpc":
-        stub = request.app.state.embedding_stub
+    if mode == "async":
+        job = await usecase.submit_user_feature_job(
+            user_id=user_id, op="update", command=command
+        )
+        return feature_job_accepted(job)
     response_model = await usecase.update_user_feature(
         user_id=user_id,
         command=command,
-        stub=stub,
+        **get_embedding_transport(request.app.state, command.protocol),
+        force=command.force,
     )
     return response_model
 
@@ -129,19 +330,36 @@ async def get_user_feature_binary(
     scope = request.scope
     current_user = scope["user"]
     user_id = current_user.id
-    stub = None
-    if command.protocol == "grpc":
-        stub = request.app.state.embedding_stub
-
     bvector = await usecase.update_user_feature(
         user_id=user_id,
         command=command,
-        stub=stub,
+        **get_embedding_transport(request.app.state, command.protocol),
         return_binary=True,
+        force=command.force,
     )
     return OctetStreamResponse(content=bvector)
 
 
+@personalization_router.get(
+    "/jobs/{job_id}",
+    response_model=FeatureJobResponse,
+    dependencies=[Depends(PermissionDependency([IsAuthenticated]))],
+)
+async def get_user_feature_job(
+    request: Request,
+    job_id: str,
+    wait: float = Query(
+        default=0,
+        ge=0,
+        le=config.FEATURE_JOB_MAX_WAIT_SECONDS,
+        description="Long-poll: seconds to wait for the job to finish",
+    ),
+    usecase: PersonalizationUseCase = Depends(get_personalization_service),
+) -> FeatureJobResponse:
+    user_id = request.scope["user"].id
+    return await usecase.get_user_feature_job(user_id=user_id, job_id=job_id, wait=wait)
+
+
 @personalization_router.delete(
     "/user/{user_id}",
     response_model=UserEmbeddingResponse,
@@ -153,3 +371,131 @@ async def delete_user_feature(
 ) -> UserEmbeddingResponse:
     response_model = await usecase.delete_user_feature(user_id=user_id)
     return response_model
+
+
+@personalization_router.get(
+    "/embedding/stats",
+    response_model=GetEmbeddingStatsResponse,
+    dependencies=[Depends(PermissionDependency([IsAdmin]))],
+)
+async def get_embedding_stats(
+    usecase: PersonalizationUseCase = Depends(get_personalization_service),
+) -> GetEmbeddingStatsResponse:
+    return await usecase.get_embedding_stats()
+
+
+@personalization_router.get(
+    "/embedding/export",
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "description": "Every stored feature of `size` in id order: consecutive "
+            ".npy chunks of (id, user_id, user_vector) records, or an Arrow stream "
+            "of record batches with those columns. Resume an interrupted export "
+            "with the last id received as `cursor`",
+            "content": {media_type: {} for media_type in EXPORT_MEDIA_TYPES},
+        },
+        406: {"description": "No acceptable export format"},
+    },
+    dependencies=[Depends(PermissionDependency([IsAdmin]))],
+)
+async def export_user_features(
+    request: Request,
+    size: int = Query(..., ge=1, description="Vector size to export"),
+    dtype: VectorDtype = Query(default="float32", description="Exported dtype"),
+    cursor: int = Query(
+        default=0, ge=0, description="Export rows after this id (resume token)"
+    ),
+    chunk_size: int = Query(
+        default=config.FEATURE_EXPORT_CHUNK_SIZE,
+        ge=1,
+        le=50000,
+        description="Rows per .npy chunk or record batch",
+    ),
+    usecase: PersonalizationUseCase = Depends(get_personalization_service),
+) -> StreamingResponse:
+    media_type = negotiate_vector_format(
+        request.headers.get("accept"), EXPORT_MEDIA_TYPES
+    )
+    chunks = usecase.export_user_features(
+        size=size, dtype=dtype, cursor=cursor, chunk_size=chunk_size
+    )
+    return StreamingResponse(
+        encode_feature_export(chunks, media_type, size=size, dtype=dtype),
+        media_type=media_type,
+        headers={
+            "X-Vector-Dtype": dtype,
+            "X-Vector-Size": str(size),
+            "X-Vector-Byteorder": "little",
+        },
+    )
+
+
+@personalization_router.post(
+    "/embedding/import",
+    response_model=ImportUserFeaturesResponse,
+    openapi_extra={
+        "requestBody": {
+            "description": "Octet: records of a signed 64-bit user id followed by "
+            "the vector, both in `byteorder`. Arrow stream: user_id and user_vector "
+            "(fixed size list of floats) columns",
+            "content": {media_type: {} for media_type in IMPORT_MEDIA_TYPES},
+            "required": True,
+        }
+    },
+    dependencies=[Depends(PermissionDependency([IsAdmin]))],
+)
+async def import_user_features(
+    request: Request,
+    size: int = Query(..., ge=1, description="Vector size of the upload"),
+    dtype: VectorDtype = Query(
+        default="float16", description="dtype to store (and of octet vectors)"
+    ),
+    byteorder: VectorByteorder = Query(
+        default="big", description="Byte order of octet records"
+    ),
+    chunk_size: int = Query(
+        default=config.FEATURE_IMPORT_CHUNK_SIZE,
+        ge=1,
+        le=10000,
+        description="Rows per INSERT ... ON DUPLICATE KEY UPDATE",
+    ),
+    usecase: PersonalizationUseCase = Depends(get_personalization_service),
+) -> ImportUserFeaturesResponse:
+    chunks = decode_feature_import(
+        request.stream(),
+        request.headers.get("content-type"),
+        size=size,
+        dtype=dtype,
+        byteorder=byteorder,
+        chunk_size=chunk_size,
+    )
+    return await usecase.import_user_features(chunks=chunks, dtype=dtype)
+
+
+@personalization_router.post(
+    "/embedding/codebook",
+    response_model=FeatureCodebookResponse,
+    dependencies=[Depends(PermissionDependency([IsAdmin]))],
+)
+async def train_feature_codebook(
+    command: TrainFeatureCodebookRequest,
+    usecase: PersonalizationUseCase = Depends(get_personalization_service),
+) -> FeatureCodebookResponse:
+    return await usecase.train_feature_codebook(command=command)
+
+
+@personalization_router.post(
+    "/embedding/byteorder",
+    response_model=FeatureJobResponse,
+    status_code=202,
+    dependencies=[Depends(PermissionDependency([IsAdmin]))],
+)
+async def convert_feature_byteorder(
+    request: Request,
+    command: ConvertFeatureByteorderRequest,
+    usecase: PersonalizationUseCase = Depends(get_personalization_service),
+) -> FeatureJobResponse:
+    user_id = request.scope["user"].id
+    job = await usecase.submit_feature_byteorder_job(user_id=user_id, command=command)
+    return feature_job_accepted(job)
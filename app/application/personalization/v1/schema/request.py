@@ -1,4 +1,4 @@
-from typing import Literal, Optional
+from typing import List, Literal, Optional
 
 from pydantic import BaseModel, ConfigDict, Field
 
@@ -18,8 +18,9 @@ class UserEmbeddingRequest(BaseModel):
 
 
 class CreateUserFeatureRequest(BaseModel):
-    protocol: Literal["http", "http-octet", "grpc"] = Field(
-        default="http", description="http, http-octet or grpc"
+    protocol: Literal["http", "http-octet", "grpc", "auto"] = Field(
+        default="http",
+        description="http, http-octet, grpc or auto (fastest healthy protocol)",
     )
     size: int = Field(default=2048, description="Vector size : (1, size)")
     dtype: Literal["float16", "float32", "float64"] = Field(
@@ -27,5 +28,55 @@ class CreateUserFeatureRequest(BaseModel):
     )
 
 
+class GetUserFeatureBatchRequest(BaseModel):
+    user_ids: List[int] = Field(
+        ..., min_length=1, max_length=1000, description="Users, one matrix row each"
+    )
+    dtype: Optional[Literal["float16", "float32", "float64"]] = Field(
+        default=None, description="Matrix dtype (default: widest stored dtype)"
+    )
+    byteorder: Literal["big", "little"] = Field(
+        default="big", description="Byte order of the matrix"
+    )
+
+
+class ScoreCandidatesRequest(BaseModel):
+    user_ids: List[int] = Field(
+        ..., min_length=1, max_length=1000, description="Candidates, one score each"
+    )
+    metric: Literal["cosine", "dot"] = Field(
+        default="dot", description="dot product or cosine similarity"
+    )
+    byteorder: Literal["big", "little"] = Field(
+        default="big", description="Byte order of the scores"
+    )
+
+
+class TrainFeatureCodebookRequest(BaseModel):
+    size: int = Field(default=2048, description="Vector size the codebook is for")
+    subvectors: int = Field(
+        default=64, ge=1, description="Subvectors per vector (one code byte each)"
+    )
+    centroids: int = Field(
+        default=256, ge=1, le=256, description="Centroids per subvector"
+    )
+    sample: int = Field(
+        default=20000, ge=1, description="Latest stored vectors to train on"
+    )
+    iterations: int = Field(default=20, ge=1, description="k-means iterations")
+
+
+class ConvertFeatureByteorderRequest(BaseModel):
+    byteorder: Literal["big", "little"] = Field(
+        default="little", description="Byte order to rewrite stored vectors in"
+    )
+    batch_size: int = Field(
+        default=500, ge=1, le=10000, description="Rows converted per job"
+    )
+
+
 class UpdateUserFeatureRequest(CreateUserFeatureRequest):
-    pass
+    force: bool = Field(
+        default=False,
+        description="Recompute even if the user's inputs have not changed",
+    )
@@ -1,4 +1,5 @@
-from typing import List, Literal, Optional
+from datetime import datetime
+from typing import Dict, List, Literal, Optional, Union
 
 from pydantic import BaseModel, Field
 
@@ -31,3 +32,93 @@ class DeleteUserFeatureResponse(BaseModel):
     dtype: Literal["float16", "float32", "float64"] = Field(
         default="float16", description="Vector Data Type (float16, float32, float64)"
     )
+
+
+class FeatureCodebookResponse(BaseModel):
+    id: int = Field(..., description="Codebook ID")
+    size: int = Field(..., description="Vector size")
+    subvectors: int = Field(..., description="Subvectors per vector")
+    centroids: int = Field(..., description="Centroids per subvector")
+    trained_on: int = Field(..., description="Vectors the codebook was trained on")
+    relative_error: float = Field(
+        ..., description="Squared reconstruction error over squared norm, on the sample"
+    )
+
+
+class ImportUserFeaturesResponse(BaseModel):
+    imported: int = Field(..., description="Features inserted or replaced")
+    skipped: int = Field(
+        ..., description="Rows of unknown users, bad ids or non-finite values"
+    )
+    skipped_user_ids: List[int] = Field(
+        default_factory=list, description="The first skipped user ids"
+    )
+
+
+class SimilarUser(BaseModel):
+    user_id: int = Field(..., description="User ID")
+    score: float = Field(..., description="Cosine similarity or dot product")
+
+
+class SimilarUsersResponse(BaseModel):
+    metric: Literal["cosine", "dot"] = Field(..., description="Similarity metric")
+    users: List[SimilarUser] = Field(..., description="Most similar users first")
+
+
+class EmbeddingProtocolStats(BaseModel):
+    protocol: str = Field(..., description="Embedding protocol")
+    dtype: str = Field(..., description="Vector Data Type")
+    size_bucket: int = Field(..., description="Vector size rounded up to 2^n")
+    calls: int = Field(..., description="Successful calls")
+    latency_ms: float = Field(..., description="EWMA latency (ms)")
+    throughput_mbps: float = Field(..., description="EWMA throughput (Mbit/s)")
+
+
+class EmbeddingBreakerStats(BaseModel):
+    state: Literal["closed", "open", "half_open"] = Field(
+        ..., description="Circuit breaker state"
+    )
+    calls: int = Field(..., description="Calls in the rolling window")
+    error_rate: float = Field(..., description="Error rate in the rolling window")
+    p50: Optional[float] = Field(default=None, description="p50 latency (s)")
+    p95: Optional[float] = Field(default=None, description="p95 latency (s)")
+
+
+class GetEmbeddingStatsResponse(BaseModel):
+    protocols: List[EmbeddingProtocolStats] = Field(
+        ..., description="Live stats used by the auto protocol"
+    )
+    breakers: Dict[str, EmbeddingBreakerStats] = Field(
+        ..., description="Circuit breaker per protocol"
+    )
+
+
+class FeatureJobResult(BaseModel):
+    size: int = Field(..., description="Vector size : (1, size)")
+    dtype: Literal["float16", "float32", "float64"] = Field(
+        ..., description="Vector Data Type (float16, float32, float64)"
+    )
+
+
+class ByteorderJobResult(BaseModel):
+    converted: int = Field(..., description="Rows converted by this job")
+    next_job_id: Optional[str] = Field(
+        default=None, description="Job converting the next batch, if rows were left"
+    )
+
+
+class FeatureJobResponse(BaseModel):
+    job_id: str = Field(..., description="Feature Job ID")
+    op: Literal["create", "update", "convert_byteorder"] = Field(
+        ..., description="Feature operation"
+    )
+    status: Literal["pending", "running", "succeeded", "failed"] = Field(
+        ..., description="Job status"
+    )
+    result: Optional[Union[FeatureJobResult, ByteorderJobResult]] = Field(
+        default=None, description="Stored feature (or conversion), once succeeded"
+    )
+    error_code: Optional[str] = Field(default=None, description="Error code, if failed")
+    message: Optional[str] = Field(default=None, description="Error message, if failed")
+    created_at: datetime = Field(..., description="Submitted at")
+    updated_at: datetime = Field(..., description="Last status change")
@@ -0,0 +1,418 @@
+"""In-process similarity search over the stored user features.
+
+Every worker keeps an index of the features of one size: an exact
+VectorMatrix ("flat"), an approximate IVF-flat or HNSW index, or ("mmap") a
+snapshot file memory-mapped by every worker of the host plus an in-memory
+delta, whose scans can be split across a pool of `shards` processes. It is
+loaded in full at startup and then refreshed from the rows written since the
+last look. A periodic resync also drops rows deleted by other workers and
+picks up writes that committed late: a full reload for "flat" and "mmap", an
+incremental pass for the approximate indexes, whose build is slow.
+
+With a `path`, the index is saved there after every load and resync and
+restored from it at startup, so a restart only catches up on what changed.
+"""
+
+import asyncio
+import fcntl
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Iterable
+
+import numpy as np
+
+from app.application.personalization.v1.exception import (
+    FeatureIndexNotReadyException,
+    FeatureSearchDisabledException,
+)
+from app.core.configs import config
+from app.core.helpers.ann import HNSWIndex, IVFFlatIndex
+from app.core.helpers.vector_search import VectorMatrix
+from app.core.helpers.vector_snapshot import (
+    ShardPool,
+    SnapshotIndex,
+    SnapshotWriter,
+    VectorSnapshot,
+)
+from app.domain.personalization.repository.feature import (
+    UserFeatureRepository,
+    stack_feature_bytes,
+)
+
+INDEXES = {"flat": VectorMatrix, "ivf": IVFFlatIndex, "hnsw": HNSWIndex}
+# "mmap" has no class here: it opens the snapshot file instead of building
+# Share of tombstones in an HNSW graph that triggers a rebuild on resync
+COMPACT_RATIO = 0.25
+
+SearchIndex = VectorMatrix | IVFFlatIndex | HNSWIndex | SnapshotIndex
+
+
+class FeatureSearchIndex:
+    def __init__(
+        self,
+        *,
+        size: int,
+        enabled: bool = True,
+        kind: str = "flat",
+        params: dict | None = None,
+        path: str | None = None,
+        shards: int = 1,
+        refresh_seconds: float = 10.0,
+        reload_seconds: float = 900.0,
+        chunk_size: int = 2000,
+    ):
+        self.size = size
+        # Disabled indexes are never loaded, searching them is a 404
+        self.enabled = enabled
+        self.kind = kind
+        # Keyword arguments of the index class, e.g. nprobe or ef
+        self.params = params or {}
+        if kind == "mmap" and path is None:
+            path = os.path.join(tempfile.gettempdir(), f"user_features_{size}.snapshot")
+        self.path = path
+        if shards > 1 and kind != "mmap":
+            # Only a snapshot file can be opened by other processes
+            raise ValueError(
+                f"{shards} search shards need the mmap index, not {kind!r} "
+                "(FEATURE_SEARCH_SHARDS, FEATURE_SEARCH_INDEX)"
+            )
+        # Processes a snapshot search fans out to, 1 scans in this one
+        self.shards = shards
+        self._pool: ShardPool | None = None
+        self.refresh_seconds = refresh_seconds
+        self.reload_seconds = reload_seconds
+        self.chunk_size = chunk_size
+        self.index: SearchIndex | None = None
+        self._watermark: datetime | None = None
+        # Where the next resync re-reads from, late commits included
+        self._synced_watermark: datetime | None = None
+        self._loaded_at = 0.0
+        self._loading = False
+        # Deleted while a load runs, the new index may have read them already
+        self._removed: set[int] = set()
+        self._task: asyncio.Task | None = None
+
+    async def load(self, repository: UserFeatureRepository) -> None:
+        """Build a new index from every stored feature, then swap it in"""
+        self._loading, self._removed = True, set()
+        try:
+            if self.kind == "mmap":
+                watermark, index = await self._open_snapshot(repository)
+            else:
+                watermark, index = await self._read_index(repository)
+            index.remove(self._removed)
+        finally:
+            self._loading = False
+        self.index = index
+        self._watermark = self._synced_watermark = watermark
+        self._loaded_at = time.monotonic()
+        logging.info(f"Feature search index loaded {len(index)} vectors")
+        await self.save()
+
+    async def _read_index(
+        self, repository: UserFeatureRepository
+    ) -> tuple[datetime | None, SearchIndex]:
+        watermark = await repository.get_latest_update()
+        matrix = VectorMatrix(self.size)
+        async for _, user_ids, features in repository.stream_features(
+            size=self.size, chunk_size=self.chunk_size
+        ):
+            vectors, _ = stack_feature_bytes(
+                features, dtype="float32", byteorder=sys.byteorder
+            )
+            await asyncio.to_thread(matrix.upsert, np.array(user_ids), vectors)
+        return watermark, await asyncio.to_thread(self._build, matrix)
+
+    async def _open_snapshot(
+        self, repository: UserFeatureRepository
+    ) -> tuple[datetime | None, SearchIndex]:
+        """Open the snapshot shared by the workers of this host, after
+        rebuilding it if it is older than `reload_seconds`. One worker
+        rebuilds while the others wait on the lock, then open its file."""
+        with open(f"{self.path}.lock", "a") as lock:
+            await asyncio.to_thread(fcntl.flock, lock, fcntl.LOCK_EX)
+            try:
+                if not self._is_fresh_snapshot():
+                    await self._write_snapshot(repository)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        snapshot = await asyncio.to_thread(VectorSnapshot, self.path)
+        watermark = snapshot.meta.get("watermark")
+        if self.shards > 1 and self._pool is None:
+            self._pool = ShardPool(self.shards)
+        return (
+            datetime.fromisoformat(watermark) if watermark else None,
+            SnapshotIndex(snapshot, pool=self._pool),
+        )
+
+    def _is_fresh_snapshot(self) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        if time.time() - os.path.getmtime(self.path) >= self.reload_seconds:
+            return False
+        try:
+            return VectorSnapshot(self.path).size == self.size
+        except ValueError:
+            return False
+
+    async def _write_snapshot(self, repository: UserFeatureRepository) -> None:
+        watermark = await repository.get_latest_update()
+        writer = SnapshotWriter(self.path, self.size)
+        try:
+            async for _, user_ids, features in repository.stream_features(
+                size=self.size, chunk_size=self.chunk_size
+            ):
+                vectors, _ = stack_feature_bytes(
+                    features, dtype="float32", byteorder=sys.byteorder
+                )
+                await asyncio.to_thread(writer.append, np.array(user_ids), vectors)
+        except BaseException:
+            writer.abort()
+            raise
+        await asyncio.to_thread(
+            writer.close, {"watermark": watermark.isoformat() if watermark else ""}
+        )
+        logging.info(f"Feature search snapshot written to {self.path}")
+
+    async def refresh(self, repository: UserFeatureRepository) -> int:
+        """Apply the rows written since the last load or refresh"""
+        watermark = await repository.get_latest_update()
+        changed = await self._apply(repository, updated_since=self._watermark)
+        self._watermark = watermark or self._watermark
+        await self._rebuild()
+        return changed
+
+    async def resync(self, repository: UserFeatureRepository) -> None:
+        """Drop the rows no longer stored and re-apply every row written
+        since the last resync, without rebuilding the index"""
+        watermark = await repository.get_latest_update()
+        stored = set(await repository.get_feature_user_ids(size=self.size))
+        gone = [id for id in self.index.ids().tolist() if id not in stored]
+        await asyncio.to_thread(self.index.remove, gone)
+        await self._apply(repository, updated_since=self._synced_watermark)
+        self._watermark = self._synced_watermark = watermark or self._watermark
+        await self._rebuild()
+        self._loaded_at = time.monotonic()
+        await self.save()
+
+    async def _rebuild(self) -> None:
+        """Swap in a rebuilt copy of an HNSW graph full of tombstones or of
+        an IVF index that outgrew its centroids. Built here, in the
+        background task, so writes and searches never wait for it."""
+        tombstones = getattr(self.index, "tombstones", 0)
+        if tombstones > COMPACT_RATIO * max(len(self.index), 1):
+            rebuild = self.index.compact
+        elif getattr(self.index, "needs_training", False):
+            rebuild = self.index.retrained
+        else:
+            return
+        self._loading, self._removed = True, set()
+        try:
+            index = await asyncio.to_thread(rebuild)
+            index.remove(self._removed)
+        finally:
+            self._loading = False
+        # Upserts made during the rebuild come back with the next refresh
+        self.index = index
+
+    async def _apply(
+        self, repository: UserFeatureRepository, *, updated_since: datetime | None
+    ) -> int:
+        changed = 0
+        async for _, user_ids, features in repository.stream_features(
+            size=None, chunk_size=self.chunk_size, updated_since=updated_since
+        ):
+            user_ids = np.array(user_ids, dtype=np.int64)
+            indexed = np.array([feature.size == self.size for feature in features])
+            # Rewritten with another size: no longer searchable here
+            await asyncio.to_thread(self.index.remove, user_ids[~indexed])
+            if indexed.any():
+                vectors, _ = stack_feature_bytes(
+                    [feature for feature in features if feature.size == self.size],
+                    dtype="float32",
+                    byteorder=sys.byteorder,
+                )
+                await asyncio.to_thread(self.index.upsert, user_ids[indexed], vectors)
+            changed += len(user_ids)
+        return changed
+
+    async def save(self) -> None:
+        # A snapshot is saved by construction
+        if self.path is None or self.index is None or self.kind == "mmap":
+            return
+        if getattr(self.index, "under_trained", False):
+            # Restoring it would skip the load that trains on every vector
+            logging.info("Feature search index not saved, too few vectors to train")
+            return
+        await asyncio.to_thread(
+            self._save, self.index, self._watermark, self._synced_watermark
+        )
+
+    def _save(
+        self,
+        index: SearchIndex,
+        watermark: datetime | None,
+        synced_watermark: datetime | None,
+    ) -> None:
+        # Written aside then renamed, a crash never leaves half a file and
+        # workers sharing the path replace it whole
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as file:
+            np.savez(
+                file,
+                kind=np.array(self.kind),
+                watermark=np.array(watermark.isoformat() if watermark else ""),
+                synced_watermark=np.array(
+                    synced_watermark.isoformat() if synced_watermark else ""
+                ),
+                **index.state(),
+            )
+        os.replace(temporary, self.path)
+
+    async def restore(self) -> bool:
+        """Load the index saved at `path`, False if there is none to use"""
+        if self.kind == "mmap" or self.path is None or not os.path.exists(self.path):
+            return False
+        try:
+            kind, watermarks, index = await asyncio.to_thread(self._restore)
+        except Exception:
+            logging.exception(f"Feature search index at {self.path} is unreadable")
+            return False
+        if kind != self.kind or index.size != self.size:
+            logging.info(f"Feature search index at {self.path} is stale, rebuilding")
+            return False
+
+        self._apply_params(index)
+        self.index = index
+        self._watermark, self._synced_watermark = (
+            datetime.fromisoformat(watermark) if watermark else None
+            for watermark in watermarks
+        )
+        logging.info(f"Feature search index restored {len(index)} vectors")
+        return True
+
+    def _restore(self) -> tuple[str, tuple[str, str], SearchIndex]:
+        with np.load(self.path) as data:
+            state = {name: data[name] for name in data.files}
+        kind = str(state.pop("kind"))
+        watermarks = (str(state.pop("watermark")), str(state.pop("synced_watermark")))
+        return kind, watermarks, INDEXES[kind].from_state(state)
+
+    async def search(
+        self,
+        query: np.ndarray,
+        k: int,
+        *,
+        metric: str = "cosine",
+        exclude: Iterable[int] = (),
+        nprobe: int | None = None,
+        ef: int | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """`nprobe` and `ef` override the configured knob of an index that
+        takes it and are ignored by the others"""
+        if not self.enabled:
+            raise FeatureSearchDisabledException
+        if self.index is None:
+            raise FeatureIndexNotReadyException
+        knobs = {
+            name: value
+            for name, value in (("nprobe", nprobe), ("ef", ef))
+            if value is not None and name in self.index.search_params
+        }
+        return await asyncio.to_thread(
+            self.index.search, query, k, metric=metric, exclude=exclude, **knobs
+        )
+
+    async def upsert(self, user_id: int, vector: np.ndarray) -> None:
+        """Index a vector just written, so this worker finds it right away"""
+        if self.index is None:
+            return
+        if len(vector) != self.size:
+            await self.remove([user_id])
+            return
+        await asyncio.to_thread(self.index.upsert, np.array([user_id]), vector)
+
+    async def remove(self, user_ids: list[int]) -> None:
+        if self._loading:
+            self._removed.update(user_ids)
+        if self.index is not None:
+            await asyncio.to_thread(self.index.remove, user_ids)
+
+    def start(self, repository: UserFeatureRepository) -> None:
+        self._task = asyncio.ensure_future(self._run(repository))
+
+    async def close(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        await self.save()
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+    def _build(self, matrix: VectorMatrix) -> SearchIndex:
+        if self.kind == "flat":
+            return matrix
+        index = INDEXES[self.kind](self.size, **self.params)
+        state = matrix.state()
+        index.upsert(state["ids"], state["vectors"])
+        return index
+
+    def _apply_params(self, index: SearchIndex) -> None:
+        # A restored index searches with the configured knobs, not the saved
+        for name in index.search_params:
+            if name in self.params:
+                setattr(index, name, self.params[name])
+
+    async def _run(self, repository: UserFeatureRepository) -> None:
+        while True:
+            try:
+                if self.index is None:
+                    if await self.restore():
+                        await self.resync(repository)
+                    else:
+                        await self.load(repository)
+                elif time.monotonic() - self._loaded_at < self.reload_seconds:
+                    await self.refresh(repository)
+                elif self.kind in ("flat", "mmap"):
+                    await self.load(repository)
+                else:
+                    await self.resync(repository)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception("Feature search index refresh failed")
+            await asyncio.sleep(self.refresh_seconds)
+
+
+def get_index_params(kind: str) -> dict:
+    if kind == "ivf":
+        return {
+            "lists": config.FEATURE_SEARCH_IVF_LISTS,
+            "nprobe": config.FEATURE_SEARCH_IVF_NPROBE,
+        }
+    if kind == "hnsw":
+        return {
+            "m": config.FEATURE_SEARCH_HNSW_M,
+            "ef_construction": config.FEATURE_SEARCH_HNSW_EF_CONSTRUCTION,
+            "ef": config.FEATURE_SEARCH_HNSW_EF,
+        }
+    return {}
+
+
+feature_index = FeatureSearchIndex(
+    size=config.FEATURE_SEARCH_SIZE,
+    enabled=config.FEATURE_SEARCH_ENABLED,
+    kind=config.FEATURE_SEARCH_INDEX,
+    params=get_index_params(config.FEATURE_SEARCH_INDEX),
+    path=config.FEATURE_SEARCH_INDEX_PATH,
+    shards=config.FEATURE_SEARCH_SHARDS,
+    refresh_seconds=config.FEATURE_SEARCH_REFRESH_SECONDS,
+    reload_seconds=config.FEATURE_SEARCH_RELOAD_SECONDS,
+)
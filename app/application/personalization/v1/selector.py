@@ -0,0 +1,100 @@
+import random
+from dataclasses import dataclass
+
+from app.application.personalization.v1.breaker import (
+    EMBEDDING_PROTOCOLS,
+    embedding_breakers,
+)
+from app.core.configs import config
+from app.core.helpers.circuit_breaker import CircuitState
+
+
+@dataclass
+class ProtocolStat:
+    calls: int = 0
+    latency: float = 0.0  # EWMA seconds
+    throughput: float = 0.0  # EWMA bytes per second
+
+
+class ProtocolSelector:
+    """Route "auto" embedding calls to the fastest healthy protocol.
+
+    Latency and throughput are tracked as EWMAs per protocol, dtype and size
+    bucket (next power of two). Protocols whose breaker is open are skipped,
+    protocols with fewer than `min_samples` calls in a bucket are tried first,
+    and `explore_rate` of the remaining calls go to a random protocol so stale
+    numbers get refreshed.
+    """
+
+    def __init__(
+        self,
+        *,
+        protocols: tuple[str, ...] = EMBEDDING_PROTOCOLS,
+        alpha: float = 0.2,
+        min_samples: int = 5,
+        explore_rate: float = 0.05,
+    ):
+        self.protocols = protocols
+        self.alpha = alpha
+        self.min_samples = min_samples
+        self.explore_rate = explore_rate
+        self._stats: dict[tuple[str, str, int], ProtocolStat] = {}
+
+    @staticmethod
+    def size_bucket(size: int) -> int:
+        return 1 << max(size - 1, 0).bit_length()
+
+    def choose(
+        self, *, size: int, dtype: str, available: tuple[str, ...] | None = None
+    ) -> str:
+        bucket = self.size_bucket(size)
+        candidates = [
+            protocol
+            for protocol in (available or self.protocols)
+            if embedding_breakers[protocol].state != CircuitState.OPEN
+        ] or list(available or self.protocols)
+
+        stats = {p: self._stats.get((p, dtype, bucket)) for p in candidates}
+        cold = [
+            p for p, stat in stats.items() if not stat or stat.calls < self.min_samples
+        ]
+        if cold:
+            return min(cold, key=lambda p: stats[p].calls if stats[p] else 0)
+
+        if random.random() < self.explore_rate:
+            return random.choice(candidates)
+
+        return min(candidates, key=lambda p: stats[p].latency)
+
+    def record(
+        self, *, protocol: str, size: int, dtype: str, latency: float, nbytes: int
+    ) -> None:
+        key = (protocol, dtype, self.size_bucket(size))
+        stat = self._stats.setdefault(key, ProtocolStat())
+        throughput = nbytes / latency if latency > 0 else 0.0
+        if stat.calls == 0:
+            stat.latency, stat.throughput = latency, throughput
+        else:
+            stat.latency += self.alpha * (latency - stat.latency)
+            stat.throughput += self.alpha * (throughput - stat.throughput)
+        stat.calls += 1
+
+    def stats(self) -> list[dict]:
+        return [
+            {
+                "protocol": protocol,
+                "dtype": dtype,
+                "size_bucket": bucket,
+                "calls": stat.calls,
+                "latency_ms": stat.latency * 1000,
+                "throughput_mbps": stat.throughput * 8 / 1_000_000,
+            }
+            for (protocol, dtype, bucket), stat in sorted(self._stats.items())
+        ]
+
+
+protocol_selector = ProtocolSelector(
+    alpha=config.EMBEDDING_AUTO_EWMA_ALPHA,
+    min_samples=config.EMBEDDING_AUTO_MIN_SAMPLES,
+    explore_rate=config.EMBEDDING_AUTO_EXPLORE_RATE,
+)
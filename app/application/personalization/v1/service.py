@@ -1,17 +1,33 @@
+import asyncio
+import hashlib
+import json
 import logging
-from typing import Union
+import sys
+import time
+from datetime import datetime
+from functools import partial
+from typing import AsyncIterator, Awaitable, Callable, Literal, Union
 
 import grpc
 import httpx
 import numpy as np
 
+from app.application.personalization.v1.breaker import (
+    embedding_breakers,
+    get_hedge_delay,
+)
 from app.application.personalization.v1.enums import BigEndian
 from app.application.personalization.v1.exception import (
     EmbeddingException,
     EmbeddingGrpcException,
+    FeatureCodebookTrainException,
+    FeatureJobNotFoundException,
+    FeatureSearchDisabledException,
+    FeatureSizeMismatchException,
     UserFeatureAlreadyExistException,
     UserFeatureNotFoundException,
 )
+from app.application.personalization.v1.http.client import borrow_embedding_http_client
 from app.application.personalization.v1.proto.embedding_pb2 import (
     EmbeddingUserRequest,
     EmbeddingUserResponse,
@@ -20,32 +36,77 @@ from app.application.personalization.v1.proto.embedding_pb2_grpc import (
     EmbeddingServiceStub,
 )
 from app.application.personalization.v1.schema.request import (
+    ConvertFeatureByteorderRequest,
     CreateUserFeatureRequest,
+    TrainFeatureCodebookRequest,
+    UpdateUserFeatureRequest,
     UserEmbeddingRequest,
 )
 from app.application.personalization.v1.schema.response import (
     DeleteUserFeatureResponse,
+    FeatureCodebookResponse,
+    FeatureJobResponse,
+    GetEmbeddingStatsResponse,
     GetUserEmbeddingResponse,
     GetUserFeatureResponse,
+    ImportUserFeaturesResponse,
+    SimilarUser,
+    SimilarUsersResponse,
     UserEmbeddingResponse,
 )
+from app.application.personalization.v1.search import FeatureSearchIndex, feature_index
+from app.application.personalization.v1.selector import protocol_selector
 from app.application.user.v1.exception import UserNotFoundException
 from app.core.configs import config
+from app.core.db.standalone_session import StandaloneSession
 from app.core.db.transactional import Transactional
+from app.core.helpers.hedge import hedged
+from app.core.helpers.job_queue import Job, RedisJobQueue
+from app.core.helpers.quantization import decode_pq, encode_pq, train_pq
+from app.core.helpers.redis import redis_client
+from app.core.helpers.single_flight import SingleFlight
+from app.core.helpers.vector_search import inverse_norms_of, score_rows
+from app.domain.personalization.entity.codebook import FeatureCodebook
 from app.domain.personalization.entity.feature import UserFeature
-from app.domain.personalization.repository.feature import UserFeatureRepository
+from app.domain.personalization.repository.codebook import FeatureCodebookRepository
+from app.domain.personalization.repository.feature import (
+    UserFeatureBytes,
+    UserFeatureRepository,
+    feature_numpy_dtype,
+    stack_feature_bytes,
+)
 from app.domain.personalization.usecase.personalization import PersonalizationUseCase
 from app.domain.user.repository.user import UserRepository
 
+feature_flights: SingleFlight[GetUserEmbeddingResponse] = SingleFlight(
+    redis=redis_client if config.FEATURE_SINGLE_FLIGHT_REDIS else None,
+    prefix="feature_single_flight",
+    lock_timeout=config.FEATURE_SINGLE_FLIGHT_LOCK_TIMEOUT,
+    result_ttl=config.FEATURE_SINGLE_FLIGHT_RESULT_TTL,
+)
+
+feature_jobs = RedisJobQueue(
+    redis_client,
+    name="feature_jobs",
+    ttl=config.FEATURE_JOB_TTL_SECONDS,
+    visibility_timeout=config.FEATURE_JOB_VISIBILITY_TIMEOUT,
+)
+
 
 class PersonalizationService(PersonalizationUseCase):
     def __init__(
         self,
         user_feature_repository: UserFeatureRepository,
         user_repository: UserRepository,
+        feature_codebook_repository: FeatureCodebookRepository | None = None,
+        feature_index: FeatureSearchIndex = feature_index,
     ):
         self.user_repository = user_repository
         self.user_feature_repository = user_feature_repository
+        self.feature_codebook_repository = (
+            feature_codebook_repository or FeatureCodebookRepository()
+        )
+        self.feature_index = feature_index
 
     async def _check_user(self, user_id: int | str):
         user_id = user_id
@@ -55,44 +116,289 @@ class PersonalizationService(PersonalizationUseCase):
             raise UserNotFoundException
         return user
 
-    async def get_user_feature_binary(self, *, user_id: int | str) -> bytes:
-        user = await self._check_user(user_id=user_id)
-
-        is_exist = await self.user_feature_repository.get_feature_by_user_id(
+    async def get_user_feature_bytes(
+        self,
+        *,
+        user_id: int | str,
+        dtype: str | None = None,
+        codecs: tuple[str, ...] = (),
+        byteorder: str | None = None,
+    ) -> UserFeatureBytes:
+        # No user lookup: a feature row only exists for an existing user
+        feature = await self.user_feature_repository.get_feature_bytes_by_user_id(
             user_id=user_id,
+            dtype=dtype,
+            codecs=codecs,
+            byteorder=byteorder,
         )
-        if is_exist:
-            return is_exist.bvector
-        else:
+        if feature is None:
             raise UserFeatureNotFoundException
+        return feature
 
-    async def get_user_feature(self, *, user_id: int | str) -> GetUserFeatureResponse:
-        user = await self._check_user(user_id=user_id)
+    async def get_user_feature_matrix(
+        self,
+        *,
+        user_ids: list[int],
+        dtype: str | None = None,
+        byteorder: str = "big",
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """(n, size) matrix in the order of `user_ids` and its present mask,
+        users without a feature get a row of zeros"""
+        features = await self.user_feature_repository.get_feature_bytes_by_user_ids(
+            user_ids=user_ids
+        )
+        try:
+            return stack_feature_bytes(
+                [features.get(user_id) for user_id in user_ids],
+                dtype=dtype,
+                byteorder=byteorder,
+            )
+        except ValueError as e:
+            raise FeatureSizeMismatchException(message=str(e))
 
-        is_exist = await self.user_feature_repository.get_feature_by_user_id(
-            user_id=user_id,
+    async def score_candidates(
+        self,
+        *,
+        user_id: int | str,
+        user_ids: list[int],
+        metric: str = "dot",
+        byteorder: str = "big",
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """float32 scores of `user_ids` against the user's feature and their
+        present mask, NaN for candidates without a feature"""
+        # The user's feature comes in the same fetch as the candidates'
+        features = await self.user_feature_repository.get_feature_bytes_by_user_ids(
+            user_ids=[int(user_id), *user_ids]
         )
-        if is_exist:
-            np_vector = np.expand_dims(
-                np.frombuffer(is_exist.bvector, dtype=BigEndian[is_exist.dtype].value),
-                axis=0,
+        if int(user_id) not in features:
+            raise UserFeatureNotFoundException
+        try:
+            matrix, present = stack_feature_bytes(
+                [features[int(user_id)], *(features.get(id) for id in user_ids)],
+                dtype="float32",
+                byteorder=sys.byteorder,
             )
-            user_vector = np_vector.astype(np.float64).tolist()
-            return GetUserFeatureResponse(
-                user_vector=user_vector, size=is_exist.size, dtype=is_exist.dtype
+        except ValueError as e:
+            raise FeatureSizeMismatchException(message=str(e))
+
+        candidates = matrix[1:]
+        scores = score_rows(
+            candidates,
+            inverse_norms_of(candidates) if metric == "cosine" else None,
+            matrix[0],
+            metric,
+        )
+        scores[~present[1:]] = np.nan
+        return scores.astype(feature_numpy_dtype("float32", byteorder)), present[1:]
+
+    async def export_user_features(
+        self,
+        *,
+        size: int,
+        dtype: str = "float32",
+        cursor: int = 0,
+        chunk_size: int = 2000,
+    ) -> AsyncIterator[tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """(ids, user_ids, little-endian matrix) chunks of every feature of
+        `size` stored after row `cursor`"""
+        async for (
+            ids,
+            user_ids,
+            features,
+        ) in self.user_feature_repository.stream_features(
+            size=size, after=cursor, chunk_size=chunk_size
+        ):
+            matrix, _ = stack_feature_bytes(features, dtype=dtype, byteorder="little")
+            yield (
+                np.array(ids, dtype=np.int64),
+                np.array(user_ids, dtype=np.int64),
+                matrix,
             )
-        else:
-            raise UserFeatureNotFoundException
+
+    async def import_user_features(
+        self,
+        *,
+        chunks: AsyncIterator[tuple[np.ndarray, np.ndarray]],
+        dtype: str,
+    ) -> ImportUserFeaturesResponse:
+        """Upsert every valid row of `chunks`, one transaction per chunk.
+
+        Rows of unknown users, non-positive ids or with NaN/inf values are
+        skipped and counted. Chunks written before an upload error stay
+        written, importing the same upload again is harmless.
+        """
+        imported = 0
+        skipped: list[int] = []
+        async for user_ids, vectors in chunks:
+            valid = (user_ids > 0) & np.isfinite(vectors).all(axis=1)
+            existing = await self.user_repository.get_existing_ids(
+                ids=np.unique(user_ids[valid]).tolist()
+            )
+            valid &= np.isin(user_ids, list(existing))
+            await self._upsert_user_features(
+                user_ids=user_ids[valid], vectors=vectors[valid], dtype=dtype
+            )
+            await self.user_feature_repository.invalidate_feature_caches(
+                user_ids=np.unique(user_ids[valid]).tolist()
+            )
+            imported += int(valid.sum())
+            skipped += user_ids[~valid].tolist()
+        return ImportUserFeaturesResponse(
+            imported=imported,
+            skipped=len(skipped),
+            skipped_user_ids=skipped[:100],
+        )
 
     @Transactional()
+    async def _upsert_user_features(
+        self, *, user_ids: np.ndarray, vectors: np.ndarray, dtype: str
+    ) -> None:
+        await self.user_feature_repository.upsert_features(
+            user_ids=user_ids, vectors=vectors, dtype=dtype
+        )
+
+    async def get_similar_users(
+        self,
+        *,
+        user_id: int | str,
+        k: int = 10,
+        metric: str = "cosine",
+        nprobe: int | None = None,
+        ef: int | None = None,
+    ) -> SimilarUsersResponse:
+        if not self.feature_index.enabled:
+            # Before reading the caller's feature for nothing
+            raise FeatureSearchDisabledException
+        feature = await self.get_user_feature_bytes(user_id=user_id, dtype="float32")
+        if feature.size != self.feature_index.size:
+            raise FeatureSizeMismatchException(
+                message=f"only features of size {self.feature_index.size} "
+                "are searchable"
+            )
+        user_ids, scores = await self.feature_index.search(
+            np.frombuffer(
+                feature.bvector, dtype=feature_numpy_dtype("float32", feature.byteorder)
+            ),
+            k,
+            metric=metric,
+            exclude=[int(user_id)],
+            nprobe=nprobe,
+            ef=ef,
+        )
+        return SimilarUsersResponse(
+            metric=metric,
+            users=[
+                SimilarUser(user_id=similar_user_id, score=score)
+                for similar_user_id, score in zip(
+                    user_ids.tolist(), scores.tolist(), strict=True
+                )
+            ],
+        )
+
+    async def get_user_feature_vector(
+        self, *, user_id: int | str, dtype: str | None = None
+    ) -> dict:
+        """The user's feature with the vector left as a numpy array"""
+        feature = await self.get_user_feature_bytes(user_id=user_id, dtype=dtype)
+        return {
+            "size": feature.size,
+            "dtype": feature.dtype,
+            # Stored byte order, numpy reads either without a copy
+            "user_vector": np.frombuffer(
+                feature.bvector,
+                dtype=feature_numpy_dtype(feature.dtype, feature.byteorder),
+            )[np.newaxis],
+        }
+
     async def create_user_feature(
         self,
         *,
         user_id: int | str,
         command: CreateUserFeatureRequest,
         stub: EmbeddingServiceStub | None = None,
+        client: httpx.AsyncClient | None = None,
+        return_binary: bool = False,
+    ) -> GetUserFeatureResponse | bytes:
+        embedding_result = await feature_flights.do(
+            f"create:{user_id}:{command.size}:{command.dtype}",
+            partial(
+                self._write_user_feature,
+                user_id=user_id,
+                command=command,
+                write=partial(
+                    self._create_user_feature,
+                    user_id=user_id,
+                    command=command,
+                    stub=stub,
+                    client=client,
+                ),
+            ),
+        )
+        return self._to_feature_response(
+            embedding_result, command=command, return_binary=return_binary
+        )
+
+    async def update_user_feature(
+        self,
+        *,
+        user_id: int | str,
+        command: CreateUserFeatureRequest,
+        stub: EmbeddingServiceStub | None = None,
+        client: httpx.AsyncClient | None = None,
         return_binary: bool = False,
+        force: bool = False,
     ) -> GetUserFeatureResponse | bytes:
+        embedding_result = await feature_flights.do(
+            f"update:{user_id}:{command.size}:{command.dtype}:{force}",
+            partial(
+                self._write_user_feature,
+                user_id=user_id,
+                command=command,
+                write=partial(
+                    self._update_user_feature,
+                    user_id=user_id,
+                    command=command,
+                    stub=stub,
+                    client=client,
+                    force=force,
+                ),
+            ),
+        )
+        return self._to_feature_response(
+            embedding_result, command=command, return_binary=return_binary
+        )
+
+    async def _write_user_feature(
+        self,
+        *,
+        user_id: int | str,
+        command: CreateUserFeatureRequest,
+        write: Callable[[], Awaitable[GetUserEmbeddingResponse]],
+    ) -> GetUserEmbeddingResponse:
+        embedding_result = await write()
+        # After the commit, so a concurrent read cannot re-cache the old row
+        await self.user_feature_repository.invalidate_feature_cache(user_id=user_id)
+        # Other workers pick it up at their next refresh
+        await self.feature_index.upsert(
+            int(user_id),
+            np.frombuffer(
+                embedding_result.bvector, dtype=BigEndian[command.dtype].value
+            ),
+        )
+        return embedding_result
+
+    # Shared by every concurrent caller, so it runs (and commits) in its own
+    # session instead of the session of whichever request started it
+    @StandaloneSession()
+    @Transactional()
+    async def _create_user_feature(
+        self,
+        *,
+        user_id: int | str,
+        command: CreateUserFeatureRequest,
+        stub: EmbeddingServiceStub | None = None,
+        client: httpx.AsyncClient | None = None,
+    ) -> GetUserEmbeddingResponse:
         size = command.size
         protocol = command.protocol
         dtype = command.dtype
@@ -122,7 +428,8 @@ class PersonalizationService(PersonalizationUseCase):
             protocol=protocol,
             command=embedding_command,
             stub=stub,
-            return_binary=return_binary,
+            client=client,
+            return_binary=True,
         )
 
         await self.user_feature_repository.save(
@@ -131,25 +438,23 @@ class PersonalizationService(PersonalizationUseCase):
                 bvector=embedding_result.bvector,
                 size=size,
                 dtype=dtype,
+                fingerprint=get_embedding_fingerprint(embedding_command),
             )
         )
 
-        if return_binary:
-            return embedding_result.bvector
-        else:
-            return GetUserFeatureResponse(
-                user_vector=embedding_result.user_vector, size=size, dtype=dtype
-            )
+        return embedding_result
 
+    @StandaloneSession()
     @Transactional()
-    async def update_user_feature(
+    async def _update_user_feature(
         self,
         *,
         user_id: int | str,
         command: CreateUserFeatureRequest,
         stub: EmbeddingServiceStub | None = None,
-        return_binary: bool = False,
-    ) -> GetUserFeatureResponse | bytes:
+        client: httpx.AsyncClient | None = None,
+        force: bool = False,
+    ) -> GetUserEmbeddingResponse:
         size = command.size
         protocol = command.protocol
         dtype = command.dtype
@@ -174,31 +479,71 @@ class PersonalizationService(PersonalizationUseCase):
             lng=user.location.lng,
         )
 
+        fingerprint = get_embedding_fingerprint(embedding_command)
+        if not force and is_exist.fingerprint == fingerprint:
+            # Same inputs as the stored vector, nothing to recompute
+            return GetUserEmbeddingResponse(bvector=is_exist.bvector, user_vector=None)
+
         embedding_result = await self._get_embedding(
             user_id=user_id,
             protocol=protocol,
             command=embedding_command,
             stub=stub,
-            return_binary=return_binary,
+            client=client,
+            return_binary=True,
         )
 
         await self.user_feature_repository.update_by_id(
             id=is_exist.id,
-            params={"bvector": embedding_result.bvector},
+            params={
+                "bvector": embedding_result.bvector,
+                "size": size,
+                "dtype": dtype,
+                "fingerprint": fingerprint,
+            },
         )
 
+        return embedding_result
+
+    @staticmethod
+    def _to_feature_response(
+        embedding_result: GetUserEmbeddingResponse,
+        *,
+        command: CreateUserFeatureRequest,
+        return_binary: bool,
+    ) -> GetUserFeatureResponse | bytes:
         if return_binary:
             return embedding_result.bvector
-        else:
-            return GetUserFeatureResponse(
-                user_vector=embedding_result.user_vector, size=size, dtype=dtype
+
+        user_vector = embedding_result.user_vector
+        if user_vector is None:
+            np_vector = np.expand_dims(
+                np.frombuffer(
+                    embedding_result.bvector, dtype=BigEndian[command.dtype].value
+                ),
+                axis=0,
             )
+            user_vector = np_vector.astype(np.float64).tolist()
+        return GetUserFeatureResponse(
+            user_vector=user_vector, size=command.size, dtype=command.dtype
+        )
 
-    @Transactional()
     async def delete_user_feature(
         self,
         *,
         user_id: int | str,
+    ) -> DeleteUserFeatureResponse:
+        response = await self._delete_user_feature(user_id=user_id)
+        await self.user_feature_repository.invalidate_feature_cache(user_id=user_id)
+        # Other workers drop it at their next resync
+        await self.feature_index.remove([int(user_id)])
+        return response
+
+    @Transactional()
+    async def _delete_user_feature(
+        self,
+        *,
+        user_id: int | str,
     ) -> DeleteUserFeatureResponse:
         user_id = user_id
 
@@ -221,71 +566,242 @@ class PersonalizationService(PersonalizationUseCase):
             dtype=is_exist.dtype,
         )
 
+    async def submit_user_feature_job(
+        self,
+        *,
+        user_id: int | str,
+        op: Literal["create", "update"],
+        command: CreateUserFeatureRequest,
+    ) -> FeatureJobResponse:
+        await self._check_user(user_id=user_id)
+
+        # Cheap checks up front, so obvious conflicts still fail synchronously
+        is_exist = await self.user_feature_repository.get_feature_by_user_id(
+            user_id=user_id,
+        )
+        if op == "create" and is_exist:
+            raise UserFeatureAlreadyExistException
+        if op == "update" and not is_exist:
+            raise UserFeatureNotFoundException
+
+        job = await feature_jobs.enqueue(
+            op, {"user_id": user_id, "command": command.model_dump()}
+        )
+        return self._to_job_response(job)
+
+    async def get_user_feature_job(
+        self,
+        *,
+        user_id: int | str,
+        job_id: str,
+        wait: float = 0,
+    ) -> FeatureJobResponse:
+        if wait > 0:
+            job = await feature_jobs.wait(job_id, timeout=wait)
+        else:
+            job = await feature_jobs.get(job_id)
+
+        if job is None or str(job.payload["user_id"]) != str(user_id):
+            raise FeatureJobNotFoundException
+        return self._to_job_response(job)
+
+    @staticmethod
+    def _to_job_response(job: Job) -> FeatureJobResponse:
+        return FeatureJobResponse(
+            job_id=job.id,
+            op=job.kind,
+            status=job.status.value,
+            result=job.result,
+            error_code=job.error_code,
+            message=job.message,
+            created_at=datetime.fromtimestamp(job.created_at),
+            updated_at=datetime.fromtimestamp(job.updated_at),
+        )
+
+    async def submit_feature_byteorder_job(
+        self,
+        *,
+        user_id: int | str,
+        command: ConvertFeatureByteorderRequest,
+    ) -> FeatureJobResponse:
+        job = await feature_jobs.enqueue(
+            "convert_byteorder", {"user_id": user_id, "command": command.model_dump()}
+        )
+        return self._to_job_response(job)
+
+    async def convert_feature_byteorder(
+        self, *, command: ConvertFeatureByteorderRequest
+    ) -> int:
+        user_ids = await self._convert_feature_byteorder(command=command)
+        await self.user_feature_repository.invalidate_feature_caches(user_ids=user_ids)
+        return len(user_ids)
+
+    @StandaloneSession()
+    @Transactional()
+    async def _convert_feature_byteorder(
+        self, *, command: ConvertFeatureByteorderRequest
+    ) -> list[int]:
+        return await self.user_feature_repository.convert_byteorder(
+            byteorder=command.byteorder, limit=command.batch_size
+        )
+
+    @Transactional()
+    async def train_feature_codebook(
+        self, *, command: TrainFeatureCodebookRequest
+    ) -> FeatureCodebookResponse:
+        if command.size % command.subvectors:
+            raise FeatureCodebookTrainException(
+                message=f"size {command.size} does not split into "
+                f"{command.subvectors} subvectors"
+            )
+
+        vectors = await self.user_feature_repository.get_feature_vectors(
+            size=command.size, limit=command.sample
+        )
+        if not len(vectors):
+            raise FeatureCodebookTrainException(
+                message=f"no stored features of size {command.size}"
+            )
+
+        # k-means is CPU bound, keep it off the event loop
+        codebook = await asyncio.to_thread(
+            train_pq,
+            vectors,
+            subvectors=command.subvectors,
+            centroids=command.centroids,
+            iterations=command.iterations,
+        )
+        decoded = decode_pq(encode_pq(vectors, codebook), codebook)
+        relative_error = float(
+            np.sum((vectors - decoded) ** 2) / max(np.sum(vectors**2), 1e-12)
+        )
+
+        saved = await self.feature_codebook_repository.save(
+            codebook=FeatureCodebook.create(
+                size=command.size,
+                subvectors=command.subvectors,
+                centroids=codebook.shape[1],
+                codebook=codebook.astype(">f4").tobytes(),
+            )
+        )
+        return FeatureCodebookResponse(
+            id=saved.id,
+            size=saved.size,
+            subvectors=saved.subvectors,
+            centroids=saved.centroids,
+            trained_on=len(vectors),
+            relative_error=relative_error,
+        )
+
+    async def get_embedding_stats(self) -> GetEmbeddingStatsResponse:
+        return GetEmbeddingStatsResponse(
+            protocols=protocol_selector.stats(),
+            breakers={
+                protocol: breaker.stats()
+                for protocol, breaker in embedding_breakers.items()
+            },
+        )
+
     @staticmethod
     async def _get_embedding(
         user_id: Union[int, str],
         protocol: str,
         command: UserEmbeddingRequest,
         stub: EmbeddingServiceStub | None = None,
+        client: httpx.AsyncClient | None = None,
         return_binary: bool = False,
     ) -> GetUserEmbeddingResponse:
         params = command.model_dump()
 
-        if protocol == "http":
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{config.EMBEDDING_URL}/v1/embedding/user/{user_id}",
-                    json=params,
-                )
-                if response.status_code != 200:
-                    raise EmbeddingException(message=response.text)
-                response_json = UserEmbeddingResponse.model_validate(response.json())
-                user_vector = response_json.user_vector
-                bvector = (
-                    np.array(user_vector)
-                    .astype(BigEndian[command.dtype].value)
-                    .tobytes()
-                )
+        if protocol == "auto":
+            available = (
+                ("http", "http-octet", "grpc") if stub else ("http", "http-octet")
+            )
+            protocol = protocol_selector.choose(
+                size=command.size, dtype=command.dtype, available=available
+            )
 
-        elif protocol == "http-octet":
-            async with httpx.AsyncClient() as client:
-                resp = await client.post(
-                    f"{config.EMBEDDING_URL}/v1/embedding/user/{user_id}/octet",
-                    json=params,
-                )
-                if resp.status_code != 200:
-                    raise EmbeddingException(message=resp.text)
-                bvector = resp.content
-                if return_binary:
-                    return GetUserEmbeddingResponse(
-                        bvector=bvector,
-                        user_vector=None,
-                    )
-
-                np_vector = np.expand_dims(
-                    np.frombuffer(bvector, dtype=BigEndian[command.dtype].value), axis=0
-                )
-                user_vector = np_vector.astype(np.float64).tolist()
+        breaker = embedding_breakers[protocol]
+        if not breaker.allow():
+            raise EmbeddingException(
+                message=f"Embedding {protocol} backend is unavailable (circuit open)"
+            )
 
+        if protocol in ("http", "http-octet"):
+            path = f"/v1/embedding/user/{user_id}"
+            if protocol == "http-octet":
+                path += "/octet"
+            attempts = [
+                partial(_post_embedding, client, f"{url}{path}", params)
+                for url in _embedding_urls()
+            ]
         elif protocol.lower() == "grpc":
-            try:
-                request_proto = EmbeddingUserRequest(**params)
-                response = await stub.EmbeddingUser(request_proto)
-                bvector = response.bvector
-            except grpc.aio.AioRpcError as e:
-                logging.error(f"gRPC Error: {e.code()} - {e.details()}")
-                raise EmbeddingGrpcException(message=e.details())
-
-            if return_binary:
-                return GetUserEmbeddingResponse(
-                    bvector=bvector,
-                    user_vector=None,
-                )
+            request_proto = EmbeddingUserRequest(**params)
+            # Every call goes to the next pooled channel
+            attempts = [partial(stub.EmbeddingUser, request_proto)] * (
+                2 if config.EMBEDDING_HEDGE else 1
+            )
 
-            np_vector = np.expand_dims(
-                np.frombuffer(bvector, dtype=BigEndian[command.dtype].value), axis=0
+        started = time.monotonic()
+        try:
+            response = await asyncio.wait_for(
+                hedged(attempts, delay=get_hedge_delay(breaker)),
+                timeout=config.EMBEDDING_TIMEOUT,
             )
-            user_vector = np_vector.astype(np.float64).tolist()
+        except asyncio.TimeoutError:
+            breaker.record_failure(time.monotonic() - started)
+            raise EmbeddingException(message=f"Embedding {protocol} backend timed out")
+        except grpc.aio.AioRpcError as e:
+            breaker.record_failure(time.monotonic() - started)
+            logging.error(f"gRPC Error: {e.code()} - {e.details()}")
+            raise EmbeddingGrpcException(message=e.details())
+        except httpx.HTTPError as e:
+            breaker.record_failure(time.monotonic() - started)
+            raise EmbeddingException(message=str(e))
+        except Exception:
+            breaker.record_failure(time.monotonic() - started)
+            raise
+        latency = time.monotonic() - started
+        breaker.record_success(latency)
+
+        if isinstance(response, httpx.Response):
+            nbytes = len(response.content)
+        else:
+            nbytes = response.ByteSize()
+        protocol_selector.record(
+            protocol=protocol,
+            size=command.size,
+            dtype=command.dtype,
+            latency=latency,
+            nbytes=nbytes,
+        )
+
+        if protocol == "http":
+            response_json = UserEmbeddingResponse.model_validate(response.json())
+            user_vector = response_json.user_vector
+            bvector = (
+                np.array(user_vector).astype(BigEndian[command.dtype].value).tobytes()
+            )
+            return GetUserEmbeddingResponse(
+                bvector=bvector,
+                user_vector=user_vector,
+            )
+
+        if protocol == "http-octet":
+            bvector = response.content
+        else:
+            bvector = response.bvector
+
+        if return_binary:
+            return GetUserEmbeddingResponse(
+                bvector=bvector,
+                user_vector=None,
+            )
+
+        np_vector = np.expand_dims(
+            np.frombuffer(bvector, dtype=BigEndian[command.dtype].value), axis=0
+        )
+        user_vector = np_vector.astype(np.float64).tolist()
 
         return GetUserEmbeddingResponse(
             bvector=bvector,
@@ -293,8 +809,83 @@ class PersonalizationService(PersonalizationUseCase):
         )
 
 
+def get_embedding_fingerprint(command: UserEmbeddingRequest) -> str:
+    payload = json.dumps(command.model_dump(), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def get_embedding_transport(state, protocol: str) -> dict:
+    """Pick the lifespan-owned embedding client for the requested protocol"""
+    if protocol == "grpc":
+        return {"stub": getattr(state, "embedding_stub", None)}
+    if protocol == "auto":
+        return {
+            "stub": getattr(state, "embedding_stub", None),
+            "client": getattr(state, "embedding_http_client", None),
+        }
+    return {"client": getattr(state, "embedding_http_client", None)}
+
+
+async def handle_feature_job(state, job: Job) -> dict:
+    """Run a queued create/update with the app's embedding clients, or one
+    batch of a byte order conversion"""
+    service = get_personalization_service()
+    if job.kind == "convert_byteorder":
+        command = ConvertFeatureByteorderRequest.model_validate(job.payload["command"])
+        converted = await service.convert_feature_byteorder(command=command)
+        result = {"converted": converted}
+        if converted == command.batch_size:
+            # Rows may be left: continue in a new job, so no job outlives the
+            # visibility timeout and gets claimed twice
+            next_job = await feature_jobs.enqueue(job.kind, job.payload)
+            result["next_job_id"] = next_job.id
+        return result
+
+    if job.kind == "create":
+        command = CreateUserFeatureRequest.model_validate(job.payload["command"])
+        await service.create_user_feature(
+            user_id=job.payload["user_id"],
+            command=command,
+            **get_embedding_transport(state, command.protocol),
+            return_binary=True,
+        )
+    else:
+        command = UpdateUserFeatureRequest.model_validate(job.payload["command"])
+        await service.update_user_feature(
+            user_id=job.payload["user_id"],
+            command=command,
+            **get_embedding_transport(state, command.protocol),
+            return_binary=True,
+            force=command.force,
+        )
+    return {"size": command.size, "dtype": command.dtype}
+
+
+def _embedding_urls() -> list[str]:
+    urls = [config.EMBEDDING_URL]
+    if config.EMBEDDING_HEDGE:
+        urls.append(config.EMBEDDING_HEDGE_URL or config.EMBEDDING_URL)
+    return urls
+
+
+async def _post_embedding(
+    client: httpx.AsyncClient | None, url: str, params: dict
+) -> httpx.Response:
+    async with borrow_embedding_http_client(client) as http_client:
+        response = await http_client.post(url, json=params)
+    if response.status_code != 200:
+        raise EmbeddingException(message=response.text)
+    return response
+
+
 def get_personalization_service():
     return PersonalizationService(
-        user_feature_repository=UserFeatureRepository(UserFeature),
+        user_feature_repository=UserFeatureRepository(
+            UserFeature,
+            quantization=config.FEATURE_QUANTIZATION,
+            codec=config.FEATURE_CODEC,
+            codec_level=config.FEATURE_CODEC_LEVEL,
+            byteorder=config.FEATURE_BYTEORDER,
+        ),
         user_repository=UserRepository(),
     )
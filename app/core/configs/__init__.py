@@ -1,4 +1,5 @@
 import os
+from typing import Literal
 
 from pydantic_settings import BaseSettings
 
@@ -18,6 +19,62 @@ class Config(BaseSettings):
     REDIS_PORT: int = 6379
     EMBEDDING_URL: str = "http://localhost:8002"
     EMBEDDING_GRPC_URL: str = "localhost:8004"
+    EMBEDDING_HTTP2: bool = True
+    EMBEDDING_HTTP_TIMEOUT: float = 5.0
+    EMBEDDING_HTTP_MAX_CONNECTIONS: int = 100
+    EMBEDDING_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    EMBEDDING_HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    EMBEDDING_GRPC_POOL_SIZE: int = 4
+    EMBEDDING_GRPC_KEEPALIVE_TIME_MS: int = 30_000
+    EMBEDDING_GRPC_KEEPALIVE_TIMEOUT_MS: int = 10_000
+    EMBEDDING_GRPC_MAX_MESSAGE_LENGTH: int = 16 * 1024 * 1024
+    EMBEDDING_GRPC_COMPRESSION: Literal["none", "gzip", "deflate"] = "none"
+    EMBEDDING_GRPC_CONNECT_TIMEOUT: float = 5.0
+    EMBEDDING_GRPC_MODE: Literal["unary", "batch", "stream"] = "unary"
+    EMBEDDING_GRPC_BATCH_MAX_SIZE: int = 32
+    EMBEDDING_GRPC_BATCH_MAX_WAIT_MS: float = 5.0
+    EMBEDDING_GRPC_STREAM_BACKOFF_MS: float = 100
+    EMBEDDING_GRPC_STREAM_MAX_BACKOFF_MS: float = 10_000
+    EMBEDDING_TIMEOUT: float = 10.0
+    EMBEDDING_BREAKER_WINDOW_SECONDS: float = 30
+    EMBEDDING_BREAKER_MIN_CALLS: int = 20
+    EMBEDDING_BREAKER_FAILURE_RATE: float = 0.5
+    EMBEDDING_BREAKER_SLOW_CALL_MS: float | None = None
+    EMBEDDING_BREAKER_RESET_SECONDS: float = 10
+    EMBEDDING_HEDGE: bool = False
+    EMBEDDING_HEDGE_URL: str | None = None
+    EMBEDDING_HEDGE_MIN_DELAY_MS: float = 20
+    EMBEDDING_AUTO_EWMA_ALPHA: float = 0.2
+    EMBEDDING_AUTO_MIN_SAMPLES: int = 5
+    EMBEDDING_AUTO_EXPLORE_RATE: float = 0.05
+    FEATURE_SINGLE_FLIGHT_REDIS: bool = False
+    FEATURE_SINGLE_FLIGHT_LOCK_TIMEOUT: float = 10.0
+    FEATURE_SINGLE_FLIGHT_RESULT_TTL: int = 5
+    FEATURE_COMPUTE_MODE: Literal["sync", "async"] = "sync"
+    FEATURE_JOB_WORKERS: int = 4
+    FEATURE_JOB_TTL_SECONDS: int = 3600
+    FEATURE_JOB_VISIBILITY_TIMEOUT: float = 60.0
+    FEATURE_JOB_MAX_WAIT_SECONDS: float = 30.0
+    FEATURE_QUANTIZATION: Literal["none", "int8", "pq"] = "none"
+    FEATURE_CODEC: Literal["none", "zstd", "lz4", "shuffle-zstd", "shuffle-lz4"] = (
+        "none"
+    )
+    FEATURE_CODEC_LEVEL: int = 3
+    FEATURE_BYTEORDER: Literal["big", "little"] = "big"
+    FEATURE_EXPORT_CHUNK_SIZE: int = 2000
+    FEATURE_IMPORT_CHUNK_SIZE: int = 1000
+    FEATURE_SEARCH_ENABLED: bool = False
+    FEATURE_SEARCH_SIZE: int = 2048
+    FEATURE_SEARCH_REFRESH_SECONDS: float = 10.0
+    FEATURE_SEARCH_RELOAD_SECONDS: float = 900.0
+    FEATURE_SEARCH_INDEX: Literal["flat", "ivf", "hnsw", "mmap"] = "flat"
+    FEATURE_SEARCH_INDEX_PATH: str | None = None
+    FEATURE_SEARCH_IVF_LISTS: int = 1024
+    FEATURE_SEARCH_IVF_NPROBE: int = 8
+    FEATURE_SEARCH_HNSW_M: int = 16
+    FEATURE_SEARCH_HNSW_EF_CONSTRUCTION: int = 100
+    FEATURE_SEARCH_HNSW_EF: int = 64
+    FEATURE_SEARCH_SHARDS: int = 1
     PROFILING: bool = False
 
 
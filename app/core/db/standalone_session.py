@@ -0,0 +1,20 @@
+from functools import wraps
+from uuid import uuid4
+
+from app.core.db.session import reset_session_context, session, set_session_context
+
+
+class StandaloneSession:
+    """Give the call its own scoped session, like SQLAlchemyMiddleware per request"""
+
+    def __call__(self, func):
+        @wraps(func)
+        async def _standalone_session(*args, **kwargs):
+            context = set_session_context(session_id=str(uuid4()))
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                await session.remove()
+                reset_session_context(context=context)
+
+        return _standalone_session
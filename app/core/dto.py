@@ -1,5 +1,60 @@
-from fastapi.responses import Response
+from functools import cache
+from typing import Any
+
+import numpy as np
+import ujson
+from fastapi.responses import JSONResponse, Response
 
 
 class OctetStreamResponse(Response):
     media_type = "application/octet-stream"
+
+
+class VectorJSONResponse(JSONResponse):
+    """JSON response that writes numpy arrays without Pydantic.
+
+    Values come out exactly as `tolist()` + json would print them (shortest
+    repr). Only float16 arrays are formatted straight from their buffer,
+    through a table of all 65536 values; float32/float64 have too many to
+    tabulate and still go through `tolist()` and ujson. Non-finite values
+    become null, like Pydantic does. Return it from a route that keeps its
+    `response_model` for the OpenAPI schema.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return encode_json(content)
+
+
+def encode_json(obj: Any) -> bytes:
+    if isinstance(obj, np.ndarray):
+        return encode_array(obj)
+    if isinstance(obj, dict):
+        items = (
+            ujson.dumps(str(k)).encode() + b":" + encode_json(v) for k, v in obj.items()
+        )
+        return b"{" + b",".join(items) + b"}"
+    if isinstance(obj, (list, tuple)):
+        return b"[" + b",".join(encode_json(v) for v in obj) + b"]"
+    return ujson.dumps(obj).encode()
+
+
+def encode_array(array: np.ndarray) -> bytes:
+    if array.ndim > 1:
+        return b"[" + b",".join(encode_array(row) for row in array) + b"]"
+    if array.dtype.kind == "f" and not np.isfinite(array).all():
+        values = [v if np.isfinite(v) else None for v in array.tolist()]
+        return ujson.dumps(values).encode()
+    if array.dtype.kind == "f" and array.dtype.itemsize == 2:
+        codes = array.astype(np.float16, copy=False).view(np.uint16)
+        return b"[" + b",".join(_float16_reprs()[codes]) + b"]"
+    # ujson prints the Python floats' repr, no faster route for f4/f8
+    return ujson.dumps(array.tolist()).encode()
+
+
+@cache
+def _float16_reprs() -> np.ndarray:
+    """JSON text of every float16 bit pattern"""
+    values = np.arange(1 << 16, dtype=np.uint16).view(np.float16)
+    return np.array(
+        [repr(v).encode() for v in values.astype(np.float64).tolist()], dtype=object
+    )
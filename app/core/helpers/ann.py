@@ -0,0 +1,504 @@
+"""Approximate nearest neighbour indexes: IVF-flat and HNSW, numpy only.
+
+Both follow VectorMatrix: upsert/remove/search by integer id, one lock per
+index, state()/from_state() for persistence. They are built for cosine
+similarity; a dot product search reranks the cosine candidates by norm.
+"""
+
+import heapq
+import math
+import threading
+from typing import Iterable
+
+import numpy as np
+
+from app.core.helpers.quantization import kmeans
+from app.core.helpers.vector_search import METRICS, VectorMatrix, top_k
+
+
+def _normalize(vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1), norms[..., 0]
+
+
+class IVFFlatIndex:
+    """Vectors bucketed by their nearest of `lists` k-means centroids.
+
+    A search scans the `nprobe` lists whose centroids are closest to the
+    query: more probes, better recall, slower. The centroids are trained on
+    the first upsert (up to `train_size` vectors of it). An index filled by
+    small upserts outgrows them: `needs_training` tells when, and
+    retrained() builds a copy trained on everything indexed, off the lock.
+    """
+
+    search_params = ("nprobe",)
+
+    def __init__(
+        self,
+        size: int,
+        *,
+        lists: int = 1024,
+        nprobe: int = 8,
+        train_size: int = 50000,
+        iterations: int = 10,
+        seed: int = 0,
+    ):
+        self.size = size
+        self.lists = lists
+        self.nprobe = nprobe
+        self.train_size = train_size
+        self.iterations = iterations
+        self.seed = seed
+        self.centroids: np.ndarray | None = None
+        # Vectors the centroids were trained on
+        self.trained_on = 0
+        self._lists: list[VectorMatrix] = []
+        self._assigned: dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._assigned)
+
+    def __contains__(self, id: int) -> bool:
+        return id in self._assigned
+
+    @property
+    def needs_training(self) -> bool:
+        """Twice as many vectors as the centroids were trained on, which
+        were fewer than `train_size`"""
+        return (
+            self.centroids is not None
+            and self.trained_on < self.train_size
+            and len(self._assigned) >= 2 * self.trained_on
+        )
+
+    @property
+    def under_trained(self) -> bool:
+        """Fewer centroids than `lists`: trained on fewer vectors than that"""
+        return self.centroids is None or len(self.centroids) < self.lists
+
+    def ids(self) -> np.ndarray:
+        with self._lock:
+            return np.fromiter(
+                self._assigned, dtype=np.int64, count=len(self._assigned)
+            )
+
+    def train(self, vectors: np.ndarray) -> None:
+        rng = np.random.default_rng(self.seed)
+        sample = vectors[rng.permutation(len(vectors))[: self.train_size]]
+        centroids = kmeans(
+            _normalize(sample)[0],
+            self.lists,
+            iterations=self.iterations,
+            seed=self.seed,
+        )
+        self.centroids = _normalize(centroids)[0].astype(np.float32)
+        self.trained_on = len(sample)
+        self._lists = [
+            VectorMatrix(self.size, capacity=16) for _ in range(len(self.centroids))
+        ]
+
+    def retrained(self) -> "IVFFlatIndex":
+        """A new index of the same vectors, trained on all of them. Searches
+        and upserts go on meanwhile, the upserts are not in the copy."""
+        with self._lock:
+            states = [matrix.state() for matrix in self._lists]
+        index = IVFFlatIndex(
+            self.size,
+            lists=self.lists,
+            nprobe=self.nprobe,
+            train_size=self.train_size,
+            iterations=self.iterations,
+            seed=self.seed,
+        )
+        index.upsert(
+            np.concatenate([state["ids"] for state in states]),
+            np.concatenate([state["vectors"] for state in states]),
+        )
+        return index
+
+    def upsert(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.size)
+        with self._lock:
+            if self.centroids is None:
+                self.train(vectors)
+            assigned = (_normalize(vectors)[0] @ self.centroids.T).argmax(axis=1)
+            for id, list_index in zip(ids.tolist(), assigned.tolist(), strict=True):
+                previous = self._assigned.get(id)
+                if previous is not None and previous != list_index:
+                    self._lists[previous].remove([id])
+                self._assigned[id] = list_index
+            for list_index in np.unique(assigned).tolist():
+                mask = assigned == list_index
+                self._lists[list_index].upsert(ids[mask], vectors[mask])
+
+    def remove(self, ids: Iterable[int]) -> None:
+        with self._lock:
+            for id in ids:
+                list_index = self._assigned.pop(int(id), None)
+                if list_index is not None:
+                    self._lists[list_index].remove([int(id)])
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int,
+        *,
+        metric: str = "cosine",
+        exclude: Iterable[int] = (),
+        nprobe: int | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        query = np.asarray(query, dtype=np.float32).reshape(self.size)
+        exclude = list(exclude)
+        with self._lock:
+            if self.centroids is None:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            nprobe = min(nprobe or self.nprobe, len(self.centroids))
+            closeness = self.centroids @ _normalize(query)[0]
+            probes = np.argpartition(-closeness, nprobe - 1)[:nprobe]
+            found = [
+                self._lists[probe].search(query, k, metric=metric, exclude=exclude)
+                for probe in probes.tolist()
+            ]
+        return top_k(
+            np.concatenate([ids for ids, _ in found]),
+            np.concatenate([scores for _, scores in found]),
+            k,
+        )
+
+    def state(self) -> dict[str, np.ndarray]:
+        with self._lock:
+            states = [matrix.state() for matrix in self._lists]
+            return {
+                "params": np.array(
+                    [
+                        self.lists,
+                        self.nprobe,
+                        self.train_size,
+                        self.iterations,
+                        self.trained_on,
+                    ]
+                ),
+                "centroids": (
+                    self.centroids
+                    if self.centroids is not None
+                    else np.empty((0, self.size), dtype=np.float32)
+                ),
+                "ids": np.concatenate(
+                    [state["ids"] for state in states] or [np.empty(0, np.int64)]
+                ),
+                "vectors": np.concatenate(
+                    [state["vectors"] for state in states]
+                    or [np.empty((0, self.size), np.float32)]
+                ),
+                "list_sizes": np.array([len(state["ids"]) for state in states]),
+            }
+
+    @classmethod
+    def from_state(cls, state: dict[str, np.ndarray]) -> "IVFFlatIndex":
+        lists, nprobe, train_size, iterations, *trained_on = state["params"].tolist()
+        index = cls(
+            state["centroids"].shape[1],
+            lists=lists,
+            nprobe=nprobe,
+            train_size=train_size,
+            iterations=iterations,
+        )
+        if not len(state["centroids"]):
+            return index
+        index.centroids = state["centroids"]
+        # Saved before it was recorded: assume trained on everything
+        index.trained_on = trained_on[0] if trained_on else len(state["ids"])
+        ends = np.cumsum(state["list_sizes"])
+        for list_index, (start, end) in enumerate(
+            zip(np.concatenate([[0], ends[:-1]]), ends, strict=True)
+        ):
+            matrix = VectorMatrix(index.size, capacity=max(int(end - start), 16))
+            matrix.upsert(state["ids"][start:end], state["vectors"][start:end])
+            index._lists.append(matrix)
+            for id in state["ids"][start:end].tolist():
+                index._assigned[id] = list_index
+        return index
+
+
+class HNSWIndex:
+    """Hierarchical navigable small world graph over normalized vectors.
+
+    Every node links to about `m` neighbours per layer (2 * m on the bottom
+    one), found with a beam of `ef_construction`. A search descends the
+    layers greedily, then keeps the `ef` best candidates on the bottom one:
+    a wider beam, better recall, slower.
+
+    Removed or replaced vectors stay in the graph as tombstones, still
+    routing searches but never returned. `tombstones` tells when a rebuild
+    is worth it.
+    """
+
+    search_params = ("ef",)
+
+    def __init__(
+        self,
+        size: int,
+        *,
+        m: int = 16,
+        ef_construction: int = 100,
+        ef: int = 64,
+        seed: int = 0,
+        capacity: int = 1024,
+    ):
+        self.size = size
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef = ef
+        self._rng = np.random.default_rng(seed)
+        self._vectors = np.zeros((capacity, size), dtype=np.float32)
+        self._norms = np.zeros(capacity, dtype=np.float32)
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        # Per node, its neighbour nodes on each of its layers
+        self._links: list[list[np.ndarray]] = []
+        self._nodes: dict[int, int] = {}
+        self._deleted: set[int] = set()
+        self._entry: int | None = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def __contains__(self, id: int) -> bool:
+        return id in self._nodes
+
+    @property
+    def tombstones(self) -> int:
+        return len(self._deleted)
+
+    def ids(self) -> np.ndarray:
+        with self._lock:
+            return np.fromiter(self._nodes, dtype=np.int64, count=len(self._nodes))
+
+    def compact(self) -> "HNSWIndex":
+        """A new graph of the live vectors only, built from scratch"""
+        with self._lock:
+            nodes = np.fromiter(self._nodes.values(), dtype=np.int64)
+            ids = self._ids[nodes].copy()
+            vectors = self._vectors[nodes] * self._norms[nodes, np.newaxis]
+        index = HNSWIndex(
+            self.size,
+            m=self.m,
+            ef_construction=self.ef_construction,
+            ef=self.ef,
+            capacity=max(len(ids), 1),
+        )
+        index.upsert(ids, vectors)
+        return index
+
+    def upsert(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.size)
+        normalized, norms = _normalize(vectors)
+        with self._lock:
+            for id, vector, norm in zip(
+                ids.tolist(), normalized, norms.tolist(), strict=True
+            ):
+                previous = self._nodes.get(id)
+                if previous is not None:
+                    self._deleted.add(previous)
+                self._nodes[id] = self._insert(id, vector, norm)
+
+    def remove(self, ids: Iterable[int]) -> None:
+        with self._lock:
+            for id in ids:
+                node = self._nodes.pop(int(id), None)
+                if node is not None:
+                    self._deleted.add(node)
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int,
+        *,
+        metric: str = "cosine",
+        exclude: Iterable[int] = (),
+        ef: int | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        if metric not in METRICS:
+            raise ValueError(f"metric must be one of {METRICS}")
+        query = np.asarray(query, dtype=np.float32).reshape(self.size)
+        normalized, norm = _normalize(query)
+        excluded = {int(id) for id in exclude}
+        with self._lock:
+            if self._entry is None:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            entry = self._descend(normalized, self._entry, 0)
+            found = self._search_layer(
+                normalized, [entry], max(ef or self.ef, k + len(excluded)), 0
+            )
+            nodes = np.array(
+                [
+                    node
+                    for _, node in found
+                    if node not in self._deleted
+                    and int(self._ids[node]) not in excluded
+                ],
+                dtype=np.int64,
+            )
+            if not len(nodes):
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            scores = self._vectors[nodes] @ normalized
+            if metric == "dot":
+                scores = scores * self._norms[nodes] * norm
+            return top_k(self._ids[nodes].copy(), scores, k)
+
+    def _insert(self, id: int, vector: np.ndarray, norm: float) -> int:
+        node = len(self._links)
+        if node == len(self._ids):
+            self._grow()
+        self._vectors[node], self._norms[node], self._ids[node] = vector, norm, id
+        level = int(-math.log(1.0 - self._rng.random()) / math.log(self.m))
+        self._links.append([np.empty(0, dtype=np.int64)] * (level + 1))
+        if self._entry is None:
+            self._entry = node
+            return node
+
+        top = len(self._links[self._entry]) - 1
+        entry = self._descend(vector, self._entry, level + 1)
+        entries = [entry]
+        for layer in range(min(level, top), -1, -1):
+            found = self._search_layer(vector, entries, self.ef_construction, layer)
+            neighbours = self._select_neighbours(found, self.m)
+            self._links[node][layer] = neighbours
+            limit = 2 * self.m if layer == 0 else self.m
+            for other in neighbours.tolist():
+                links = np.append(self._links[other][layer], node)
+                if len(links) > limit:
+                    # Keep the closest, the graph degree stays bounded
+                    closeness = self._vectors[links] @ self._vectors[other]
+                    links = links[np.argsort(-closeness)[:limit]]
+                self._links[other][layer] = links
+            entries = [other for _, other in found]
+        if level > top:
+            self._entry = node
+        return node
+
+    def _select_neighbours(self, found: list[tuple[float, int]], m: int) -> np.ndarray:
+        """Closest first, skipping nodes nearer to an already picked
+        neighbour than to the new node, so links spread in all directions"""
+        selected: list[int] = []
+        skipped: list[int] = []
+        for score, other in found:
+            if len(selected) == m:
+                break
+            if (
+                selected
+                and (self._vectors[selected] @ self._vectors[other]).max() > score
+            ):
+                skipped.append(other)
+            else:
+                selected.append(other)
+        # Top up with the closest skipped ones
+        selected += skipped[: m - len(selected)]
+        return np.array(selected, dtype=np.int64)
+
+    def _descend(self, vector: np.ndarray, entry: int, bottom: int) -> int:
+        """Greedy walk from the top layer down to layer `bottom`"""
+        for layer in range(len(self._links[entry]) - 1, bottom - 1, -1):
+            entry = self._search_layer(vector, [entry], 1, layer)[0][1]
+        return entry
+
+    def _search_layer(
+        self, vector: np.ndarray, entries: list[int], ef: int, layer: int
+    ) -> list[tuple[float, int]]:
+        """The `ef` nodes closest to `vector` on `layer`, best first"""
+        visited = set(entries)
+        closeness = (self._vectors[entries] @ vector).tolist()
+        # Max-heap of nodes to expand, min-heap of the best found so far
+        candidates = [(-score, node) for score, node in zip(closeness, entries)]
+        best = [(score, node) for score, node in zip(closeness, entries)]
+        heapq.heapify(candidates)
+        heapq.heapify(best)
+        while len(best) > ef:
+            heapq.heappop(best)
+
+        while candidates:
+            score, node = heapq.heappop(candidates)
+            if -score < best[0][0] and len(best) >= ef:
+                break
+            links = self._links[node]
+            if layer >= len(links):
+                continue
+            fresh = [other for other in links[layer].tolist() if other not in visited]
+            if not fresh:
+                continue
+            visited.update(fresh)
+            # One matmul per expanded node
+            for other_score, other in zip(
+                (self._vectors[fresh] @ vector).tolist(), fresh
+            ):
+                if len(best) < ef or other_score > best[0][0]:
+                    heapq.heappush(candidates, (-other_score, other))
+                    heapq.heappush(best, (other_score, other))
+                    if len(best) > ef:
+                        heapq.heappop(best)
+        return sorted(best, reverse=True)
+
+    def _grow(self) -> None:
+        capacity = 2 * len(self._ids)
+        vectors = np.zeros((capacity, self.size), dtype=np.float32)
+        vectors[: len(self._links)] = self._vectors[: len(self._links)]
+        self._vectors = vectors
+        self._norms = np.resize(self._norms, capacity)
+        self._ids = np.resize(self._ids, capacity)
+
+    def state(self) -> dict[str, np.ndarray]:
+        with self._lock:
+            count = len(self._links)
+            levels = np.array([len(links) for links in self._links], dtype=np.int64)
+            flat = [links for node_links in self._links for links in node_links]
+            return {
+                "params": np.array(
+                    [
+                        self.m,
+                        self.ef_construction,
+                        self.ef,
+                        -1 if self._entry is None else self._entry,
+                    ]
+                ),
+                "vectors": self._vectors[:count].copy(),
+                "norms": self._norms[:count].copy(),
+                "ids": self._ids[:count].copy(),
+                "levels": levels,
+                "link_counts": np.array([len(links) for links in flat], np.int64),
+                "links": np.concatenate(flat or [np.empty(0, np.int64)]).astype(
+                    np.int64
+                ),
+                "deleted": np.array(sorted(self._deleted), dtype=np.int64),
+            }
+
+    @classmethod
+    def from_state(cls, state: dict[str, np.ndarray]) -> "HNSWIndex":
+        m, ef_construction, ef, entry = state["params"].tolist()
+        vectors = state["vectors"]
+        index = cls(
+            vectors.shape[1],
+            m=m,
+            ef_construction=ef_construction,
+            ef=ef,
+            capacity=max(len(vectors), 1),
+        )
+        count = len(vectors)
+        index._vectors[:count] = vectors
+        index._norms[:count] = state["norms"]
+        index._ids[:count] = state["ids"]
+        links = np.split(state["links"], np.cumsum(state["link_counts"])[:-1])
+        start = 0
+        for level_count in state["levels"].tolist():
+            index._links.append(links[start : start + level_count])
+            start += level_count
+        index._deleted = set(state["deleted"].tolist())
+        index._nodes = {
+            id: node
+            for node, id in enumerate(state["ids"].tolist())
+            if node not in index._deleted
+        }
+        index._entry = None if entry < 0 else entry
+        return index
@@ -11,6 +11,30 @@ class BaseBackend(ABC):
     async def set(self, *, response: Any, key: str, ttl: int = 60) -> None:
         """Set"""
 
+    @abstractmethod
+    async def get_raw(self, *, key: str) -> bytes | None:
+        """Get bytes as stored"""
+
+    @abstractmethod
+    async def get_raw_many(self, *, keys: list[str]) -> list[bytes | None]:
+        """Get several bytes values in one round trip"""
+
+    @abstractmethod
+    async def set_raw(self, *, value: bytes, key: str, ttl: int = 60) -> None:
+        """Set bytes as is"""
+
+    @abstractmethod
+    async def set_raw_many(self, *, values: dict[str, bytes], ttl: int = 60) -> None:
+        """Set several bytes values in one round trip"""
+
+    @abstractmethod
+    async def delete(self, *, key: str) -> None:
+        """Delete"""
+
+    @abstractmethod
+    async def delete_many(self, *, keys: list[str]) -> None:
+        """Delete several keys in one round trip"""
+
     @abstractmethod
     async def delete_startswith(self, *, value: str) -> None:
         """Delete starts with"""
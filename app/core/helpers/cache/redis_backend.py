@@ -40,6 +40,27 @@ class RedisBackend(BaseBackend):
 
         await redis_client.set(name=key, value=response, ex=ttl)
 
+    async def get_raw(self, *, key: str) -> bytes | None:
+        return await redis_client.get(key)
+
+    async def get_raw_many(self, *, keys: list[str]) -> list[bytes | None]:
+        return await redis_client.mget(keys)
+
+    async def set_raw(self, *, value: bytes, key: str, ttl: int = 60) -> None:
+        await redis_client.set(name=key, value=value, ex=ttl)
+
+    async def set_raw_many(self, *, values: dict[str, bytes], ttl: int = 60) -> None:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for key, value in values.items():
+                pipe.set(name=key, value=value, ex=ttl)
+            await pipe.execute()
+
+    async def delete(self, *, key: str) -> None:
+        await redis_client.delete(key)
+
+    async def delete_many(self, *, keys: list[str]) -> None:
+        await redis_client.delete(*keys)
+
     async def delete_startswith(self, *, value: str) -> None:
         async for key in redis_client.scan_iter(f"{value}*"):
             await redis_client.delete(key)
@@ -0,0 +1,139 @@
+import time
+from collections import deque
+from enum import Enum
+from typing import Callable
+
+import numpy as np
+
+
+class CircuitState(Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Rolling-window circuit breaker.
+
+    Calls are kept for `window_seconds`. Once at least `min_calls` are in the
+    window, the breaker opens when the error rate or the slow-call rate reaches
+    `failure_rate`. After `reset_seconds` a single probe call is let through;
+    its outcome closes or re-opens the breaker. A probe that never reports back
+    is replaced by a new one after another `reset_seconds`.
+    """
+
+    def __init__(
+        self,
+        *,
+        window_seconds: float = 30,
+        min_calls: int = 20,
+        failure_rate: float = 0.5,
+        slow_call_seconds: float | None = None,
+        reset_seconds: float = 10,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        # (timestamp, latency, ok)
+        self._calls: deque[tuple[float, float | None, bool]] = deque()
+        self._state = CircuitState.CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        self._probe_started = 0.0
+
+    @property
+    def state(self) -> CircuitState:
+        if (
+            self._state == CircuitState.OPEN
+            and self.clock() - self._opened_at >= self.reset_seconds
+        ):
+            self._state = CircuitState.HALF_OPEN
+            self._probing = False
+        return self._state
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == CircuitState.CLOSED:
+            return True
+        if state != CircuitState.HALF_OPEN:
+            return False
+
+        now = self.clock()
+        if self._probing and now - self._probe_started < self.reset_seconds:
+            return False
+        self._probing = True
+        self._probe_started = now
+        return True
+
+    def record_success(self, latency: float) -> None:
+        self._record(latency, True)
+        if self._state == CircuitState.HALF_OPEN:
+            self._close()
+        elif self._should_open():
+            self._open()
+
+    def record_failure(self, latency: float | None = None) -> None:
+        self._record(latency, False)
+        if self._state == CircuitState.HALF_OPEN or self._should_open():
+            self._open()
+
+    def percentile(self, q: float) -> float | None:
+        """Latency percentile of successful calls in the window"""
+        self._evict()
+        latencies = [latency for _, latency, ok in self._calls if ok]
+        if not latencies:
+            return None
+        return float(np.percentile(latencies, q))
+
+    def stats(self) -> dict:
+        self._evict()
+        calls = len(self._calls)
+        failures = sum(1 for _, _, ok in self._calls if not ok)
+        return {
+            "state": self.state.value,
+            "calls": calls,
+            "error_rate": failures / calls if calls else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+        }
+
+    def _record(self, latency: float | None, ok: bool) -> None:
+        self._calls.append((self.clock(), latency, ok))
+        self._evict()
+
+    def _evict(self) -> None:
+        horizon = self.clock() - self.window_seconds
+        while self._calls and self._calls[0][0] < horizon:
+            self._calls.popleft()
+
+    def _should_open(self) -> bool:
+        calls = len(self._calls)
+        if calls < self.min_calls:
+            return False
+
+        failures = sum(1 for _, _, ok in self._calls if not ok)
+        if failures / calls >= self.failure_rate:
+            return True
+
+        if self.slow_call_seconds is None:
+            return False
+        slow = sum(
+            1
+            for _, latency, _ in self._calls
+            if latency is not None and latency >= self.slow_call_seconds
+        )
+        return slow / calls >= self.failure_rate
+
+    def _open(self) -> None:
+        self._state = CircuitState.OPEN
+        self._opened_at = self.clock()
+        self._probing = False
+
+    def _close(self) -> None:
+        self._state = CircuitState.CLOSED
+        self._calls.clear()
+        self._probing = False
@@ -0,0 +1,78 @@
+"""Byte-shuffle + zstd/lz4 for numeric blobs.
+
+Shuffling groups the n-th byte of every element together (all sign/exponent
+bytes, then all mantissa bytes), which is what makes float vectors
+compressible. `zstandard` and `lz4` are only imported when a codec needs
+them; check_codec() tells at startup whether the configured one can load.
+"""
+
+from importlib.util import find_spec
+
+import numpy as np
+
+CODECS = ("none", "zstd", "lz4", "shuffle-zstd", "shuffle-lz4")
+SHUFFLE_PREFIX = "shuffle-"
+MODULES = {"zstd": "zstandard", "lz4": "lz4"}
+
+
+def _compressor(codec: str) -> str:
+    return codec.removeprefix(SHUFFLE_PREFIX)
+
+
+def check_codec(codec: str) -> None:
+    """Raise ImportError if the package `codec` needs is not installed"""
+    if codec == "none":
+        return
+    module = MODULES[_compressor(codec)]
+    if find_spec(module) is None:
+        raise ImportError(f"codec {codec!r} needs {module!r}, which is not installed")
+
+
+def shuffle(data: bytes | memoryview, itemsize: int) -> bytes | memoryview:
+    if itemsize == 1:
+        return data
+    return np.frombuffer(data, dtype=np.uint8).reshape(-1, itemsize).T.tobytes()
+
+
+def unshuffle(data: bytes | memoryview, itemsize: int) -> bytes | memoryview:
+    if itemsize == 1:
+        return data
+    return np.frombuffer(data, dtype=np.uint8).reshape(itemsize, -1).T.tobytes()
+
+
+def compress(
+    data: bytes | memoryview, codec: str, *, itemsize: int = 1, level: int = 3
+) -> bytes | memoryview:
+    if codec == "none":
+        return data
+    if codec.startswith(SHUFFLE_PREFIX):
+        data = shuffle(data, itemsize)
+
+    if _compressor(codec) == "zstd":
+        import zstandard
+
+        return zstandard.ZstdCompressor(level=level).compress(data)
+
+    import lz4.frame
+
+    return lz4.frame.compress(data, compression_level=level)
+
+
+def decompress(
+    data: bytes | memoryview, codec: str, *, itemsize: int = 1
+) -> bytes | memoryview:
+    if codec == "none":
+        return data
+
+    if _compressor(codec) == "zstd":
+        import zstandard
+
+        data = zstandard.ZstdDecompressor().decompress(data)
+    else:
+        import lz4.frame
+
+        data = lz4.frame.decompress(data)
+
+    if codec.startswith(SHUFFLE_PREFIX):
+        data = unshuffle(data, itemsize)
+    return data
@@ -0,0 +1,45 @@
+import asyncio
+from typing import Awaitable, Callable, Sequence, TypeVar
+
+T = TypeVar("T")
+
+
+async def hedged(
+    attempts: Sequence[Callable[[], Awaitable[T]]],
+    *,
+    delay: float,
+) -> T:
+    """Run attempts[0], starting the next attempt every `delay` seconds it stays
+    unanswered (or right away when one fails). The first successful reply wins
+    and the rest are cancelled. If every attempt fails, the last error is raised.
+    """
+    pending: set[asyncio.Task] = set()
+    remaining = list(attempts)
+    error: BaseException | None = None
+
+    try:
+        while True:
+            if remaining and (not pending or error is not None):
+                pending.add(asyncio.ensure_future(remaining.pop(0)()))
+                error = None
+
+            done, pending = await asyncio.wait(
+                pending,
+                timeout=delay if remaining else None,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not done:
+                # Slow reply: hedge with the next attempt
+                pending.add(asyncio.ensure_future(remaining.pop(0)()))
+                continue
+
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+
+            if not pending and not remaining:
+                raise error
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,308 @@
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Awaitable, Callable
+from uuid import uuid4
+
+from redis import asyncio as redis
+from redis.exceptions import RedisError, ResponseError
+
+from app.core.exceptions import CustomException
+
+
+class JobStatus(Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    status: JobStatus
+    payload: dict = field(default_factory=dict)
+    result: dict | None = None
+    error_code: str | None = None
+    message: str | None = None
+    created_at: float = 0.0
+    updated_at: float = 0.0
+
+    @property
+    def done(self) -> bool:
+        return self.status in (JobStatus.SUCCEEDED, JobStatus.FAILED)
+
+
+class RedisJobQueue:
+    """Job queue on a Redis stream with a consumer group.
+
+    Each job is a hash (`{name}:job:{id}`) holding its status, payload and
+    result for `ttl` seconds; the stream only carries job ids. Workers read
+    with XREADGROUP, and jobs a crashed worker left unacknowledged for
+    `visibility_timeout` seconds are claimed by another one. While a handler
+    runs, its worker re-claims the job every third of that timeout, so only
+    jobs of dead workers go idle. A job can still run twice (a worker stalled
+    longer than the timeout, or one dying after the handler returned), so
+    handlers must be idempotent. Status changes are published on
+    `{name}:job:{id}:done` so `wait` can long-poll.
+    """
+
+    def __init__(
+        self,
+        redis: redis.Redis,
+        *,
+        name: str,
+        ttl: int = 3600,
+        block_ms: int = 1000,
+        visibility_timeout: float = 60,
+        max_backoff: float = 30,
+    ):
+        self.redis = redis
+        self.name = name
+        self.stream = f"{name}:stream"
+        self.group = f"{name}:workers"
+        self.ttl = ttl
+        self.block_ms = block_ms
+        self.visibility_timeout = visibility_timeout
+        self.max_backoff = max_backoff
+        self._workers: list[asyncio.Task] = []
+        self._closing = False
+        # (handler, workers) to start with the first enqueue, see start_on_enqueue
+        self._deferred: tuple | None = None
+
+    def _key(self, job_id: str) -> str:
+        return f"{self.name}:job:{job_id}"
+
+    def _channel(self, job_id: str) -> str:
+        return f"{self.name}:job:{job_id}:done"
+
+    async def enqueue(self, kind: str, payload: dict) -> Job:
+        now = time.time()
+        job = Job(
+            id=uuid4().hex,
+            kind=kind,
+            status=JobStatus.PENDING,
+            payload=payload,
+            created_at=now,
+            updated_at=now,
+        )
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(
+                self._key(job.id),
+                mapping={
+                    "kind": kind,
+                    "status": job.status.value,
+                    "payload": json.dumps(payload),
+                    "created_at": now,
+                    "updated_at": now,
+                },
+            )
+            pipe.expire(self._key(job.id), self.ttl)
+            pipe.xadd(self.stream, {"job_id": job.id})
+            await pipe.execute()
+        if self._deferred is not None and not self._workers:
+            handler, workers = self._deferred
+            self.start(handler, workers=workers)
+        return job
+
+    async def get(self, job_id: str) -> Job | None:
+        fields = await self.redis.hgetall(self._key(job_id))
+        if not fields:
+            return None
+        fields = {k.decode(): v.decode() for k, v in fields.items()}
+        return Job(
+            id=job_id,
+            kind=fields["kind"],
+            status=JobStatus(fields["status"]),
+            payload=json.loads(fields["payload"]),
+            result=json.loads(fields["result"]) if "result" in fields else None,
+            error_code=fields.get("error_code"),
+            message=fields.get("message"),
+            created_at=float(fields["created_at"]),
+            updated_at=float(fields["updated_at"]),
+        )
+
+    async def wait(self, job_id: str, *, timeout: float) -> Job | None:
+        """Return the job once it is done, or as it is after `timeout` seconds"""
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(self._channel(job_id))
+        try:
+            deadline = time.monotonic() + timeout
+            # Subscribed first, so a job finishing in between is not missed
+            job = await self.get(job_id)
+            while job is not None and not job.done:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                await pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=remaining
+                )
+                job = await self.get(job_id)
+            return job
+        finally:
+            await pubsub.unsubscribe()
+            await pubsub.aclose()
+
+    def start(
+        self, handler: Callable[[Job], Awaitable[dict | None]], *, workers: int
+    ) -> None:
+        self._closing = False
+        for index in range(workers):
+            self._workers.append(
+                asyncio.ensure_future(
+                    self.work(handler, consumer=f"{uuid4().hex}-{index}")
+                )
+            )
+
+    def start_on_enqueue(
+        self, handler: Callable[[Job], Awaitable[dict | None]], *, workers: int
+    ) -> None:
+        """Start the workers with the first job this process enqueues, for
+        queues that are rarely used"""
+        self._deferred = (handler, workers)
+
+    async def close(self) -> None:
+        # Redis clients may turn the cancellation into a connection error
+        self._closing = True
+        self._deferred = None
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+
+    async def work(
+        self, handler: Callable[[Job], Awaitable[dict | None]], *, consumer: str
+    ) -> None:
+        group_ready = False
+        backoff = self.block_ms / 1000
+        while not self._closing:
+            try:
+                if not group_ready:
+                    await self._ensure_group()
+                    group_ready = True
+                _, claimed, *_ = await self.redis.xautoclaim(
+                    self.stream,
+                    self.group,
+                    consumer,
+                    min_idle_time=int(self.visibility_timeout * 1000),
+                    count=1,
+                )
+                messages = claimed
+                if not messages:
+                    response = await self.redis.xreadgroup(
+                        self.group,
+                        consumer,
+                        {self.stream: ">"},
+                        count=1,
+                        block=self.block_ms,
+                    )
+                    messages = response[0][1] if response else []
+            except RedisError as e:
+                logging.warning(
+                    f"{self.name} worker cannot read jobs, retrying in {backoff:g}s: {e}"
+                )
+                if "NOGROUP" in str(e):
+                    # The stream or its group was deleted
+                    group_ready = False
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+            backoff = self.block_ms / 1000
+
+            for message_id, fields in messages:
+                if not fields:
+                    # Claimed after being deleted from the stream
+                    await self._ack(message_id)
+                    continue
+                try:
+                    await self._process(
+                        message_id, fields[b"job_id"].decode(), handler, consumer
+                    )
+                except RedisError as e:
+                    logging.warning(f"{self.name} worker cannot update jobs: {e}")
+
+    async def _ensure_group(self) -> None:
+        try:
+            await self.redis.xgroup_create(
+                self.stream, self.group, id="0", mkstream=True
+            )
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def _process(
+        self,
+        message_id: bytes,
+        job_id: str,
+        handler: Callable[[Job], Awaitable[dict | None]],
+        consumer: str,
+    ) -> None:
+        job = await self.get(job_id)
+        if job is None or job.done:
+            # Expired, or finished by a worker that died before acknowledging
+            await self._ack(message_id)
+            return
+
+        await self._update(job_id, {"status": JobStatus.RUNNING.value})
+        heartbeat = asyncio.ensure_future(self._heartbeat(message_id, consumer))
+        try:
+            result = await handler(job)
+        except asyncio.CancelledError:
+            # Left unacknowledged, another worker claims it
+            raise
+        except CustomException as e:
+            fields = {
+                "status": JobStatus.FAILED.value,
+                "error_code": e.error_code,
+                "message": e.message,
+            }
+        except Exception as e:
+            logging.exception(f"{self.name} job {job_id} failed")
+            fields = {
+                "status": JobStatus.FAILED.value,
+                "error_code": type(e).__name__,
+                "message": str(e),
+            }
+        else:
+            fields = {
+                "status": JobStatus.SUCCEEDED.value,
+                "result": json.dumps(result or {}),
+            }
+        finally:
+            heartbeat.cancel()
+
+        await self._update(job_id, fields)
+        await self._ack(message_id)
+        await self.redis.publish(self._channel(job_id), fields["status"])
+
+    async def _heartbeat(self, message_id: bytes, consumer: str) -> None:
+        """Reset the idle time of a running job, so no worker claims it"""
+        while True:
+            await asyncio.sleep(self.visibility_timeout / 3)
+            try:
+                await self.redis.xclaim(
+                    self.stream,
+                    self.group,
+                    consumer,
+                    min_idle_time=0,
+                    message_ids=[message_id],
+                    justid=True,
+                )
+            except RedisError as e:
+                logging.warning(f"{self.name} worker cannot extend a job: {e}")
+
+    async def _ack(self, message_id: bytes) -> None:
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.xack(self.stream, self.group, message_id)
+            pipe.xdel(self.stream, message_id)
+            await pipe.execute()
+
+    async def _update(self, job_id: str, fields: dict) -> None:
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self._key(job_id), mapping={**fields, "updated_at": time.time()})
+            pipe.expire(self._key(job_id), self.ttl)
+            await pipe.execute()
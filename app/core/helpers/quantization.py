@@ -0,0 +1,120 @@
+"""Lossy vector codes: int8 scalar quantization and product quantization.
+
+Every function takes a batch of row vectors (n, dims) and works on the whole
+batch at once, so dequantizing one vector or a thousand is the same call.
+"""
+
+import numpy as np
+
+INT8_LEVELS = 255
+
+
+def quantize_int8(vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Map each row linearly onto [-128, 127].
+
+    Returns the codes with the per-row `scale` and `offset` that undo it:
+    `vector ~= codes * scale + offset`.
+    """
+    vectors = np.atleast_2d(vectors).astype(np.float32)
+    low = vectors.min(axis=1)
+    high = vectors.max(axis=1)
+    scale = (high - low) / INT8_LEVELS
+    # A constant row only needs its offset
+    scale[scale == 0] = 1.0
+    offset = low + 128 * scale
+    codes = np.rint((vectors - offset[:, np.newaxis]) / scale[:, np.newaxis])
+    return np.clip(codes, -128, 127).astype(np.int8), scale, offset
+
+
+def dequantize_int8(
+    codes: np.ndarray,
+    scale: np.ndarray | float,
+    offset: np.ndarray | float,
+    dtype: np.dtype | str = np.float32,
+) -> np.ndarray:
+    codes = np.atleast_2d(codes)
+    scale = np.asarray(scale, dtype=np.float32).reshape(-1, 1)
+    offset = np.asarray(offset, dtype=np.float32).reshape(-1, 1)
+    return (codes.astype(np.float32) * scale + offset).astype(dtype)
+
+
+def _squared_distances(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    return (
+        np.einsum("ij,ij->i", vectors, vectors)[:, np.newaxis]
+        - 2 * vectors @ centroids.T
+        + np.einsum("ij,ij->i", centroids, centroids)[np.newaxis, :]
+    )
+
+
+def kmeans(
+    points: np.ndarray, clusters: int, *, iterations: int = 20, seed: int = 0
+) -> np.ndarray:
+    """Lloyd's k-means, (clusters, dims) means of `points`"""
+    points = np.atleast_2d(points).astype(np.float32)
+    count = len(points)
+    clusters = min(clusters, count)
+    rng = np.random.default_rng(seed)
+    means = points[rng.choice(count, clusters, replace=False)]
+    for _ in range(iterations):
+        assigned = _squared_distances(points, means).argmin(axis=1)
+        sums = np.zeros_like(means)
+        np.add.at(sums, assigned, points)
+        counts = np.bincount(assigned, minlength=clusters)
+        empty = counts == 0
+        means = sums / np.maximum(counts, 1)[:, np.newaxis]
+        # Restart empty clusters on random points
+        means[empty] = points[rng.choice(count, int(empty.sum()))]
+    return means
+
+
+def train_pq(
+    vectors: np.ndarray,
+    *,
+    subvectors: int,
+    centroids: int = 256,
+    iterations: int = 20,
+    seed: int = 0,
+) -> np.ndarray:
+    """k-means codebook per subspace, shaped (subvectors, centroids, dims / subvectors)"""
+    vectors = np.atleast_2d(vectors).astype(np.float32)
+    count, dims = vectors.shape
+    if dims % subvectors:
+        raise ValueError(f"{dims} dims do not split into {subvectors} subvectors")
+    if not 0 < centroids <= 256:
+        raise ValueError("PQ codes are one byte, centroids must be in 1..256")
+    centroids = min(centroids, count)
+
+    rng = np.random.default_rng(seed)
+    subspaces = vectors.reshape(count, subvectors, dims // subvectors)
+    codebook = np.empty((subvectors, centroids, dims // subvectors), dtype=np.float32)
+    for index in range(subvectors):
+        codebook[index] = kmeans(
+            subspaces[:, index],
+            centroids,
+            iterations=iterations,
+            seed=int(rng.integers(2**31)),
+        )
+    return codebook
+
+
+def encode_pq(vectors: np.ndarray, codebook: np.ndarray) -> np.ndarray:
+    """One byte per subvector: the index of its nearest centroid"""
+    subvectors, _, sub_dims = codebook.shape
+    vectors = np.atleast_2d(vectors).astype(np.float32)
+    subspaces = vectors.reshape(len(vectors), subvectors, sub_dims)
+    codes = np.empty((len(vectors), subvectors), dtype=np.uint8)
+    for index in range(subvectors):
+        codes[:, index] = _squared_distances(
+            subspaces[:, index], codebook[index]
+        ).argmin(axis=1)
+    return codes
+
+
+def decode_pq(
+    codes: np.ndarray, codebook: np.ndarray, dtype: np.dtype | str = np.float32
+) -> np.ndarray:
+    codes = np.atleast_2d(codes)
+    subvectors = codebook.shape[0]
+    # (n, subvectors, sub_dims) in one gather
+    vectors = codebook[np.arange(subvectors), codes]
+    return vectors.reshape(len(codes), -1).astype(dtype)
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import pickle
+import time
+from typing import Awaitable, Callable, Generic, TypeVar
+
+from redis import asyncio as redis
+from redis.exceptions import RedisError
+
+T = TypeVar("T")
+
+
+class SingleFlight(Generic[T]):
+    """Collapse concurrent calls that share a key into one.
+
+    The first caller starts `fn` in its own task and every caller that shows up
+    while it runs awaits the same task, so a caller going away never cancels the
+    work the others are waiting for.
+
+    With a `redis` client the call is also serialized across workers: the worker
+    holding the lock runs `fn` and publishes its result for `result_ttl`
+    seconds, and workers that queued behind it reuse that result instead of
+    running `fn` again. A result is only reused by callers that arrived before
+    it finished, so a later call always recomputes.
+    """
+
+    def __init__(
+        self,
+        *,
+        redis: redis.Redis | None = None,
+        prefix: str = "single_flight",
+        lock_timeout: float = 10,
+        result_ttl: int = 5,
+    ):
+        self.redis = redis
+        self.prefix = prefix
+        self.lock_timeout = lock_timeout
+        self.result_ttl = result_ttl
+        self._calls: dict[str, asyncio.Task] = {}
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._calls
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._call(key, fn))
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        return await asyncio.shield(task)
+
+    def _done(self, key: str, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Nobody may be left to await it
+        if not task.cancelled():
+            task.exception()
+
+    async def _call(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        if self.redis is None:
+            return await fn()
+
+        arrived_at = time.time()
+        lock = self.redis.lock(
+            f"{self.prefix}:lock:{key}",
+            timeout=self.lock_timeout,
+            blocking_timeout=self.lock_timeout,
+        )
+        try:
+            acquired = await lock.acquire()
+        except RedisError as e:
+            logging.warning(f"single flight lock for {key} unavailable: {e}")
+            return await fn()
+        if not acquired:
+            return await fn()
+
+        result_key = f"{self.prefix}:result:{key}"
+        try:
+            shared = await self.redis.get(result_key)
+            if shared is not None:
+                finished_at, result = pickle.loads(shared)
+                if finished_at >= arrived_at:
+                    return result
+
+            result = await fn()
+            await self.redis.set(
+                result_key, pickle.dumps((time.time(), result)), ex=self.result_ttl
+            )
+            return result
+        finally:
+            try:
+                await lock.release()
+            except RedisError:
+                # Expired while we were working, the next worker already has it
+                pass
@@ -0,0 +1,167 @@
+"""Exact top-k search over an in-memory float32 matrix."""
+
+import threading
+from typing import Iterable
+
+import numpy as np
+
+METRICS = ("cosine", "dot")
+
+
+def score_rows(
+    vectors: np.ndarray,
+    inverse_norms: np.ndarray | None,
+    query: np.ndarray,
+    metric: str,
+) -> np.ndarray:
+    """Scores of every row against `query`, as a new array. `inverse_norms`
+    is only read for cosine scores."""
+    if metric not in METRICS:
+        raise ValueError(f"metric must be one of {METRICS}")
+    scores = vectors @ query
+    if metric == "cosine":
+        scores *= inverse_norms
+        norm = float(np.linalg.norm(query))
+        if norm > 0:
+            scores /= norm
+    return scores
+
+
+def inverse_norms_of(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1)
+    return np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+
+
+def top_k(ids: np.ndarray, scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """The `k` best (id, score) pairs, best first, -inf scores dropped"""
+    k = min(k, len(ids))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    # O(n) selection, only the k winners get sorted
+    best = np.argpartition(-scores, k - 1)[:k]
+    best = best[np.argsort(-scores[best], kind="stable")]
+    best = best[np.isfinite(scores[best])]
+    return ids[best].copy(), scores[best]
+
+
+class VectorMatrix:
+    """Vectors of one size keyed by integer id, searched with one matmul.
+
+    Rows live in [0, count) of a preallocated matrix that doubles when full,
+    and a removed row is replaced by the last one, so a search always scans
+    one contiguous block. Inverse norms are kept per row for cosine scores.
+
+    Every method holds the same lock, search included: call them through
+    asyncio.to_thread so the scan does not block the event loop (numpy
+    releases the GIL for it).
+    """
+
+    # Per-query knobs search() takes, none for an exact scan
+    search_params: tuple[str, ...] = ()
+
+    def __init__(self, size: int, *, capacity: int = 1024):
+        self.size = size
+        self._vectors = np.zeros((capacity, size), dtype=np.float32)
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._inverse_norms = np.zeros(capacity, dtype=np.float32)
+        self._rows: dict[int, int] = {}
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, id: int) -> bool:
+        return id in self._rows
+
+    def ids(self) -> np.ndarray:
+        with self._lock:
+            return self._ids[: self._count].copy()
+
+    def get(self, id: int) -> np.ndarray | None:
+        with self._lock:
+            row = self._rows.get(id)
+            return None if row is None else self._vectors[row].copy()
+
+    def upsert(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        """Add or replace rows, the last one wins for an id given twice"""
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.size)
+        if len(ids) != len(np.unique(ids)):
+            _, last = np.unique(ids[::-1], return_index=True)
+            keep = np.sort(len(ids) - 1 - last)
+            ids, vectors = ids[keep], vectors[keep]
+        inverse_norms = inverse_norms_of(vectors)
+
+        with self._lock:
+            rows = np.empty(len(ids), dtype=np.int64)
+            for index, id in enumerate(ids.tolist()):
+                row = self._rows.get(id)
+                if row is None:
+                    if self._count == len(self._ids):
+                        self._grow()
+                    row = self._rows[id] = self._count
+                    self._ids[row] = id
+                    self._count += 1
+                rows[index] = row
+            self._vectors[rows] = vectors
+            self._inverse_norms[rows] = inverse_norms
+
+    def remove(self, ids: Iterable[int]) -> None:
+        with self._lock:
+            for id in ids:
+                row = self._rows.pop(int(id), None)
+                if row is None:
+                    continue
+                last = self._count - 1
+                if row != last:
+                    moved = int(self._ids[last])
+                    self._vectors[row] = self._vectors[last]
+                    self._ids[row] = moved
+                    self._inverse_norms[row] = self._inverse_norms[last]
+                    self._rows[moved] = row
+                self._count = last
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int,
+        *,
+        metric: str = "cosine",
+        exclude: Iterable[int] = (),
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Ids and scores of the `k` best rows, best first"""
+        query = np.asarray(query, dtype=np.float32).reshape(self.size)
+        with self._lock:
+            count = self._count
+            scores = score_rows(
+                self._vectors[:count], self._inverse_norms[:count], query, metric
+            )
+            for id in exclude:
+                row = self._rows.get(int(id))
+                if row is not None:
+                    scores[row] = -np.inf
+            return top_k(self._ids[:count], scores, k)
+
+    def state(self) -> dict[str, np.ndarray]:
+        """Arrays to np.savez, from_state() rebuilds the matrix from them"""
+        with self._lock:
+            return {
+                "ids": self._ids[: self._count].copy(),
+                "vectors": self._vectors[: self._count].copy(),
+            }
+
+    @classmethod
+    def from_state(cls, state: dict[str, np.ndarray]) -> "VectorMatrix":
+        vectors = state["vectors"]
+        matrix = cls(vectors.shape[1], capacity=max(len(vectors), 1))
+        matrix.upsert(state["ids"], vectors)
+        return matrix
+
+    def _grow(self) -> None:
+        capacity = 2 * len(self._ids)
+        vectors = np.zeros((capacity, self.size), dtype=np.float32)
+        vectors[: self._count] = self._vectors[: self._count]
+        self._vectors = vectors
+        self._ids = np.resize(self._ids, capacity)
+        self._inverse_norms = np.resize(self._inverse_norms, capacity)
@@ -0,0 +1,353 @@
+"""Read-only vector matrix in one memory-mapped file, shared by processes.
+
+Layout, every section starting on a page boundary:
+
+    header    magic + JSON (size, count, build id, section offsets, meta)
+    vectors   float32 (count, size), row order
+    norms     float32 (count,) inverse norms, for cosine scores
+    ids       int64 (count,) id of every row
+    sorted    int64 (count,) the ids sorted, then int64 (count,) their rows
+
+Processes opening the same file share one copy in the page cache. The
+id -> row index is the sorted section, searched with np.searchsorted, so it
+is shared as well instead of being a dict per process.
+
+A ShardPool fans a snapshot search out to processes that open the same
+file, one row range each: the scans run on as many cores as there are
+shards, and only the query and each shard's top-k cross a process boundary.
+"""
+
+import json
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable
+
+import numpy as np
+
+from app.core.helpers.vector_search import (
+    VectorMatrix,
+    inverse_norms_of,
+    score_rows,
+    top_k,
+)
+
+MAGIC = b"VSNAP001"
+ALIGN = 4096
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGN) * ALIGN
+
+
+class SnapshotWriter:
+    """Writes a snapshot chunk by chunk, only the ids are held in memory.
+
+    The file is written aside and renamed over `path` on close(), so readers
+    never see half of it; a failed write leaves `path` as it was.
+    """
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        self._temporary = f"{path}.{os.getpid()}.tmp"
+        self._file = open(self._temporary, "wb")
+        self._file.seek(ALIGN)
+        self._ids: list[np.ndarray] = []
+        self._inverse_norms: list[np.ndarray] = []
+
+    def __enter__(self) -> "SnapshotWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def append(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(
+            len(ids), self.size
+        )
+        self._file.write(vectors.tobytes())
+        self._ids.append(ids)
+        self._inverse_norms.append(inverse_norms_of(vectors))
+
+    def close(self, meta: dict | None = None) -> None:
+        ids = np.concatenate(self._ids or [np.empty(0, dtype=np.int64)])
+        inverse_norms = np.concatenate(
+            self._inverse_norms or [np.empty(0, dtype=np.float32)]
+        )
+        order = np.argsort(ids, kind="stable")
+        offsets = {}
+        for name, array in (
+            ("norms", inverse_norms),
+            ("ids", ids),
+            ("sorted", np.concatenate([ids[order], order.astype(np.int64)])),
+        ):
+            offsets[name] = _aligned(self._file.tell())
+            self._file.seek(offsets[name])
+            self._file.write(array.tobytes())
+
+        header = (
+            MAGIC
+            + json.dumps(
+                {
+                    "size": self.size,
+                    "count": len(ids),
+                    "build": uuid.uuid4().hex,
+                    "offsets": {"vectors": ALIGN, **offsets},
+                    "meta": meta or {},
+                }
+            ).encode()
+        )
+        if len(header) > ALIGN:
+            raise ValueError("snapshot meta does not fit in the header page")
+        self._file.seek(0)
+        self._file.write(header)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self._temporary, self.path)
+
+    def abort(self) -> None:
+        self._file.close()
+        os.remove(self._temporary)
+
+
+class VectorSnapshot:
+    """A snapshot file opened read-only with np.memmap"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as file:
+            head = file.read(ALIGN)
+        if not head.startswith(MAGIC):
+            raise ValueError(f"{path} is not a vector snapshot")
+        header = json.loads(head[len(MAGIC) :].rstrip(b"\0"))
+        self.size: int = header["size"]
+        # Tells this file from the next one written to the same path
+        self.build: str = header["build"]
+        self.meta: dict = header["meta"]
+        count = header["count"]
+        offsets = header["offsets"]
+
+        self.vectors = self._map(offsets["vectors"], np.float32, (count, self.size))
+        self.inverse_norms = self._map(offsets["norms"], np.float32, (count,))
+        self.ids = self._map(offsets["ids"], np.int64, (count,))
+        sorted_section = self._map(offsets["sorted"], np.int64, (2 * count,))
+        self._sorted_ids = sorted_section[:count]
+        self._sorted_rows = sorted_section[count:]
+
+    def _map(self, offset: int, dtype, shape: tuple) -> np.ndarray:
+        if not np.prod(shape):
+            # mmap cannot map zero bytes
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(self.path, dtype=dtype, mode="r", offset=offset, shape=shape)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, id: int) -> bool:
+        return bool(self.rows([id])[0] >= 0)
+
+    def rows(self, ids: Iterable[int]) -> np.ndarray:
+        """The row of every id, -1 for the ids not in the snapshot"""
+        ids = np.fromiter(ids, dtype=np.int64)
+        if not len(self):
+            return np.full(len(ids), -1, dtype=np.int64)
+        positions = np.searchsorted(self._sorted_ids, ids)
+        positions = np.minimum(positions, len(self) - 1)
+        found = self._sorted_ids[positions] == ids
+        return np.where(found, self._sorted_rows[positions], -1)
+
+    def get(self, id: int) -> np.ndarray | None:
+        row = int(self.rows([id])[0])
+        return None if row < 0 else np.array(self.vectors[row])
+
+
+# In every shard process, the snapshot it last opened per path
+_snapshots: dict[str, VectorSnapshot] = {}
+
+
+def _search_shard(
+    path: str,
+    build: str,
+    start: int,
+    end: int,
+    query: np.ndarray,
+    k: int,
+    metric: str,
+    excluded_rows: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray] | None:
+    """Rows and scores of the `k` best rows in [start, end), None if the
+    file at `path` is no longer the caller's snapshot"""
+    snapshot = _snapshots.get(path)
+    if snapshot is None or snapshot.build != build:
+        snapshot = _snapshots[path] = VectorSnapshot(path)
+        if snapshot.build != build:
+            return None
+    scores = score_rows(
+        snapshot.vectors[start:end], snapshot.inverse_norms[start:end], query, metric
+    )
+    scores[excluded_rows - start] = -np.inf
+    return top_k(np.arange(start, end), scores, k)
+
+
+class ShardPool:
+    """`shards` processes, each scanning one slice of every snapshot search.
+
+    Snapshots under `min_rows` rows are not worth the round trips, callers
+    scan those themselves.
+    """
+
+    def __init__(self, shards: int, *, min_rows: int = 10000):
+        self.shards = shards
+        self.min_rows = min_rows
+        # Not forked: the caller runs an event loop and threads
+        self._executor = ProcessPoolExecutor(
+            max_workers=shards, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def search(
+        self,
+        snapshot: VectorSnapshot,
+        query: np.ndarray,
+        k: int,
+        *,
+        metric: str = "cosine",
+        excluded_rows: np.ndarray | None = None,
+    ) -> tuple[np.ndarray, np.ndarray] | None:
+        """Ids and scores of the `k` best snapshot rows, best first. None
+        when the shards found a newer file at the snapshot's path."""
+        if not len(snapshot):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        if excluded_rows is None:
+            excluded_rows = np.empty(0, dtype=np.int64)
+        bounds = np.linspace(0, len(snapshot), self.shards + 1).astype(np.int64)
+        futures = [
+            self._executor.submit(
+                _search_shard,
+                snapshot.path,
+                snapshot.build,
+                start,
+                end,
+                query,
+                k,
+                metric,
+                excluded_rows[(excluded_rows >= start) & (excluded_rows < end)],
+            )
+            for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist())
+            if end > start
+        ]
+        found = [future.result() for future in futures]
+        if any(shard is None for shard in found):
+            return None
+        rows, scores = top_k(
+            np.concatenate([rows for rows, _ in found]),
+            np.concatenate([scores for _, scores in found]),
+            k,
+        )
+        return np.asarray(snapshot.ids)[rows], scores
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class SnapshotIndex:
+    """A snapshot plus an in-memory delta of the writes made since.
+
+    Upserted ids go to a small VectorMatrix and hide their snapshot row,
+    removed ids only hide it. A search scans both, the snapshot through
+    `pool` if there is one, and merges the two top-k.
+    Same interface as VectorMatrix, so it plugs in as a search index.
+    """
+
+    search_params: tuple[str, ...] = ()
+
+    def __init__(
+        self,
+        snapshot: VectorSnapshot,
+        *,
+        capacity: int = 1024,
+        pool: ShardPool | None = None,
+    ):
+        self.snapshot = snapshot
+        self.pool = pool
+        self.size = snapshot.size
+        self.delta = VectorMatrix(self.size, capacity=capacity)
+        # Snapshot rows replaced or removed since it was built
+        self._hidden: set[int] = set()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.snapshot) - len(self._hidden) + len(self.delta)
+
+    def __contains__(self, id: int) -> bool:
+        return id in self.delta or (id not in self._hidden and id in self.snapshot)
+
+    def ids(self) -> np.ndarray:
+        with self._lock:
+            hidden = np.fromiter(self._hidden, dtype=np.int64)
+        base = np.asarray(self.snapshot.ids)
+        return np.concatenate([base[~np.isin(base, hidden)], self.delta.ids()])
+
+    def get(self, id: int) -> np.ndarray | None:
+        vector = self.delta.get(id)
+        if vector is None and id not in self._hidden:
+            vector = self.snapshot.get(id)
+        return vector
+
+    def upsert(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        ids = np.asarray(ids, dtype=np.int64)
+        self.delta.upsert(ids, vectors)
+        self._hide(ids)
+
+    def remove(self, ids: Iterable[int]) -> None:
+        ids = np.fromiter(ids, dtype=np.int64)
+        self.delta.remove(ids.tolist())
+        self._hide(ids)
+
+    def _hide(self, ids: np.ndarray) -> None:
+        in_snapshot = ids[self.snapshot.rows(ids.tolist()) >= 0]
+        with self._lock:
+            self._hidden.update(in_snapshot.tolist())
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int,
+        *,
+        metric: str = "cosine",
+        exclude: Iterable[int] = (),
+    ) -> tuple[np.ndarray, np.ndarray]:
+        query = np.asarray(query, dtype=np.float32).reshape(self.size)
+        exclude = [int(id) for id in exclude]
+        with self._lock:
+            hidden = list(self._hidden)
+        rows = self.snapshot.rows(hidden + exclude)
+        excluded_rows = rows[rows >= 0]
+
+        found = None
+        if self.pool is not None and len(self.snapshot) >= self.pool.min_rows:
+            found = self.pool.search(
+                self.snapshot, query, k, metric=metric, excluded_rows=excluded_rows
+            )
+        if found is None:
+            scores = score_rows(
+                self.snapshot.vectors, self.snapshot.inverse_norms, query, metric
+            )
+            scores[excluded_rows] = -np.inf
+            found = top_k(np.asarray(self.snapshot.ids), scores, k)
+        base_ids, base_scores = found
+        delta_ids, delta_scores = self.delta.search(
+            query, k, metric=metric, exclude=exclude
+        )
+        return top_k(
+            np.concatenate([base_ids, delta_ids]),
+            np.concatenate([base_scores, delta_scores]),
+            k,
+        )
@@ -4,8 +4,9 @@ from pydantic import BaseModel, ConfigDict, Field
 
 
 class CreateUserFeatureDTO(BaseModel):
-    protocol: Literal["http", "http-octet", "grpc"] = Field(
-        default="http", description="http, http-octet or grpc"
+    protocol: Literal["http", "http-octet", "grpc", "auto"] = Field(
+        default="http",
+        description="http, http-octet, grpc or auto (fastest healthy protocol)",
     )
     size: int = Field(default=2048, description="Vector size : (1, size)")
     dtype: Literal["float16", "float32", "float64"] = Field(
@@ -13,6 +14,36 @@ class CreateUserFeatureDTO(BaseModel):
     )
 
 
+class UpdateUserFeatureDTO(CreateUserFeatureDTO):
+    force: bool = Field(
+        default=False,
+        description="Recompute even if the user's inputs have not changed",
+    )
+
+
+class TrainFeatureCodebookDTO(BaseModel):
+    size: int = Field(default=2048, description="Vector size the codebook is for")
+    subvectors: int = Field(
+        default=64, ge=1, description="Subvectors per vector (one code byte each)"
+    )
+    centroids: int = Field(
+        default=256, ge=1, le=256, description="Centroids per subvector"
+    )
+    sample: int = Field(
+        default=20000, ge=1, description="Latest stored vectors to train on"
+    )
+    iterations: int = Field(default=20, ge=1, description="k-means iterations")
+
+
+class ConvertFeatureByteorderDTO(BaseModel):
+    byteorder: Literal["big", "little"] = Field(
+        default="little", description="Byte order to rewrite stored vectors in"
+    )
+    batch_size: int = Field(
+        default=500, ge=1, le=10000, description="Rows converted per job"
+    )
+
+
 class GetUserFeatureDTO(BaseModel):
     user_vector: List[List[float]] = Field(default=None, description="Vector[n, dims]")
     size: int = Field(default=2048, description="Vector size : (1, size)")
@@ -0,0 +1,28 @@
+from sqlalchemy import Integer, LargeBinary
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.core.db.model import Base
+from app.core.db.timestamp_mixin import TimestampMixin
+
+
+class FeatureCodebook(Base, TimestampMixin):
+    """Product quantization centroids, immutable once trained"""
+
+    __tablename__ = "feature_codebook"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    size: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
+    subvectors: Mapped[int] = mapped_column(Integer, nullable=False)
+    centroids: Mapped[int] = mapped_column(Integer, nullable=False)
+    # >f4 array shaped (subvectors, centroids, size / subvectors)
+    codebook: Mapped[bytes] = mapped_column(
+        LargeBinary(length=2**24 - 1), nullable=False
+    )
+
+    @classmethod
+    def create(
+        cls, *, size: int, subvectors: int, centroids: int, codebook: bytes
+    ) -> "FeatureCodebook":
+        return cls(
+            size=size, subvectors=subvectors, centroids=centroids, codebook=codebook
+        )
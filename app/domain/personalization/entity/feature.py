@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from sqlalchemy import VARBINARY, ForeignKey, Integer, String
+from sqlalchemy import VARBINARY, Float, ForeignKey, Index, Integer, String
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.core.db.model import Base
@@ -11,21 +11,51 @@ from app.core.db.timestamp_mixin import TimestampMixin
 
 class UserFeature(Base, TimestampMixin):
     __tablename__ = "user_feature"
+    # Search indexes refresh from the rows written since their last look
+    __table_args__ = (Index("ix_user_feature_updated_at", "updated_at"),)
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
-    user_id: Mapped[int] = mapped_column(ForeignKey("user.id"))
+    # One feature per user, bulk imports upsert on it
+    user_id: Mapped[int] = mapped_column(ForeignKey("user.id"), unique=True, index=True)
     bvector: Mapped[bytes] = mapped_column(VARBINARY(32768), nullable=False)
     size: Mapped[int] = mapped_column(Integer, nullable=False)
     dtype: Mapped[str] = mapped_column(String(100), default="float16", nullable=False)
+    # sha256 of the embedding request the vector was computed from
+    fingerprint: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    # How bvector is stored: none (raw dtype), int8 or pq codes
+    quantization: Mapped[str] = mapped_column(
+        String(16), default="none", server_default="none", nullable=False
+    )
+    scale: Mapped[float | None] = mapped_column(Float, nullable=True)
+    offset: Mapped[float | None] = mapped_column(Float, nullable=True)
+    codebook_id: Mapped[int | None] = mapped_column(
+        ForeignKey("feature_codebook.id", name="fk_user_feature_codebook_id"),
+        nullable=True,
+    )
+    # Compression of bvector (after quantization), see app.core.helpers.compression
+    codec: Mapped[str] = mapped_column(
+        String(16), default="none", server_default="none", nullable=False
+    )
+    # Byte order of the float vector (or of what quantized codes decode to)
+    byteorder: Mapped[str] = mapped_column(
+        String(8), default="big", server_default="big", nullable=False
+    )
     user: Mapped["User"] = relationship(back_populates="feature")  # type: ignore
 
     @classmethod
     def create(
-        cls, *, user_id: int, bvector: bytes, size: int, dtype: str
+        cls,
+        *,
+        user_id: int,
+        bvector: bytes,
+        size: int,
+        dtype: str,
+        fingerprint: str | None = None,
     ) -> "UserFeature":
         return cls(
             user_id=user_id,
             size=size,
             bvector=bvector,
             dtype=dtype,
+            fingerprint=fingerprint,
         )
@@ -0,0 +1,59 @@
+import time
+
+import numpy as np
+from sqlalchemy import select
+
+from app.core.db.session import session, session_factory
+from app.core.repository import BaseRepo
+from app.domain.personalization.entity.codebook import FeatureCodebook
+
+# Codebooks never change once trained, so they are kept per process
+_codebooks: dict[int, np.ndarray] = {}
+# size -> (looked up at, latest codebook id)
+_latest_codebooks: dict[int, tuple[float, int | None]] = {}
+LATEST_CODEBOOK_TTL = 60
+
+
+def to_codebook_array(codebook: FeatureCodebook) -> np.ndarray:
+    return np.frombuffer(codebook.codebook, dtype=">f4").reshape(
+        codebook.subvectors, codebook.centroids, -1
+    )
+
+
+class FeatureCodebookRepository(BaseRepo[FeatureCodebook]):
+    def __init__(self, model: FeatureCodebook = FeatureCodebook):
+        super().__init__(model=model)
+
+    async def get_codebook(self, *, id: int) -> np.ndarray | None:
+        codebook = _codebooks.get(id)
+        if codebook is not None:
+            return codebook
+
+        row = await self.get_by_id(id=id)
+        if row is None:
+            return None
+        codebook = _codebooks[id] = to_codebook_array(row)
+        return codebook
+
+    async def get_latest_codebook_id(self, *, size: int) -> int | None:
+        looked_up_at, codebook_id = _latest_codebooks.get(size, (0.0, None))
+        if time.monotonic() - looked_up_at < LATEST_CODEBOOK_TTL:
+            return codebook_id
+
+        async with session_factory() as read_session:
+            result = await read_session.execute(
+                select(FeatureCodebook.id)
+                .where(FeatureCodebook.size == size)
+                .order_by(FeatureCodebook.id.desc())
+                .limit(1)
+            )
+            codebook_id = result.scalar()
+        _latest_codebooks[size] = (time.monotonic(), codebook_id)
+        return codebook_id
+
+    async def save(self, *, codebook: FeatureCodebook) -> FeatureCodebook:
+        session.add(codebook)
+        # The id is needed right away to report the new codebook
+        await session.flush()
+        _latest_codebooks.pop(codebook.size, None)
+        return codebook
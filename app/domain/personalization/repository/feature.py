@@ -1,16 +1,304 @@
+import logging
+import struct
 from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import AsyncIterator, NamedTuple
 
-from sqlalchemy import and_, delete, or_, select
+import numpy as np
+from sqlalchemy import and_, delete, func, or_, select, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
 
 from app.core.db.session import session, session_factory
 from app.core.helpers.cache import Cache, CacheTag
+from app.core.helpers.compression import CODECS, compress, decompress
+from app.core.helpers.quantization import (
+    decode_pq,
+    dequantize_int8,
+    encode_pq,
+    quantize_int8,
+)
 from app.core.repository import BaseRepo
 from app.domain.personalization.entity.feature import UserFeature
+from app.domain.personalization.repository.codebook import FeatureCodebookRepository
+
+FEATURE_DTYPES = ("float16", "float32", "float64")
+FEATURE_QUANTIZATIONS = ("none", "int8", "pq")
+FEATURE_DTYPE_CODES = {"float16": "f2", "float32": "f4", "float64": "f8"}
+FEATURE_BYTEORDERS = ("big", "little")
+# size, dtype index, codec index, byteorder index
+FEATURE_BYTES_HEADER = struct.Struct(">IBBB")
+# Bumped whenever FEATURE_BYTES_HEADER changes
+FEATURE_BYTES_KEY = "get_feature_bytes_by_user_id:v3:user_id:{user_id}"
+
+
+def feature_numpy_dtype(dtype: str, byteorder: str | None = "big") -> str:
+    """numpy dtype string, rows from before byte order markers are big-endian"""
+    prefix = "<" if byteorder == "little" else ">"
+    return f"{prefix}{FEATURE_DTYPE_CODES[dtype]}"
+
+
+class UserFeatureBytes(NamedTuple):
+    bvector: bytes | memoryview
+    size: int
+    dtype: str
+    # bvector is compressed with this codec, "none" for plain dtype bytes
+    codec: str = "none"
+    byteorder: str = "big"
+
+
+def pack_feature_bytes(feature: UserFeatureBytes) -> bytes:
+    header = FEATURE_BYTES_HEADER.pack(
+        feature.size,
+        FEATURE_DTYPES.index(feature.dtype),
+        CODECS.index(feature.codec),
+        FEATURE_BYTEORDERS.index(feature.byteorder),
+    )
+    return header + feature.bvector
+
+
+def unpack_feature_bytes(raw: bytes) -> UserFeatureBytes:
+    """Slices the cached value, the vector is not copied"""
+    view = memoryview(raw)
+    size, dtype, codec, byteorder = FEATURE_BYTES_HEADER.unpack_from(view)
+    return UserFeatureBytes(
+        bvector=view[FEATURE_BYTES_HEADER.size :],
+        size=size,
+        dtype=FEATURE_DTYPES[dtype],
+        codec=CODECS[codec],
+        byteorder=FEATURE_BYTEORDERS[byteorder],
+    )
+
+
+def decompress_feature_bytes(feature: UserFeatureBytes) -> UserFeatureBytes:
+    if feature.codec == "none":
+        return feature
+    return feature._replace(
+        bvector=decompress(
+            feature.bvector,
+            feature.codec,
+            itemsize=int(FEATURE_DTYPE_CODES[feature.dtype][1]),
+        ),
+        codec="none",
+    )
+
+
+def swap_feature_bytes(feature: UserFeatureBytes, byteorder: str) -> UserFeatureBytes:
+    if feature.byteorder == byteorder:
+        return feature
+    feature = decompress_feature_bytes(feature)
+    return feature._replace(
+        bvector=np.frombuffer(
+            feature.bvector, dtype=feature_numpy_dtype(feature.dtype, feature.byteorder)
+        )
+        .astype(feature_numpy_dtype(feature.dtype, byteorder))
+        .tobytes(),
+        byteorder=byteorder,
+    )
+
+
+def stack_feature_bytes(
+    features: list[UserFeatureBytes | None],
+    *,
+    dtype: str | None = None,
+    byteorder: str = "big",
+) -> tuple[np.ndarray, np.ndarray]:
+    """One (n, size) matrix of uncompressed features, zeros where None.
+
+    Returns it with the mask of rows that had a feature. Features stored
+    alike are joined and converted in one call, not row by row. `dtype`
+    defaults to the widest stored one.
+    """
+    present = np.array([feature is not None for feature in features], dtype=bool)
+    found = [feature for feature in features if feature is not None]
+    sizes = {feature.size for feature in found}
+    if len(sizes) > 1:
+        raise ValueError(f"features of different sizes {sorted(sizes)}")
+    size = sizes.pop() if sizes else 0
+    if dtype is None:
+        dtype = max(
+            (feature.dtype for feature in found),
+            key=FEATURE_DTYPES.index,
+            default="float32",
+        )
+
+    matrix = np.zeros(
+        (len(features), size), dtype=feature_numpy_dtype(dtype, byteorder)
+    )
+    rows = np.flatnonzero(present)
+    groups: dict[tuple[str, str], list[int]] = {}
+    for index, feature in enumerate(found):
+        groups.setdefault((feature.dtype, feature.byteorder), []).append(index)
+    for (stored_dtype, stored_byteorder), indexes in groups.items():
+        block = np.frombuffer(
+            b"".join(found[index].bvector for index in indexes),
+            dtype=feature_numpy_dtype(stored_dtype, stored_byteorder),
+        ).reshape(len(indexes), size)
+        # Assignment converts dtype and byte order on the way in
+        matrix[rows[indexes]] = block
+    return matrix, present
+
+
+STORED_FEATURE_COLUMNS = (
+    UserFeature.bvector,
+    UserFeature.size,
+    UserFeature.dtype,
+    UserFeature.quantization,
+    UserFeature.scale,
+    UserFeature.offset,
+    UserFeature.codebook_id,
+    UserFeature.codec,
+    UserFeature.byteorder,
+)
 
 
 class UserFeatureRepository(BaseRepo[UserFeature]):
-    def __init__(self, model: UserFeature = UserFeature):
+    """User features, quantized and then compressed on write according to
+    `quantization` and `codec`, in `byteorder`.
+
+    Vectors come in and entities go out as big-endian `dtype` bytes, whatever
+    the row's storage mode. Only get_feature_bytes_by_user_id hands out the
+    stored byte order, or the stored compressed bytes, for callers that can
+    pass them on as they are.
+    """
+
+    def __init__(
+        self,
+        model: UserFeature = UserFeature,
+        *,
+        quantization: str = "none",
+        codec: str = "none",
+        codec_level: int = 3,
+        byteorder: str = "big",
+        codebook_repository: FeatureCodebookRepository | None = None,
+    ):
         super().__init__(model=model)
+        self.quantization = quantization
+        self.codec = codec
+        self.codec_level = codec_level
+        self.byteorder = byteorder
+        self.codebook_repository = codebook_repository or FeatureCodebookRepository()
+
+    async def encode_vector(self, *, bvector: bytes, size: int, dtype: str) -> dict:
+        """Storage columns for a big-endian vector under the repository's modes"""
+        vectors = np.frombuffer(bvector, dtype=feature_numpy_dtype(dtype))
+        return (
+            await self.encode_vectors(vectors=vectors.reshape(1, size), dtype=dtype)
+        )[0]
+
+    async def encode_vectors(self, *, vectors: np.ndarray, dtype: str) -> list[dict]:
+        """Storage columns for each row of (n, size) `vectors` kept as `dtype`.
+
+        The rows are quantized (or converted) as one batch, only compression
+        runs per row.
+        """
+        count, size = vectors.shape
+        quantization, codebook_id = self.quantization, None
+        if quantization == "pq":
+            codebook_id = await self.codebook_repository.get_latest_codebook_id(
+                size=size
+            )
+            if codebook_id is None:
+                logging.warning(f"No PQ codebook for size {size}, storing int8")
+                quantization = "int8"
+
+        scale = offset = [None] * count
+        if quantization == "none":
+            codes = vectors.astype(feature_numpy_dtype(dtype, self.byteorder))
+        elif quantization == "int8":
+            codes, scale, offset = quantize_int8(vectors)
+            scale, offset = scale.tolist(), offset.tolist()
+        else:
+            codebook = await self.codebook_repository.get_codebook(id=codebook_id)
+            codes = encode_pq(vectors, codebook)
+
+        itemsize = self._itemsize(quantization, dtype)
+        rows = []
+        for index, code in enumerate(codes):
+            bvector, codec = code.tobytes(), "none"
+            if self.codec != "none":
+                compressed = compress(
+                    bvector, self.codec, itemsize=itemsize, level=self.codec_level
+                )
+                # Noise-like vectors may not compress at all
+                if len(compressed) < len(bvector):
+                    bvector, codec = compressed, self.codec
+            rows.append(
+                {
+                    "bvector": bvector,
+                    "quantization": quantization,
+                    "scale": scale[index],
+                    "offset": offset[index],
+                    "codebook_id": codebook_id,
+                    "codec": codec,
+                    # Quantized rows only dequantize into this order
+                    "byteorder": self.byteorder,
+                }
+            )
+        return rows
+
+    @staticmethod
+    def _itemsize(quantization: str | None, dtype: str) -> int:
+        if quantization in (None, "none"):
+            return int(FEATURE_DTYPE_CODES[dtype][1])
+        # int8 and pq codes are single bytes
+        return 1
+
+    async def decode_vector(
+        self, row, *, byteorder: str | None = None
+    ) -> bytes | memoryview:
+        """Plain `dtype` bytes of a row (or entity) in any storage mode.
+
+        In the row's byte order unless `byteorder` is given.
+        """
+        byteorder = byteorder or row.byteorder or "big"
+        bvector = row.bvector
+        if row.codec not in (None, "none"):
+            bvector = decompress(
+                bvector, row.codec, itemsize=self._itemsize(row.quantization, row.dtype)
+            )
+        dtype = feature_numpy_dtype(row.dtype, byteorder)
+        if row.quantization in (None, "none"):
+            if (row.byteorder or "big") == byteorder:
+                return bvector
+            return (
+                np.frombuffer(
+                    bvector, dtype=feature_numpy_dtype(row.dtype, row.byteorder)
+                )
+                .astype(dtype)
+                .tobytes()
+            )
+
+        if row.quantization == "int8":
+            vector = dequantize_int8(
+                np.frombuffer(bvector, dtype=np.int8), row.scale, row.offset, dtype
+            )
+        else:
+            codebook = await self.codebook_repository.get_codebook(id=row.codebook_id)
+            vector = decode_pq(np.frombuffer(bvector, dtype=np.uint8), codebook, dtype)
+        return vector.tobytes()
+
+    async def _decoded(self, user_feature: UserFeature) -> UserFeature:
+        stored_as_is = (None, "none")
+        if (
+            user_feature.quantization in stored_as_is
+            and user_feature.codec in stored_as_is
+            and user_feature.byteorder in (None, "big")
+        ):
+            return user_feature
+        # A detached copy, the loaded row itself is never modified
+        return UserFeature(
+            id=user_feature.id,
+            user_id=user_feature.user_id,
+            bvector=await self.decode_vector(user_feature, byteorder="big"),
+            size=user_feature.size,
+            dtype=user_feature.dtype,
+            fingerprint=user_feature.fingerprint,
+            quantization="none",
+            codec="none",
+            byteorder="big",
+            created_at=user_feature.created_at,
+            updated_at=user_feature.updated_at,
+        )
 
     async def get_user_features(
         self,
@@ -44,15 +332,306 @@ class UserFeatureRepository(BaseRepo[UserFeature]):
                 select(UserFeature).where(UserFeature.user_id == user_id)
             )
             user_feature = stmt.scalars().first()
+        if user_feature is not None:
+            user_feature = await self._decoded(user_feature)
 
         await Cache.backend.set(
             response=user_feature, key=f"get_feature_by_user_id:user_id:{str(user_id)}"
         )
         return user_feature
 
+    async def get_feature_bytes_by_user_id(
+        self,
+        *,
+        user_id: int,
+        dtype: str | None = None,
+        codecs: tuple[str, ...] = (),
+        byteorder: str | None = None,
+    ) -> UserFeatureBytes | None:
+        """Vector bytes without loading (or unpickling) the entity.
+
+        With `dtype` the stored vector is converted and the result cached
+        under its own key, next to the stored bytes. The bytes are in the
+        stored byte order unless `byteorder` is given, and a vector stored
+        with one of `codecs` is returned still compressed.
+        """
+        key = FEATURE_BYTES_KEY.format(user_id=user_id)
+        converted = None
+        if dtype is None:
+            cached = await Cache.backend.get_raw(key=key)
+        else:
+            converted, cached = await Cache.backend.get_raw_many(
+                keys=[f"{key}:dtype:{dtype}", key]
+            )
+
+        if converted:
+            feature = unpack_feature_bytes(converted)
+        elif cached:
+            feature = unpack_feature_bytes(cached)
+        else:
+            async with session_factory() as read_session:
+                stmt = await read_session.execute(
+                    select(*STORED_FEATURE_COLUMNS).where(
+                        UserFeature.user_id == user_id
+                    )
+                )
+                row = stmt.first()
+            if row is None:
+                return None
+
+            feature = await self._to_feature_bytes(row)
+            await Cache.backend.set_raw(value=pack_feature_bytes(feature), key=key)
+
+        if dtype is not None and dtype != feature.dtype:
+            feature = decompress_feature_bytes(feature)
+            feature = feature._replace(
+                bvector=np.frombuffer(
+                    feature.bvector,
+                    dtype=feature_numpy_dtype(feature.dtype, feature.byteorder),
+                )
+                .astype(feature_numpy_dtype(dtype, feature.byteorder))
+                .tobytes(),
+                dtype=dtype,
+            )
+            await Cache.backend.set_raw(
+                value=pack_feature_bytes(feature), key=f"{key}:dtype:{dtype}"
+            )
+
+        if byteorder is not None and byteorder != feature.byteorder:
+            return swap_feature_bytes(feature, byteorder)
+        if feature.codec in codecs:
+            return feature
+        return decompress_feature_bytes(feature)
+
+    async def get_feature_bytes_by_user_ids(
+        self, *, user_ids: list[int]
+    ) -> dict[int, UserFeatureBytes]:
+        """Uncompressed bytes, in the stored byte order, of the users that
+        have a feature.
+
+        One MGET for the cached vectors, a single IN query for the rest and
+        one pipelined write to cache what the query found.
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        cached = await Cache.backend.get_raw_many(
+            keys=[FEATURE_BYTES_KEY.format(user_id=user_id) for user_id in user_ids]
+        )
+        features = {
+            user_id: unpack_feature_bytes(raw)
+            for user_id, raw in zip(user_ids, cached, strict=True)
+            if raw
+        }
+
+        misses = [user_id for user_id in user_ids if user_id not in features]
+        if misses:
+            async with session_factory() as read_session:
+                stmt = await read_session.execute(
+                    select(UserFeature.user_id, *STORED_FEATURE_COLUMNS).where(
+                        UserFeature.user_id.in_(misses)
+                    )
+                )
+                rows = stmt.all()
+            loaded = {row.user_id: await self._to_feature_bytes(row) for row in rows}
+            if loaded:
+                await Cache.backend.set_raw_many(
+                    values={
+                        FEATURE_BYTES_KEY.format(user_id=user_id): pack_feature_bytes(
+                            feature
+                        )
+                        for user_id, feature in loaded.items()
+                    }
+                )
+            features.update(loaded)
+
+        return {
+            user_id: decompress_feature_bytes(feature)
+            for user_id, feature in features.items()
+        }
+
+    async def stream_features(
+        self,
+        *,
+        size: int | None,
+        after: int = 0,
+        chunk_size: int = 2000,
+        updated_since: datetime | None = None,
+    ) -> AsyncIterator[tuple[list[int], list[int], list[UserFeatureBytes]]]:
+        """Features of `size` (any size with None) with an id above `after`,
+        in id order, as chunks of (ids, user_ids, uncompressed features).
+
+        Rows come through a server-side cursor, so only one chunk is held at
+        a time. Keyset order means the last id of a chunk resumes right after
+        it. `updated_since` keeps the rows written at or after that time.
+        """
+        query = (
+            select(UserFeature.id, UserFeature.user_id, *STORED_FEATURE_COLUMNS)
+            .where(UserFeature.id > after)
+            .order_by(UserFeature.id)
+            .execution_options(yield_per=chunk_size)
+        )
+        if size is not None:
+            query = query.where(UserFeature.size == size)
+        if updated_since is not None:
+            query = query.where(UserFeature.updated_at >= updated_since)
+        async with session_factory() as read_session:
+            result = await read_session.stream(query)
+            async for rows in result.partitions():
+                yield (
+                    [row.id for row in rows],
+                    [row.user_id for row in rows],
+                    [
+                        decompress_feature_bytes(await self._to_feature_bytes(row))
+                        for row in rows
+                    ],
+                )
+
+    async def get_latest_update(self) -> datetime | None:
+        async with session_factory() as read_session:
+            result = await read_session.execute(
+                select(func.max(UserFeature.updated_at))
+            )
+        return result.scalar()
+
+    async def get_feature_user_ids(self, *, size: int) -> list[int]:
+        async with session_factory() as read_session:
+            result = await read_session.execute(
+                select(UserFeature.user_id).where(UserFeature.size == size)
+            )
+        return list(result.scalars().all())
+
+    async def _to_feature_bytes(self, row) -> UserFeatureBytes:
+        """What the bytes cache holds for a stored row"""
+        if row.quantization == "none":
+            # Cached as stored, compressed or not
+            return UserFeatureBytes(
+                bvector=row.bvector,
+                size=row.size,
+                dtype=row.dtype,
+                codec=row.codec,
+                byteorder=row.byteorder,
+            )
+        return UserFeatureBytes(
+            bvector=await self.decode_vector(row),
+            size=row.size,
+            dtype=row.dtype,
+            byteorder=row.byteorder,
+        )
+
+    async def invalidate_feature_cache(self, *, user_id: int) -> None:
+        await self.invalidate_feature_caches(user_ids=[user_id])
+
+    async def invalidate_feature_caches(self, *, user_ids: list[int]) -> None:
+        keys = []
+        for user_id in user_ids:
+            key = FEATURE_BYTES_KEY.format(user_id=user_id)
+            keys += [
+                f"get_feature_by_user_id:user_id:{str(user_id)}",
+                key,
+                *(f"{key}:dtype:{dtype}" for dtype in FEATURE_DTYPES),
+            ]
+        if keys:
+            await Cache.backend.delete_many(keys=keys)
+
+    async def get_feature_vectors(self, *, size: int, limit: int) -> np.ndarray:
+        """The latest `limit` stored vectors of `size`, as float32 rows"""
+        async with session_factory() as read_session:
+            stmt = await read_session.execute(
+                select(*STORED_FEATURE_COLUMNS)
+                .where(UserFeature.size == size)
+                .order_by(UserFeature.id.desc())
+                .limit(limit)
+            )
+            rows = stmt.all()
+
+        vectors = np.empty((len(rows), size), dtype=np.float32)
+        for index, row in enumerate(rows):
+            vectors[index] = np.frombuffer(
+                await self.decode_vector(row),
+                dtype=feature_numpy_dtype(row.dtype, row.byteorder),
+            )
+        return vectors
+
     async def save(self, *, user_feature: UserFeature) -> UserFeature:
+        columns = await self.encode_vector(
+            bvector=user_feature.bvector,
+            size=user_feature.size,
+            dtype=user_feature.dtype,
+        )
+        for name, value in columns.items():
+            setattr(user_feature, name, value)
         session.add(user_feature)
 
+    async def update_by_id(self, id: int, params: dict) -> None:
+        if "bvector" in params:
+            params = {
+                **params,
+                **await self.encode_vector(
+                    bvector=params["bvector"],
+                    size=params["size"],
+                    dtype=params["dtype"],
+                ),
+            }
+        await super().update_by_id(id=id, params=params)
+
+    async def upsert_features(
+        self, *, user_ids: np.ndarray, vectors: np.ndarray, dtype: str
+    ) -> None:
+        """Insert the features of `user_ids`, replacing the existing ones, in
+        one INSERT ... ON DUPLICATE KEY UPDATE"""
+        if not len(user_ids):
+            return
+        size = vectors.shape[1]
+        rows = await self.encode_vectors(vectors=vectors, dtype=dtype)
+        stmt = mysql_insert(UserFeature).values(
+            [
+                # No embedding request behind an imported vector
+                {"user_id": user_id, "size": size, "dtype": dtype, "fingerprint": None}
+                | row
+                for user_id, row in zip(user_ids.tolist(), rows, strict=True)
+            ]
+        )
+        await session.execute(
+            stmt.on_duplicate_key_update(
+                size=stmt.inserted.size,
+                dtype=stmt.inserted.dtype,
+                fingerprint=stmt.inserted.fingerprint,
+                **{
+                    column.key: stmt.inserted[column.key]
+                    for column in STORED_FEATURE_COLUMNS
+                    if column.key not in ("size", "dtype")
+                },
+                updated_at=func.now(),
+            )
+        )
+
+    async def convert_byteorder(self, *, byteorder: str, limit: int) -> list[int]:
+        """Rewrite up to `limit` rows stored in the other byte order.
+
+        Rows being written meanwhile are skipped, their writer stores them in
+        its own byte order. Returns the user ids of the converted rows.
+        """
+        result = await session.execute(
+            select(UserFeature.id, UserFeature.user_id, *STORED_FEATURE_COLUMNS)
+            .where(UserFeature.byteorder != byteorder)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        rows = result.all()
+        for row in rows:
+            params = {"byteorder": byteorder}
+            if row.quantization == "none":
+                itemsize = self._itemsize(row.quantization, row.dtype)
+                params["bvector"] = compress(
+                    await self.decode_vector(row, byteorder=byteorder),
+                    row.codec,
+                    itemsize=itemsize,
+                    level=self.codec_level,
+                )
+            await session.execute(
+                update(UserFeature).where(UserFeature.id == row.id).values(**params)
+            )
+        return [row.user_id for row in rows]
+
     async def delete_feature_by_user_id(self, *, user_id: int) -> UserFeature | None:
         query = delete(self.model).where(self.model.user_id == user_id)
         return await session.execute(query)
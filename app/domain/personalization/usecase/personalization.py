@@ -1,27 +1,91 @@
 from abc import ABC, abstractmethod
+from typing import AsyncIterator
+
+import numpy as np
 
 from app.domain.personalization.dto.feature import (
+    ConvertFeatureByteorderDTO,
     CreateUserFeatureDTO,
     GetUserFeatureDTO,
+    TrainFeatureCodebookDTO,
+    UpdateUserFeatureDTO,
 )
+from app.domain.personalization.repository.feature import UserFeatureBytes
 
 
 class PersonalizationUseCase(ABC):
     @abstractmethod
-    async def get_user_feature(
+    async def get_user_feature_vector(
         self,
         *,
         user_id: int | str,
-    ) -> GetUserFeatureDTO:
-        """Get User Feature"""
+        dtype: str | None,
+    ) -> dict:
+        """Get User Feature as numpy"""
+
+    @abstractmethod
+    async def get_user_feature_bytes(
+        self,
+        *,
+        user_id: int | str,
+        dtype: str | None,
+        codecs: tuple[str, ...],
+        byteorder: str | None,
+    ) -> UserFeatureBytes:
+        """Get User Feature Bytes"""
+
+    @abstractmethod
+    async def get_user_feature_matrix(
+        self,
+        *,
+        user_ids: list[int],
+        dtype: str | None,
+        byteorder: str,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Get User Features as One Matrix"""
 
     @abstractmethod
-    async def get_user_feature_binary(
+    async def score_candidates(
         self,
         *,
         user_id: int | str,
-    ) -> bytes:
-        """Get User Feature"""
+        user_ids: list[int],
+        metric: str,
+        byteorder: str,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Score Candidate Users Against a User"""
+
+    @abstractmethod
+    def export_user_features(
+        self,
+        *,
+        size: int,
+        dtype: str,
+        cursor: int,
+        chunk_size: int,
+    ) -> AsyncIterator[tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """Stream Stored User Features in Chunks"""
+
+    @abstractmethod
+    async def import_user_features(
+        self,
+        *,
+        chunks: AsyncIterator[tuple[np.ndarray, np.ndarray]],
+        dtype: str,
+    ) -> dict:
+        """Upsert Precomputed User Features in Bulk"""
+
+    @abstractmethod
+    async def get_similar_users(
+        self,
+        *,
+        user_id: int | str,
+        k: int,
+        metric: str,
+        nprobe: int | None = None,
+        ef: int | None = None,
+    ) -> dict:
+        """Get Users with the Most Similar Features"""
 
     @abstractmethod
     async def create_user_feature(
@@ -38,11 +102,49 @@ class PersonalizationUseCase(ABC):
         self,
         *,
         user_id: int | str,
-        command: CreateUserFeatureDTO,
+        command: UpdateUserFeatureDTO,
         return_binary: bool,
+        force: bool,
     ) -> GetUserFeatureDTO | bytes:
         """Update User Feature"""
 
+    @abstractmethod
+    async def submit_user_feature_job(
+        self,
+        *,
+        user_id: int | str,
+        op: str,
+        command: CreateUserFeatureDTO,
+    ) -> dict:
+        """Queue User Feature Create/Update"""
+
+    @abstractmethod
+    async def get_user_feature_job(
+        self,
+        *,
+        user_id: int | str,
+        job_id: str,
+        wait: float,
+    ) -> dict:
+        """Get User Feature Job"""
+
+    @abstractmethod
+    async def submit_feature_byteorder_job(
+        self,
+        *,
+        user_id: int | str,
+        command: ConvertFeatureByteorderDTO,
+    ) -> dict:
+        """Queue Stored User Feature Byte Order Conversion"""
+
+    @abstractmethod
+    async def train_feature_codebook(self, *, command: TrainFeatureCodebookDTO) -> dict:
+        """Train a PQ Codebook on Stored User Features"""
+
+    @abstractmethod
+    async def get_embedding_stats(self) -> dict:
+        """Get Embedding Protocol Stats"""
+
     @abstractmethod
     async def delete_user_feature(
         self,
@@ -80,6 +80,13 @@ class UserRepository(BaseRepo[User]):
 
         return result.scalars().all()
 
+    async def get_existing_ids(self, *, ids: list[int]) -> set[int]:
+        if not ids:
+            return set()
+        async with session_factory() as read_session:
+            result = await read_session.execute(select(User.id).where(User.id.in_(ids)))
+        return set(result.scalars().all())
+
     async def get_user_by_email_or_nickname(
         self,
         *,
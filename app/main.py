@@ -1,4 +1,5 @@
 from contextlib import asynccontextmanager
+from functools import partial
 
 from fastapi import FastAPI, Request
 from fastapi.exceptions import RequestValidationError
@@ -9,7 +10,14 @@ from starlette.exceptions import HTTPException
 
 import app.core.exceptions as exceptions
 from app.application import auth_router_v1, personalization_router_v1, user_router_v1
-from app.application.personalization.v1.proto.client import get_embedding_channel_stub
+from app.application.personalization.v1.formats import check_formats
+from app.application.personalization.v1.http.client import get_embedding_http_client
+from app.application.personalization.v1.proto.client import (
+    get_embedding_channel_pool,
+    get_embedding_client,
+)
+from app.application.personalization.v1.search import feature_index
+from app.application.personalization.v1.service import feature_jobs, handle_feature_job
 from app.core.configs import config
 from app.core.fastapi.middlewares import (
     AuthBackend,
@@ -19,6 +27,8 @@ from app.core.fastapi.middlewares import (
 )
 from app.core.helpers.cache import Cache, CustomKeyMaker, RedisBackend
 from app.core.helpers.cache.base import BaseBackend, BaseKeyMaker
+from app.core.helpers.compression import check_codec
+from app.domain.personalization.repository.feature import UserFeatureRepository
 
 
 def init_routers(app_: FastAPI) -> None:
@@ -84,16 +94,54 @@ def make_middleware() -> list[Middleware]:
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    print("🔗 Opening gRPC channel...")
-    embedding_channel, embedding_stub = get_embedding_channel_stub()
+    # Fail now rather than on the first feature write or request
+    check_codec(config.FEATURE_CODEC)
+    check_formats()
+
+    print("🔗 Opening gRPC channels...")
+    embedding_channel = get_embedding_channel_pool()
+    await embedding_channel.connect(timeout=config.EMBEDDING_GRPC_CONNECT_TIMEOUT)
+    embedding_stub = embedding_channel
+    embedding_client = get_embedding_client(embedding_stub)
+    if embedding_client is not None:
+        await embedding_client.start()
+        embedding_stub = embedding_client
 
     # grpc channel, stub 저장
     app.state.embedding_channel = embedding_channel
     app.state.embedding_stub = embedding_stub
 
+    print("🔗 Opening embedding HTTP client...")
+    app.state.embedding_http_client = get_embedding_http_client()
+
+    if config.FEATURE_JOB_WORKERS > 0:
+        handler = partial(handle_feature_job, app.state)
+        if config.FEATURE_COMPUTE_MODE == "async":
+            print("👷 Starting feature job workers...")
+            feature_jobs.start(handler, workers=config.FEATURE_JOB_WORKERS)
+        else:
+            # Only admin byte order conversions are queued: one worker, started
+            # by the first of them
+            feature_jobs.start_on_enqueue(handler, workers=1)
+
+    if feature_index.enabled:
+        print("🔎 Loading feature search index...")
+        feature_index.start(UserFeatureRepository())
+
     yield
 
-    print("🔌 Closing gRPC channel...")
+    await feature_index.close()
+
+    print("👷 Stopping feature job workers...")
+    await feature_jobs.close()
+
+    print("🔌 Closing embedding HTTP client...")
+    await app.state.embedding_http_client.aclose()
+
+    if embedding_client is not None:
+        await embedding_client.close()
+
+    print("🔌 Closing gRPC channels...")
     await embedding_channel.close()
 
 
@@ -0,0 +1,99 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+import grpc
+import pytest
+
+from app.application.personalization.v1.proto.batcher import EmbeddingBatcher
+from app.application.personalization.v1.proto.embedding_pb2 import (
+    EmbeddingUserRequest,
+    EmbeddingUserResponse,
+    EmbeddingUsersResponse,
+)
+
+
+def make_stub():
+    stub = AsyncMock()
+
+    async def embedding_users(request, **kwargs):
+        return EmbeddingUsersResponse(
+            bvectors=[r.email.encode() for r in request.requests]
+        )
+
+    async def embedding_user(request, **kwargs):
+        return EmbeddingUserResponse(bvector=request.email.encode())
+
+    stub.EmbeddingUsers.side_effect = embedding_users
+    stub.EmbeddingUser.side_effect = embedding_user
+    return stub
+
+
+@pytest.mark.asyncio
+async def test_batcher_coalesces_concurrent_requests():
+    # Given
+    stub = make_stub()
+    batcher = EmbeddingBatcher(stub, max_batch_size=3, max_wait_ms=1000)
+    requests = [EmbeddingUserRequest(email=f"{i}@id.e") for i in range(3)]
+
+    # When
+    responses = await asyncio.gather(*(batcher.EmbeddingUser(r) for r in requests))
+
+    # Then
+    stub.EmbeddingUsers.assert_awaited_once()
+    stub.EmbeddingUser.assert_not_awaited()
+    assert [r.bvector for r in responses] == [b"0@id.e", b"1@id.e", b"2@id.e"]
+
+
+@pytest.mark.asyncio
+async def test_batcher_flushes_partial_batch_after_wait():
+    # Given
+    stub = make_stub()
+    batcher = EmbeddingBatcher(stub, max_batch_size=32, max_wait_ms=1)
+    requests = [EmbeddingUserRequest(email=f"{i}@id.e") for i in range(2)]
+
+    # When
+    responses = await asyncio.gather(*(batcher.EmbeddingUser(r) for r in requests))
+
+    # Then
+    stub.EmbeddingUsers.assert_awaited_once()
+    assert [r.bvector for r in responses] == [b"0@id.e", b"1@id.e"]
+
+
+@pytest.mark.asyncio
+async def test_batcher_propagates_rpc_error_to_every_caller():
+    # Given
+    stub = make_stub()
+    stub.EmbeddingUsers.side_effect = grpc.aio.AioRpcError(
+        grpc.StatusCode.UNAVAILABLE, None, None, details="down"
+    )
+    batcher = EmbeddingBatcher(stub, max_batch_size=2, max_wait_ms=1000)
+    requests = [EmbeddingUserRequest(email=f"{i}@id.e") for i in range(2)]
+
+    # When
+    results = await asyncio.gather(
+        *(batcher.EmbeddingUser(r) for r in requests), return_exceptions=True
+    )
+
+    # Then
+    assert all(isinstance(r, grpc.aio.AioRpcError) for r in results)
+
+
+@pytest.mark.asyncio
+async def test_batcher_falls_back_to_unary_when_unimplemented():
+    # Given
+    stub = make_stub()
+    stub.EmbeddingUsers.side_effect = grpc.aio.AioRpcError(
+        grpc.StatusCode.UNIMPLEMENTED, None, None
+    )
+    batcher = EmbeddingBatcher(stub, max_batch_size=2, max_wait_ms=1000)
+    requests = [EmbeddingUserRequest(email=f"{i}@id.e") for i in range(2)]
+
+    # When
+    responses = await asyncio.gather(*(batcher.EmbeddingUser(r) for r in requests))
+    await batcher.EmbeddingUser(EmbeddingUserRequest(email="2@id.e"))
+
+    # Then
+    assert batcher.batch_supported is False
+    assert [r.bvector for r in responses] == [b"0@id.e", b"1@id.e"]
+    assert stub.EmbeddingUsers.await_count == 1
+    assert stub.EmbeddingUser.await_count == 3
@@ -0,0 +1,31 @@
+import pytest
+
+from app.application.personalization.v1.proto.client import EmbeddingChannelPool
+
+
+@pytest.mark.asyncio
+async def test_channel_pool_round_robins_stubs():
+    # Given
+    pool = EmbeddingChannelPool("localhost:1", size=3)
+
+    # When
+    picked = [pool.stub for _ in range(6)]
+    await pool.close()
+
+    # Then
+    assert len(pool.channels) == 3
+    assert picked[:3] == pool.stubs
+    assert picked[3:] == pool.stubs
+
+
+@pytest.mark.asyncio
+async def test_channel_pool_connect_times_out_without_server():
+    # Given
+    pool = EmbeddingChannelPool("localhost:1", size=2)
+
+    # When
+    ready = await pool.connect(timeout=0.05)
+    await pool.close()
+
+    # Then
+    assert ready is False
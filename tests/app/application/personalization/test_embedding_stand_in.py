@@ -0,0 +1,101 @@
+import httpx
+import pytest
+import pytest_asyncio
+
+from app.application.personalization.v1.exception import (
+    EmbeddingException,
+    EmbeddingGrpcException,
+)
+from app.application.personalization.v1.proto.client import EmbeddingChannelPool
+from app.application.personalization.v1.schema.request import UserEmbeddingRequest
+from app.application.personalization.v1.service import PersonalizationService
+from app.core.configs import config
+from traffic_test.embedding_server import (
+    EmbeddingStandIn,
+    create_app,
+    start_grpc_server,
+)
+
+command = UserEmbeddingRequest(
+    size=8,
+    dtype="float32",
+    email="stand-in@id.e",
+    nickname="stand-in",
+    favorite="coding",
+)
+
+
+@pytest_asyncio.fixture
+async def transports(monkeypatch):
+    async def open_transports(stand_in: EmbeddingStandIn) -> dict:
+        server, port = await start_grpc_server(stand_in)
+        opened.append(server)
+        pool = EmbeddingChannelPool(f"127.0.0.1:{port}")
+        opened.append(pool)
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=create_app(stand_in))
+        )
+        opened.append(client)
+        return {"stub": pool, "client": client}
+
+    opened = []
+    monkeypatch.setattr(config, "EMBEDDING_URL", "http://embedding-stand-in")
+    yield open_transports
+    for resource in reversed(opened):
+        if isinstance(resource, httpx.AsyncClient):
+            await resource.aclose()
+        elif isinstance(resource, EmbeddingChannelPool):
+            await resource.close()
+        else:
+            await resource.stop(grace=None)
+
+
+@pytest.mark.asyncio
+async def test_stand_in_serves_same_vector_on_every_protocol(transports):
+    # Given
+    kwargs = await transports(EmbeddingStandIn())
+
+    # When
+    results = {
+        protocol: await PersonalizationService._get_embedding(
+            user_id=1, protocol=protocol, command=command, **kwargs
+        )
+        for protocol in ("http", "http-octet", "grpc")
+    }
+
+    # Then
+    assert len({result.bvector for result in results.values()}) == 1
+    assert len(results["grpc"].user_vector[0]) == command.size
+    assert results["http"].user_vector == results["grpc"].user_vector
+
+
+@pytest.mark.asyncio
+async def test_stand_in_injects_errors(transports):
+    # Given
+    kwargs = await transports(EmbeddingStandIn(error_rate=1.0))
+
+    # When, Then
+    with pytest.raises(EmbeddingException):
+        await PersonalizationService._get_embedding(
+            user_id=1, protocol="http-octet", command=command, **kwargs
+        )
+    with pytest.raises(EmbeddingGrpcException):
+        await PersonalizationService._get_embedding(
+            user_id=1, protocol="grpc", command=command, **kwargs
+        )
+
+
+@pytest.mark.asyncio
+async def test_stand_in_replays_recorded_vectors(tmp_path):
+    # Given
+    record_path = str(tmp_path / "vectors.jsonl")
+    recorder = EmbeddingStandIn(seed=7, record_path=record_path)
+    recorded = await recorder.embed(command.model_dump())
+
+    # When
+    replayer = EmbeddingStandIn(replay_path=record_path)
+    replayed = await replayer.embed(command.model_dump())
+
+    # Then
+    assert replayed == recorded
+    assert recorded != EmbeddingStandIn().vector(command.model_dump())
@@ -0,0 +1,112 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import grpc
+import pytest
+
+from app.application.personalization.v1.proto.embedding_pb2 import (
+    EmbeddingUserRequest,
+    EmbeddingUserResponse,
+    EmbeddingUserStreamResponse,
+)
+from app.application.personalization.v1.proto.stream import EmbeddingStream
+
+
+class FakeStreamCall:
+    def __init__(self, requests, fail_after: int | None = None):
+        self.requests = requests
+        self.fail_after = fail_after
+
+    async def wait_for_connection(self):
+        pass
+
+    def cancel(self):
+        pass
+
+    def __aiter__(self):
+        return self._responses()
+
+    async def _responses(self):
+        served = 0
+        async for message in self.requests:
+            if self.fail_after is not None and served >= self.fail_after:
+                raise grpc.aio.AioRpcError(
+                    grpc.StatusCode.UNAVAILABLE,
+                    grpc.aio.Metadata(),
+                    grpc.aio.Metadata(),
+                )
+            served += 1
+            yield EmbeddingUserStreamResponse(
+                request_id=message.request_id,
+                bvector=message.request.email.encode(),
+            )
+
+
+def make_stub(fail_after: int | None = None):
+    stub = MagicMock()
+    stub.EmbeddingUserStream.side_effect = lambda requests: FakeStreamCall(
+        requests, fail_after=fail_after
+    )
+    stub.EmbeddingUser = AsyncMock(
+        side_effect=lambda request, **kwargs: EmbeddingUserResponse(
+            bvector=b"unary:" + request.email.encode()
+        )
+    )
+    return stub
+
+
+async def wait_connected(stream: EmbeddingStream):
+    for _ in range(100):
+        if stream.connected:
+            return
+        await asyncio.sleep(0.001)
+    raise AssertionError("stream did not connect")
+
+
+@pytest.mark.asyncio
+async def test_stream_matches_responses_by_correlation_id():
+    # Given
+    stub = make_stub()
+    stream = EmbeddingStream(stub)
+    await stream.start()
+    await wait_connected(stream)
+    requests = [EmbeddingUserRequest(email=f"{i}@id.e") for i in range(5)]
+
+    # When
+    responses = await asyncio.gather(*(stream.EmbeddingUser(r) for r in requests))
+    await stream.close()
+
+    # Then
+    stub.EmbeddingUser.assert_not_awaited()
+    assert [r.bvector for r in responses] == [f"{i}@id.e".encode() for i in range(5)]
+
+
+@pytest.mark.asyncio
+async def test_stream_uses_unary_before_connecting():
+    # Given
+    stub = make_stub()
+    stream = EmbeddingStream(stub)
+
+    # When
+    response = await stream.EmbeddingUser(EmbeddingUserRequest(email="a@id.e"))
+
+    # Then
+    assert response.bvector == b"unary:a@id.e"
+
+
+@pytest.mark.asyncio
+async def test_stream_falls_back_to_unary_when_stream_breaks():
+    # Given
+    stub = make_stub(fail_after=0)
+    stream = EmbeddingStream(stub, backoff_ms=1, max_backoff_ms=1)
+    await stream.start()
+    await wait_connected(stream)
+
+    # When
+    response = await stream.EmbeddingUser(EmbeddingUserRequest(email="a@id.e"))
+    await wait_connected(stream)
+    await stream.close()
+
+    # Then
+    assert response.bvector == b"unary:a@id.e"
+    assert stub.EmbeddingUserStream.call_count >= 2
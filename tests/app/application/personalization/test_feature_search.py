@@ -0,0 +1,244 @@
+from datetime import datetime
+from unittest.mock import AsyncMock
+
+import numpy as np
+import pytest
+
+from app.application.personalization.v1.exception import (
+    FeatureIndexNotReadyException,
+    FeatureSearchDisabledException,
+)
+from app.application.personalization.v1.search import FeatureSearchIndex
+from app.application.personalization.v1.service import PersonalizationService
+from app.domain.personalization.repository.feature import (
+    UserFeatureBytes,
+    UserFeatureRepository,
+)
+from app.domain.user.repository.user import UserRepository
+
+
+def make_feature(vector: np.ndarray) -> UserFeatureBytes:
+    return UserFeatureBytes(
+        bvector=vector.astype(">f2").tobytes(), size=len(vector), dtype="float16"
+    )
+
+
+def make_repository(*chunks) -> AsyncMock:
+    repository = AsyncMock(spec=UserFeatureRepository)
+    repository.get_latest_update.return_value = datetime(2026, 1, 1)
+
+    async def stream_features(**kwargs):
+        for user_ids, features in chunks:
+            yield list(range(len(user_ids))), user_ids, features
+
+    repository.stream_features.side_effect = stream_features
+    return repository
+
+
+@pytest.mark.asyncio
+async def test_feature_index_loads_then_applies_updates():
+    # Given
+    vectors = np.eye(4, dtype=np.float32)
+    index = FeatureSearchIndex(size=4)
+    await index.load(
+        make_repository(([1, 2, 3], [make_feature(vector) for vector in vectors[:3]]))
+    )
+    updates = make_repository(
+        (
+            [2, 3, 4],
+            [
+                make_feature(vectors[3]),
+                # Rewritten with another size
+                make_feature(np.ones(8)),
+                make_feature(vectors[0]),
+            ],
+        )
+    )
+
+    # When
+    changed = await index.refresh(updates)
+    ids, scores = await index.search(vectors[3], 2)
+
+    # Then
+    assert changed == 3
+    assert updates.stream_features.call_args.kwargs["updated_since"] == datetime(
+        2026, 1, 1
+    )
+    assert 3 not in index.index
+    assert ids.tolist()[0] == 2
+    assert scores[0] == pytest.approx(1.0)
+
+
+@pytest.mark.asyncio
+async def test_similar_users_excludes_the_caller():
+    # Given
+    vectors = np.eye(4, dtype=np.float32) + 0.1
+    index = FeatureSearchIndex(size=4)
+    await index.load(
+        make_repository(([1, 2, 3, 4], [make_feature(vector) for vector in vectors]))
+    )
+    repository = AsyncMock(spec=UserFeatureRepository)
+    repository.get_feature_bytes_by_user_id.return_value = UserFeatureBytes(
+        bvector=vectors[0].astype(">f4").tobytes(), size=4, dtype="float32"
+    )
+    service = PersonalizationService(
+        user_feature_repository=repository,
+        user_repository=AsyncMock(spec=UserRepository),
+        feature_index=index,
+    )
+
+    # When
+    response = await service.get_similar_users(user_id=1, k=2)
+
+    # Then
+    assert len(response.users) == 2
+    assert 1 not in [user.user_id for user in response.users]
+
+
+@pytest.mark.asyncio
+async def test_search_before_the_first_load_is_not_ready():
+    # When / Then
+    with pytest.raises(FeatureIndexNotReadyException):
+        await FeatureSearchIndex(size=4).search(np.ones(4), 1)
+
+
+def test_shards_need_the_mmap_index():
+    # When / Then
+    with pytest.raises(ValueError, match="mmap"):
+        FeatureSearchIndex(size=4, kind="hnsw", shards=4)
+    assert FeatureSearchIndex(size=4, kind="mmap", shards=4).shards == 4
+
+
+@pytest.mark.asyncio
+async def test_search_of_a_disabled_index_is_not_found():
+    # When / Then
+    with pytest.raises(FeatureSearchDisabledException):
+        await FeatureSearchIndex(size=4, enabled=False).search(np.ones(4), 1)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("kind", ["flat", "ivf", "hnsw"])
+async def test_saved_index_is_restored(tmp_path, kind):
+    # Given
+    vectors = np.random.default_rng(0).standard_normal((50, 4)).astype(np.float32)
+    path = str(tmp_path / "index.npz")
+    params = {"lists": 4} if kind == "ivf" else {}
+    index = FeatureSearchIndex(size=4, kind=kind, params=params, path=path)
+    await index.load(
+        make_repository((list(range(50)), [make_feature(v) for v in vectors]))
+    )
+    expected, _ = await index.search(vectors[0], 5)
+
+    # When
+    restored = FeatureSearchIndex(size=4, kind=kind, params=params, path=path)
+    is_restored = await restored.restore()
+    ids, _ = await restored.search(vectors[0], 5)
+
+    # Then
+    assert is_restored
+    assert restored._watermark == datetime(2026, 1, 1)
+    assert ids.tolist() == expected.tolist()
+
+
+@pytest.mark.asyncio
+async def test_refresh_swaps_in_a_retrained_ivf_index():
+    # Given
+    vectors = np.random.default_rng(0).standard_normal((40, 4)).astype(np.float32)
+    index = FeatureSearchIndex(size=4, kind="ivf", params={"lists": 16})
+    await index.load(make_repository(([1], [make_feature(vectors[0])])))
+    for user_id in range(2, 41):
+        await index.upsert(user_id, vectors[user_id - 1])
+    outgrown = index.index
+
+    # When
+    await index.refresh(make_repository())
+
+    # Then
+    assert len(outgrown.centroids) == 1
+    assert index.index is not outgrown
+    assert len(index.index.centroids) == 16
+    assert len(index.index) == 40
+
+
+@pytest.mark.asyncio
+async def test_under_trained_ivf_index_is_not_saved(tmp_path):
+    # Given
+    vectors = np.random.default_rng(0).standard_normal((10, 4)).astype(np.float32)
+    path = tmp_path / "index.npz"
+    index = FeatureSearchIndex(size=4, kind="ivf", params={"lists": 16}, path=str(path))
+
+    # When
+    await index.load(
+        make_repository((list(range(10)), [make_feature(v) for v in vectors]))
+    )
+
+    # Then
+    assert index.index.under_trained
+    assert not path.exists()
+
+
+@pytest.mark.asyncio
+async def test_index_of_another_kind_is_not_restored(tmp_path):
+    # Given
+    path = str(tmp_path / "index.npz")
+    index = FeatureSearchIndex(size=4, path=path)
+    await index.load(make_repository(([1], [make_feature(np.ones(4))])))
+
+    # When / Then
+    assert not await FeatureSearchIndex(size=4, kind="hnsw", path=path).restore()
+
+
+@pytest.mark.asyncio
+async def test_resync_drops_deleted_rows_and_compacts():
+    # Given
+    vectors = np.random.default_rng(0).standard_normal((8, 4)).astype(np.float32)
+    index = FeatureSearchIndex(size=4, kind="hnsw")
+    await index.load(
+        make_repository((list(range(8)), [make_feature(v) for v in vectors]))
+    )
+    repository = make_repository()
+    repository.get_feature_user_ids.return_value = [0, 1, 2, 3, 4]
+
+    # When
+    await index.resync(repository)
+
+    # Then
+    assert sorted(index.index.ids().tolist()) == [0, 1, 2, 3, 4]
+    assert index.index.tombstones == 0
+
+
+@pytest.mark.asyncio
+async def test_written_feature_is_indexed_at_once():
+    # Given
+    index = FeatureSearchIndex(size=4)
+    await index.load(make_repository(([1], [make_feature(np.ones(4))])))
+
+    # When
+    await index.upsert(2, np.array([1, 0, 0, 0], dtype=">f4"))
+    await index.upsert(1, np.ones(8, dtype=">f4"))
+
+    # Then
+    assert 2 in index.index
+    assert 1 not in index.index
+
+
+@pytest.mark.asyncio
+async def test_workers_share_one_snapshot(tmp_path):
+    # Given
+    vectors = np.eye(4, dtype=np.float32)
+    path = str(tmp_path / "features.snapshot")
+    builder = make_repository(([1, 2, 3], [make_feature(v) for v in vectors[:3]]))
+    await FeatureSearchIndex(size=4, kind="mmap", path=path).load(builder)
+    worker = FeatureSearchIndex(size=4, kind="mmap", path=path)
+    repository = make_repository(([4], [make_feature(vectors[3])]))
+
+    # When
+    await worker.load(repository)
+    await worker.refresh(repository)
+    ids, _ = await worker.search(vectors[3], 1)
+
+    # Then
+    assert builder.stream_features.call_count == 1
+    assert worker._watermark == datetime(2026, 1, 1)
+    assert len(worker.index.snapshot) == 3
+    assert ids.tolist() == [4]
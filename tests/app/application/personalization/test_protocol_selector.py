@@ -0,0 +1,80 @@
+import pytest
+
+from app.application.personalization.v1 import selector as selector_module
+from app.application.personalization.v1.selector import ProtocolSelector
+from app.core.helpers.circuit_breaker import CircuitBreaker
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers(monkeypatch):
+    breakers = {
+        protocol: CircuitBreaker(min_calls=1, failure_rate=0.5)
+        for protocol in ("http", "http-octet", "grpc")
+    }
+    monkeypatch.setattr(selector_module, "embedding_breakers", breakers)
+    return breakers
+
+
+def warm_up(selector: ProtocolSelector, latencies: dict[str, float]):
+    for protocol, latency in latencies.items():
+        for _ in range(selector.min_samples):
+            selector.record(
+                protocol=protocol,
+                size=2048,
+                dtype="float16",
+                latency=latency,
+                nbytes=4096,
+            )
+
+
+def test_selector_tries_cold_protocols_first():
+    # Given
+    selector = ProtocolSelector(min_samples=2, explore_rate=0)
+    warm_up(selector, {"http": 0.01, "grpc": 0.01})
+
+    # When
+    chosen = selector.choose(size=2048, dtype="float16")
+
+    # Then
+    assert chosen == "http-octet"
+
+
+def test_selector_picks_fastest_protocol_per_bucket():
+    # Given
+    selector = ProtocolSelector(min_samples=2, explore_rate=0)
+    warm_up(selector, {"http": 0.03, "http-octet": 0.02, "grpc": 0.01})
+
+    # When
+    chosen = selector.choose(size=2048, dtype="float16")
+    other_bucket = selector.choose(size=4096, dtype="float16")
+
+    # Then
+    assert chosen == "grpc"
+    assert other_bucket == "http"
+
+
+def test_selector_skips_open_breaker(fresh_breakers):
+    # Given
+    selector = ProtocolSelector(min_samples=2, explore_rate=0)
+    warm_up(selector, {"http": 0.03, "http-octet": 0.02, "grpc": 0.01})
+    fresh_breakers["grpc"].record_failure()
+
+    # When
+    chosen = selector.choose(size=2048, dtype="float16")
+
+    # Then
+    assert chosen == "http-octet"
+
+
+def test_selector_respects_available_protocols():
+    # Given
+    selector = ProtocolSelector(min_samples=2, explore_rate=0)
+    warm_up(selector, {"http": 0.03, "http-octet": 0.02, "grpc": 0.01})
+
+    # When
+    chosen = selector.choose(
+        size=2048, dtype="float16", available=("http", "http-octet")
+    )
+
+    # Then
+    assert chosen == "http-octet"
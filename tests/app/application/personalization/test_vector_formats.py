@@ -0,0 +1,388 @@
+import base64
+import io
+
+import msgpack
+import numpy as np
+import pyarrow as pa
+import pytest
+import zstandard
+
+from app.application.personalization.v1 import formats
+from app.application.personalization.v1.enums import BigEndian
+from app.application.personalization.v1.exception import (
+    FeatureFormatNotAcceptableException,
+    FeatureImportException,
+)
+from app.application.personalization.v1.formats import (
+    ARROW,
+    EXPORT_MEDIA_TYPES,
+    JSON,
+    MATRIX_MEDIA_TYPES,
+    NPY,
+    OCTET,
+    PROTOBUF,
+    accepted_codecs,
+    check_formats,
+    decode_feature_import,
+    encode_feature,
+    encode_feature_export,
+    encode_feature_matrix,
+    encode_feature_scores,
+    negotiate_vector_format,
+)
+from app.application.personalization.v1.proto.embedding_pb2 import EmbeddingUserResponse
+from app.domain.personalization.repository.feature import UserFeatureBytes
+
+
+def make_feature(dtype: str = "float16", size: int = 8) -> UserFeatureBytes:
+    vector = np.random.standard_normal(size).astype(BigEndian[dtype].value)
+    return UserFeatureBytes(bvector=vector.tobytes(), size=size, dtype=dtype)
+
+
+@pytest.mark.parametrize(
+    "accept, expected",
+    [
+        (None, JSON),
+        ("*/*", JSON),
+        ("application/octet-stream", OCTET),
+        ("application/x-npy, application/json;q=0.5", NPY),
+        ("application/json;q=0.2, application/protobuf", PROTOBUF),
+        ("text/html, application/*;q=0.1", JSON),
+        ("application/json;q=0, application/octet-stream;q=0.1", OCTET),
+    ],
+    # No "/" in test ids, they name the profiling report files
+    ids=["none", "any", "octet", "npy", "protobuf", "wildcard", "q-zero"],
+)
+def test_negotiate_vector_format(accept, expected):
+    assert negotiate_vector_format(accept) == expected
+
+
+def test_negotiate_vector_format_rejects_unknown_types():
+    with pytest.raises(FeatureFormatNotAcceptableException):
+        negotiate_vector_format("text/html, application/json;q=0")
+
+
+def test_check_formats_fails_when_a_package_is_missing(monkeypatch):
+    # Given
+    monkeypatch.setattr(formats, "is_available", lambda media_type: media_type != ARROW)
+
+    # When / Then
+    with pytest.raises(ImportError, match="pyarrow"):
+        check_formats()
+
+
+def test_encode_feature_npy_and_protobuf():
+    # Given
+    feature = make_feature(dtype="float32")
+
+    # When
+    npy = encode_feature(feature, NPY)
+    protobuf = encode_feature(feature, PROTOBUF)
+
+    # Then
+    array = np.load(io.BytesIO(npy.body))
+    assert array.shape == (1, feature.size)
+    assert array.tobytes() == feature.bvector
+    assert EmbeddingUserResponse.FromString(protobuf.body).bvector == feature.bvector
+    assert npy.headers["x-vector-dtype"] == "float32"
+    assert npy.headers["x-vector-size"] == str(feature.size)
+
+
+def test_encode_feature_msgpack():
+    # Given
+    feature = make_feature()
+
+    # When
+    response = encode_feature(feature, "application/msgpack")
+
+    # Then
+    assert msgpack.unpackb(response.body) == {
+        "size": feature.size,
+        "dtype": feature.dtype,
+        "byteorder": "big",
+        "bvector": feature.bvector,
+    }
+
+
+def test_encode_feature_arrow():
+    # Given
+    feature = make_feature(dtype="float64")
+
+    # When
+    response = encode_feature(feature, "application/vnd.apache.arrow.stream")
+
+    # Then
+    table = pa.ipc.open_stream(response.body).read_all()
+    vector = np.asarray(table.column("user_vector")[0].values)
+    assert vector.astype(">f8").tobytes() == feature.bvector
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, expected",
+    [
+        (None, ()),
+        ("gzip, br", ()),
+        ("*", ()),
+        ("gzip, zstd", ("zstd",)),
+        ("x-shuffle-zstd;q=0.9, zstd;q=0", ("shuffle-zstd",)),
+    ],
+    ids=["none", "other", "wildcard", "zstd", "q-zero"],
+)
+def test_accepted_codecs(accept_encoding, expected):
+    # When / Then
+    assert accepted_codecs(accept_encoding) == expected
+
+
+def test_encode_feature_passes_compressed_octet_through():
+    # Given
+    feature = make_feature(size=64)
+    compressed = feature._replace(
+        bvector=zstandard.ZstdCompressor().compress(feature.bvector), codec="zstd"
+    )
+
+    # When
+    octet = encode_feature(compressed, OCTET)
+    npy = encode_feature(compressed, NPY)
+
+    # Then
+    assert octet.body == compressed.bvector
+    assert octet.headers["content-encoding"] == "zstd"
+    # Other formats are built from the decompressed vector
+    assert "content-encoding" not in npy.headers
+    np.testing.assert_array_equal(
+        np.load(io.BytesIO(npy.body))[0],
+        np.frombuffer(feature.bvector, dtype=BigEndian["float16"].value),
+    )
+
+
+def test_encode_feature_matrix_npy_with_present_mask():
+    # Given
+    matrix = np.arange(12, dtype="<f4").reshape(3, 4)
+    present = np.array([True, False, True])
+
+    # When
+    response = encode_feature_matrix(matrix, present, NPY)
+
+    # Then
+    np.testing.assert_array_equal(np.load(io.BytesIO(response.body)), matrix)
+    assert response.headers["x-vector-count"] == "3"
+    assert response.headers["x-vector-byteorder"] == "little"
+    mask = np.unpackbits(
+        np.frombuffer(base64.b64decode(response.headers["x-vector-present"]), np.uint8)
+    )[:3]
+    assert mask.astype(bool).tolist() == present.tolist()
+
+
+def test_encode_feature_scores_as_a_flat_array():
+    # Given
+    scores = np.array([0.5, np.nan], dtype=">f4")
+
+    # When
+    response = encode_feature_scores(scores, np.array([True, False]), OCTET)
+
+    # Then
+    assert len(response.body) == 8
+    assert np.frombuffer(response.body, ">f4")[0] == 0.5
+    assert response.headers["x-vector-byteorder"] == "big"
+    assert "x-vector-size" not in response.headers
+
+
+def test_negotiate_matrix_format_defaults_to_octet():
+    # When / Then
+    assert negotiate_vector_format(None, MATRIX_MEDIA_TYPES) == OCTET
+    assert negotiate_vector_format("*/*", MATRIX_MEDIA_TYPES) == OCTET
+    with pytest.raises(FeatureFormatNotAcceptableException):
+        negotiate_vector_format("application/json", MATRIX_MEDIA_TYPES)
+
+
+async def export_chunks():
+    for start in (0, 3):
+        ids = np.arange(start, start + 3, dtype=np.int64)
+        yield ids, ids + 100, np.arange(12, dtype="<f4").reshape(3, 4) + start
+
+
+@pytest.mark.asyncio
+async def test_encode_feature_export_npy_reads_back_chunk_by_chunk():
+    # When
+    body = b"".join(
+        [
+            part
+            async for part in encode_feature_export(
+                export_chunks(), NPY, size=4, dtype="float32"
+            )
+        ]
+    )
+
+    # Then
+    stream = io.BytesIO(body)
+    first, second = np.load(stream), np.load(stream)
+    assert first["id"].tolist() == [0, 1, 2]
+    assert second["user_id"].tolist() == [103, 104, 105]
+    np.testing.assert_array_equal(
+        second["user_vector"], np.arange(12).reshape(3, 4) + 3
+    )
+
+
+@pytest.mark.asyncio
+async def test_encode_feature_export_arrow_yields_a_batch_per_chunk():
+    # Given
+    media_type = negotiate_vector_format(ARROW, EXPORT_MEDIA_TYPES)
+
+    # When
+    parts = [
+        part
+        async for part in encode_feature_export(
+            export_chunks(), media_type, size=4, dtype="float32"
+        )
+    ]
+
+    # Then
+    assert media_type == ARROW
+    # Schema with the first batch, the second batch, end of stream
+    assert len(parts) == 3
+    table = pa.ipc.open_stream(b"".join(parts)).read_all()
+    assert table.column("id").to_pylist() == list(range(6))
+    assert table.column("user_vector").type.list_size == 4
+    assert table.column("user_vector")[5].as_py() == [11.0, 12.0, 13.0, 14.0]
+
+
+async def upload(*parts: bytes):
+    for part in parts:
+        yield part
+
+
+@pytest.mark.asyncio
+async def test_decode_feature_import_octet_rechunks_records():
+    # Given
+    record = np.dtype([("user_id", ">i8"), ("user_vector", ">f2", (4,))])
+    records = np.zeros(5, dtype=record)
+    records["user_id"] = np.arange(1, 6)
+    records["user_vector"] = np.arange(20).reshape(5, 4)
+    body = records.tobytes()
+
+    # When
+    chunks = [
+        chunk
+        async for chunk in decode_feature_import(
+            # Parts that cut records in half
+            upload(body[:7], body[7:30], body[30:]),
+            OCTET,
+            size=4,
+            dtype="float16",
+            chunk_size=2,
+        )
+    ]
+
+    # Then
+    assert [user_ids.tolist() for user_ids, _ in chunks] == [[1, 2], [3, 4], [5]]
+    np.testing.assert_array_equal(
+        np.concatenate([vectors for _, vectors in chunks]), records["user_vector"]
+    )
+
+
+@pytest.mark.asyncio
+async def test_decode_feature_import_octet_rejects_partial_record():
+    # When / Then
+    with pytest.raises(FeatureImportException):
+        async for _ in decode_feature_import(
+            upload(bytes(17)), OCTET, size=4, dtype="float16"
+        ):
+            pass
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("size", [4, 8], ids=["matching", "wrong-size"])
+async def test_decode_feature_import_arrow_checks_schema(size):
+    # Given
+    vectors = np.arange(12, dtype=np.float32)
+    batch = pa.record_batch(
+        [
+            pa.array([7, 8, 9]),
+            pa.FixedSizeListArray.from_arrays(pa.array(vectors), 4),
+        ],
+        names=["user_id", "user_vector"],
+    )
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    chunks = decode_feature_import(
+        upload(sink.getvalue().to_pybytes()), ARROW, size=size, dtype="float16"
+    )
+
+    # When / Then
+    if size == 8:
+        with pytest.raises(FeatureImportException):
+            await chunks.__anext__()
+        return
+    user_ids, matrix = await chunks.__anext__()
+    assert user_ids.tolist() == [7, 8, 9]
+    assert matrix.dtype == np.float16
+    np.testing.assert_array_equal(matrix, vectors.reshape(3, 4))
+
+
+@pytest.mark.asyncio
+async def test_decode_feature_import_arrow_reads_batches_as_they_arrive():
+    # Given
+    vectors = np.arange(24, dtype=np.float32)
+    batch = pa.record_batch(
+        [
+            pa.array(np.arange(1, 7)),
+            pa.FixedSizeListArray.from_arrays(pa.array(vectors), 4),
+        ],
+        names=["user_id", "user_vector"],
+    )
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_table(pa.Table.from_batches([batch]), max_chunksize=2)
+    body = sink.getvalue().to_pybytes()
+    parts = [body[start : start + 7] for start in range(0, len(body), 7)]
+    received = 0
+
+    async def tracked_upload():
+        nonlocal received
+        for part in parts:
+            received += len(part)
+            yield part
+
+    # When
+    chunks, received_at = [], []
+    async for chunk in decode_feature_import(
+        tracked_upload(), ARROW, size=4, dtype="float32", chunk_size=2
+    ):
+        chunks.append(chunk)
+        received_at.append(received)
+
+    # Then
+    assert [user_ids.tolist() for user_ids, _ in chunks] == [[1, 2], [3, 4], [5, 6]]
+    np.testing.assert_array_equal(
+        np.concatenate([matrix for _, matrix in chunks]), vectors.reshape(6, 4)
+    )
+    # The first batch came out before the whole upload was read
+    assert received_at[0] < len(body)
+
+
+@pytest.mark.asyncio
+async def test_decode_feature_import_arrow_rejects_truncated_stream():
+    # Given
+    batch = pa.record_batch(
+        [
+            pa.array([7]),
+            pa.FixedSizeListArray.from_arrays(pa.array(np.ones(4, np.float32)), 4),
+        ],
+        names=["user_id", "user_vector"],
+    )
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    body = sink.getvalue().to_pybytes()
+
+    # When / Then
+    with pytest.raises(FeatureImportException):
+        async for _ in decode_feature_import(
+            # Cut inside the record batch, before the end-of-stream marker
+            upload(body[:-20]),
+            ARROW,
+            size=4,
+            dtype="float32",
+        ):
+            pass
@@ -1,17 +1,46 @@
+import asyncio
+from contextlib import asynccontextmanager
 from copy import deepcopy
-from unittest.mock import AsyncMock, patch
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import numpy as np
 import pytest
+import zstandard
+from sqlalchemy.dialects import mysql
 
 from app.application.personalization.v1.enums import BigEndian
+from app.application.personalization.v1.exception import (
+    FeatureSizeMismatchException,
+    UserFeatureNotFoundException,
+)
+from app.application.personalization.v1.schema.request import UserEmbeddingRequest
+from app.application.personalization.v1.schema.response import GetUserEmbeddingResponse
 from app.application.personalization.v1.service import (
     PersonalizationService,
+    feature_jobs,
+    get_embedding_fingerprint,
     get_personalization_service,
+    handle_feature_job,
 )
 from app.application.user.v1.service import UserService
-from app.domain.personalization.dto.feature import CreateUserFeatureDTO
-from app.domain.personalization.repository.feature import UserFeatureRepository
+from app.core.helpers.cache import Cache
+from app.core.helpers.job_queue import Job, JobStatus
+from app.core.helpers.quantization import decode_pq, encode_pq, train_pq
+from app.domain.personalization.dto.feature import (
+    CreateUserFeatureDTO,
+    UpdateUserFeatureDTO,
+)
+from app.domain.personalization.repository.codebook import FeatureCodebookRepository
+from app.domain.personalization.repository.feature import (
+    FEATURE_BYTES_HEADER,
+    FEATURE_BYTES_KEY,
+    UserFeatureBytes,
+    UserFeatureRepository,
+    pack_feature_bytes,
+    stack_feature_bytes,
+    unpack_feature_bytes,
+)
 from app.domain.user.repository.user import UserRepository
 from tests.support.feature_fixture import make_user_feature, user_features
 from tests.support.user_fixture import make_user, users
@@ -108,25 +137,611 @@ async def test_update_user_feature_http():
 
 
 @pytest.mark.asyncio
-async def test_get_user_feature():
+async def test_update_user_feature_concurrent_calls_share_one_write():
+    # Given
+    user = make_user(**users[2])
+    user_feature = make_user_feature(**user_features[2])
+
+    command = CreateUserFeatureDTO(
+        protocol="http",
+        dtype="float16",
+        size=4,
+    )
+    bvector = np.ones(4).astype(BigEndian["float16"].value).tobytes()
+
+    async def get_embedding(**kwargs):
+        await asyncio.sleep(0.01)
+        return GetUserEmbeddingResponse(bvector=bvector, user_vector=None)
+
+    user_repository_mock = AsyncMock(spec=UserRepository)
+    user_repository_mock.get_by_id.return_value = user
+    user_feature_repository_mock = AsyncMock(spec=UserFeatureRepository)
+    user_feature_repository_mock.get_feature_by_user_id.return_value = user_feature
 
+    personalization_service.user_feature_repository = user_feature_repository_mock
+    personalization_service.user_repository = user_repository_mock
+
+    # When
+    with patch.object(
+        PersonalizationService, "_get_embedding", side_effect=get_embedding
+    ) as get_embedding_mock:
+        results = await asyncio.gather(
+            *(
+                personalization_service.update_user_feature(
+                    user_id=user.id, command=command
+                )
+                for _ in range(3)
+            )
+        )
+
+    # Then
+    get_embedding_mock.assert_awaited_once()
+    user_feature_repository_mock.update_by_id.assert_awaited_once()
+    assert all(result.user_vector == [[1.0] * 4] for result in results)
+
+
+@pytest.mark.parametrize("force", [False, True])
+@pytest.mark.asyncio
+async def test_update_user_feature_skips_unchanged_inputs_unless_forced(force):
     # Given
     user = make_user(**users[2])
     user_feature = make_user_feature(**user_features[2])
 
+    command = UpdateUserFeatureDTO(
+        protocol="http",
+        dtype=user_feature.dtype,
+        size=user_feature.size,
+        force=force,
+    )
+    user_feature.fingerprint = get_embedding_fingerprint(
+        UserEmbeddingRequest(
+            size=command.size,
+            dtype=command.dtype,
+            email=user.email,
+            nickname=user.nickname,
+            favorite=user.favorite,
+            lat=user.location.lat,
+            lng=user.location.lng,
+        )
+    )
+
+    user_repository_mock = AsyncMock(spec=UserRepository)
     user_repository_mock.get_by_id.return_value = user
+    user_feature_repository_mock = AsyncMock(spec=UserFeatureRepository)
     user_feature_repository_mock.get_feature_by_user_id.return_value = user_feature
 
     personalization_service.user_feature_repository = user_feature_repository_mock
     personalization_service.user_repository = user_repository_mock
 
     # When
-    result = await personalization_service.get_user_feature(user_id=user.id)
+    with patch.object(
+        PersonalizationService,
+        "_get_embedding",
+        return_value=GetUserEmbeddingResponse(
+            bvector=user_feature.bvector, user_vector=None
+        ),
+    ) as get_embedding_mock:
+        bvector = await personalization_service.update_user_feature(
+            user_id=user.id, command=command, return_binary=True, force=force
+        )
+
+    # Then
+    assert bvector == user_feature.bvector
+    assert get_embedding_mock.await_count == int(force)
+    assert user_feature_repository_mock.update_by_id.await_count == int(force)
+    user_feature_repository_mock.invalidate_feature_cache.assert_awaited_once()
 
-    # Thens
-    np_vector = np.expand_dims(
-        np.frombuffer(user_feature.bvector, dtype=BigEndian[user_feature.dtype].value),
-        axis=0,
+
+@pytest.mark.asyncio
+async def test_get_feature_bytes_slices_cached_blob():
+    # Given
+    user_feature = make_user_feature(**user_features[2])
+    cached = (
+        FEATURE_BYTES_HEADER.pack(user_feature.size, 0, 0, 0) + user_feature.bvector
     )
-    user_vector = np_vector.astype(np.float64).tolist()
-    assert result.user_vector == user_vector
+    backend = AsyncMock()
+    backend.get_raw.return_value = cached
+
+    # When
+    with patch.object(Cache, "backend", backend):
+        feature = await UserFeatureRepository().get_feature_bytes_by_user_id(
+            user_id=user_feature.user_id
+        )
+
+    # Then
+    assert feature.size == user_feature.size
+    assert feature.dtype == "float16"
+    assert feature.bvector == user_feature.bvector
+    # A view on the cached value, not a copy
+    assert isinstance(feature.bvector, memoryview)
+    assert feature.bvector.obj is cached
+
+
+@pytest.mark.asyncio
+async def test_get_feature_bytes_converts_and_caches_dtype():
+    # Given
+    user_feature = make_user_feature(**user_features[2])
+    stored = pack_feature_bytes(
+        UserFeatureBytes(
+            bvector=user_feature.bvector,
+            size=user_feature.size,
+            dtype=user_feature.dtype,
+        )
+    )
+    backend = AsyncMock()
+    backend.get_raw_many.return_value = [None, stored]
+
+    # When
+    with patch.object(Cache, "backend", backend):
+        feature = await UserFeatureRepository().get_feature_bytes_by_user_id(
+            user_id=user_feature.user_id, dtype="float32"
+        )
+
+    # Then
+    expected = (
+        np.frombuffer(user_feature.bvector, dtype=BigEndian["float16"].value)
+        .astype(BigEndian["float32"].value)
+        .tobytes()
+    )
+    assert feature.dtype == "float32"
+    assert feature.bvector == expected
+    set_raw = backend.set_raw.await_args.kwargs
+    assert set_raw["key"].endswith(":dtype:float32")
+    assert unpack_feature_bytes(set_raw["value"]) == feature
+
+
+@pytest.mark.asyncio
+async def test_feature_repository_int8_round_trip():
+    # Given
+    user_feature = make_user_feature(**user_features[2])
+    repository = UserFeatureRepository(quantization="int8")
+
+    # When
+    columns = await repository.encode_vector(
+        bvector=user_feature.bvector,
+        size=user_feature.size,
+        dtype=user_feature.dtype,
+    )
+    decoded = await repository.decode_vector(
+        SimpleNamespace(**columns, size=user_feature.size, dtype=user_feature.dtype)
+    )
+
+    # Then
+    assert columns["quantization"] == "int8"
+    assert len(columns["bvector"]) == user_feature.size
+    vector = np.frombuffer(user_feature.bvector, dtype=BigEndian["float16"].value)
+    np.testing.assert_allclose(
+        np.frombuffer(decoded, dtype=BigEndian["float16"].value),
+        vector,
+        atol=columns["scale"],
+    )
+
+
+@pytest.mark.asyncio
+async def test_feature_repository_pq_falls_back_to_int8_without_codebook():
+    # Given
+    user_feature = make_user_feature(**user_features[2])
+    codebook_repository = AsyncMock(spec=FeatureCodebookRepository)
+    codebook_repository.get_latest_codebook_id.return_value = None
+    repository = UserFeatureRepository(
+        quantization="pq", codebook_repository=codebook_repository
+    )
+
+    # When
+    columns = await repository.encode_vector(
+        bvector=user_feature.bvector,
+        size=user_feature.size,
+        dtype=user_feature.dtype,
+    )
+
+    # Then
+    assert columns["quantization"] == "int8"
+    assert columns["codebook_id"] is None
+
+
+@pytest.mark.asyncio
+async def test_feature_repository_pq_round_trip():
+    # Given
+    user_feature = make_user_feature(**user_features[2])
+    vector = np.frombuffer(user_feature.bvector, dtype=BigEndian["float16"].value)
+    codebook = train_pq(
+        np.random.default_rng(0).standard_normal((16, 2048)),
+        subvectors=32,
+        centroids=8,
+        iterations=2,
+    )
+    codebook_repository = AsyncMock(spec=FeatureCodebookRepository)
+    codebook_repository.get_latest_codebook_id.return_value = 7
+    codebook_repository.get_codebook.return_value = codebook
+    repository = UserFeatureRepository(
+        quantization="pq", codebook_repository=codebook_repository
+    )
+
+    # When
+    columns = await repository.encode_vector(
+        bvector=user_feature.bvector,
+        size=user_feature.size,
+        dtype=user_feature.dtype,
+    )
+    decoded = await repository.decode_vector(
+        SimpleNamespace(**columns, size=user_feature.size, dtype=user_feature.dtype)
+    )
+
+    # Then
+    assert columns["quantization"] == "pq"
+    assert columns["codebook_id"] == 7
+    assert len(columns["bvector"]) == 32
+    expected = decode_pq(encode_pq(vector, codebook), codebook, ">f2")
+    assert decoded == expected.tobytes()
+
+
+@pytest.mark.asyncio
+async def test_feature_repository_compresses_and_decodes():
+    # Given
+    bvector = np.linspace(-1, 1, 2048).astype(BigEndian["float16"].value).tobytes()
+    repository = UserFeatureRepository(codec="shuffle-zstd")
+
+    # When
+    columns = await repository.encode_vector(
+        bvector=bvector, size=2048, dtype="float16"
+    )
+    decoded = await repository.decode_vector(
+        SimpleNamespace(**columns, size=2048, dtype="float16")
+    )
+
+    # Then
+    assert columns["codec"] == "shuffle-zstd"
+    assert len(columns["bvector"]) < len(bvector)
+    assert decoded == bvector
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("codecs", [(), ("zstd",)], ids=["identity", "zstd"])
+async def test_get_feature_bytes_keeps_accepted_codec(codecs):
+    # Given
+    bvector = np.linspace(-1, 1, 2048).astype(BigEndian["float16"].value).tobytes()
+    compressed = zstandard.ZstdCompressor().compress(bvector)
+    backend = AsyncMock()
+    backend.get_raw.return_value = pack_feature_bytes(
+        UserFeatureBytes(bvector=compressed, size=2048, dtype="float16", codec="zstd")
+    )
+
+    # When
+    with patch.object(Cache, "backend", backend):
+        feature = await UserFeatureRepository().get_feature_bytes_by_user_id(
+            user_id=1, codecs=codecs
+        )
+
+    # Then
+    if codecs:
+        assert feature.codec == "zstd"
+        assert feature.bvector == compressed
+    else:
+        assert feature.codec == "none"
+        assert feature.bvector == bvector
+
+
+@pytest.mark.asyncio
+async def test_feature_repository_stores_little_endian():
+    # Given
+    user_feature = make_user_feature(**user_features[2])
+    repository = UserFeatureRepository(byteorder="little")
+
+    # When
+    columns = await repository.encode_vector(
+        bvector=user_feature.bvector,
+        size=user_feature.size,
+        dtype=user_feature.dtype,
+    )
+    row = SimpleNamespace(**columns, size=user_feature.size, dtype=user_feature.dtype)
+
+    # Then
+    vector = np.frombuffer(user_feature.bvector, dtype=BigEndian["float16"].value)
+    assert columns["byteorder"] == "little"
+    assert columns["bvector"] == vector.astype("<f2").tobytes()
+    assert await repository.decode_vector(row, byteorder="big") == user_feature.bvector
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("byteorder", [None, "little", "big"])
+async def test_get_feature_bytes_swaps_only_when_asked(byteorder):
+    # Given
+    vector = np.random.standard_normal(16).astype("<f2")
+    cached = pack_feature_bytes(
+        UserFeatureBytes(
+            bvector=vector.tobytes(), size=16, dtype="float16", byteorder="little"
+        )
+    )
+    backend = AsyncMock()
+    backend.get_raw.return_value = cached
+
+    # When
+    with patch.object(Cache, "backend", backend):
+        feature = await UserFeatureRepository().get_feature_bytes_by_user_id(
+            user_id=1, byteorder=byteorder
+        )
+
+    # Then
+    if byteorder == "big":
+        assert feature.byteorder == "big"
+        assert feature.bvector == vector.astype(">f2").tobytes()
+    else:
+        # As stored, still a view on the cached value
+        assert feature.byteorder == "little"
+        assert feature.bvector.obj is cached
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("converted", [2, 1], ids=["full-batch", "last-batch"])
+async def test_byteorder_job_continues_while_batches_are_full(converted):
+    # Given
+    payload = {"user_id": 1, "command": {"byteorder": "little", "batch_size": 2}}
+    job = Job(
+        id="job", kind="convert_byteorder", status=JobStatus.RUNNING, payload=payload
+    )
+    enqueue = AsyncMock(
+        return_value=Job(id="next", kind=job.kind, status=JobStatus.PENDING)
+    )
+
+    # When
+    with (
+        patch.object(
+            PersonalizationService,
+            "convert_feature_byteorder",
+            AsyncMock(return_value=converted),
+        ),
+        patch.object(feature_jobs, "enqueue", enqueue),
+    ):
+        result = await handle_feature_job(None, job)
+
+    # Then
+    assert result["converted"] == converted
+    if converted == 2:
+        assert result["next_job_id"] == "next"
+        enqueue.assert_awaited_once_with("convert_byteorder", payload)
+    else:
+        assert "next_job_id" not in result
+        enqueue.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_get_feature_bytes_by_user_ids_queries_only_misses():
+    # Given
+    cached = np.arange(4).astype(">f2")
+    stored = np.arange(4, 8).astype("<f2")
+    backend = AsyncMock()
+    backend.get_raw_many.return_value = [
+        pack_feature_bytes(
+            UserFeatureBytes(bvector=cached.tobytes(), size=4, dtype="float16")
+        ),
+        None,
+        None,
+    ]
+    row = SimpleNamespace(
+        user_id=2,
+        bvector=stored.tobytes(),
+        size=4,
+        dtype="float16",
+        quantization="none",
+        codec="none",
+        byteorder="little",
+    )
+    read_session = AsyncMock()
+    read_session.execute.return_value = MagicMock(all=MagicMock(return_value=[row]))
+
+    @asynccontextmanager
+    async def session_factory():
+        yield read_session
+
+    # When
+    with (
+        patch.object(Cache, "backend", backend),
+        patch(
+            "app.domain.personalization.repository.feature.session_factory",
+            session_factory,
+        ),
+    ):
+        features = await UserFeatureRepository().get_feature_bytes_by_user_ids(
+            user_ids=[1, 2, 3, 1]
+        )
+
+    # Then
+    assert len(backend.get_raw_many.await_args.kwargs["keys"]) == 3
+    read_session.execute.assert_awaited_once()
+    query = read_session.execute.await_args.args[0]
+    assert query.compile().params["user_id_1"] == [2, 3]
+    assert set(features) == {1, 2}
+    assert features[1].bvector == cached.tobytes()
+    assert features[2].byteorder == "little"
+    # Only what the query found is cached
+    assert list(backend.set_raw_many.await_args.kwargs["values"]) == [
+        FEATURE_BYTES_KEY.format(user_id=2)
+    ]
+
+
+def test_stack_feature_bytes_converts_groups_and_masks_missing():
+    # Given
+    half = np.arange(4).astype(">f2")
+    single = np.arange(4, 8).astype("<f4")
+    features = [
+        UserFeatureBytes(bvector=half.tobytes(), size=4, dtype="float16"),
+        None,
+        UserFeatureBytes(
+            bvector=single.tobytes(), size=4, dtype="float32", byteorder="little"
+        ),
+        UserFeatureBytes(bvector=half[::-1].tobytes(), size=4, dtype="float16"),
+    ]
+
+    # When
+    matrix, present = stack_feature_bytes(features, byteorder="little")
+
+    # Then
+    assert matrix.dtype.str == "<f4"
+    assert present.tolist() == [True, False, True, True]
+    np.testing.assert_array_equal(matrix, [half, np.zeros(4), single, half[::-1]])
+
+
+@pytest.mark.asyncio
+async def test_get_user_feature_matrix_rejects_mixed_sizes():
+    # Given
+    repository = AsyncMock(spec=UserFeatureRepository)
+    repository.get_feature_bytes_by_user_ids.return_value = {
+        1: UserFeatureBytes(bvector=bytes(8), size=4, dtype="float16"),
+        2: UserFeatureBytes(bvector=bytes(16), size=8, dtype="float16"),
+    }
+    service = PersonalizationService(
+        user_feature_repository=repository, user_repository=user_repository_mock
+    )
+
+    # When / Then
+    with pytest.raises(FeatureSizeMismatchException):
+        await service.get_user_feature_matrix(user_ids=[1, 2])
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("metric", ["dot", "cosine"])
+async def test_score_candidates_in_one_fetch(metric):
+    # Given
+    viewer = np.array([1, 2, 0, 0], dtype=">f4")
+    candidate = np.array([3, 0, 4, 0], dtype="<f2")
+    repository = AsyncMock(spec=UserFeatureRepository)
+    repository.get_feature_bytes_by_user_ids.return_value = {
+        1: UserFeatureBytes(bvector=viewer.tobytes(), size=4, dtype="float32"),
+        2: UserFeatureBytes(
+            bvector=candidate.tobytes(), size=4, dtype="float16", byteorder="little"
+        ),
+    }
+    service = PersonalizationService(
+        user_feature_repository=repository, user_repository=user_repository_mock
+    )
+
+    # When
+    scores, present = await service.score_candidates(
+        user_id=1, user_ids=[2, 3], metric=metric, byteorder="little"
+    )
+
+    # Then
+    repository.get_feature_bytes_by_user_ids.assert_awaited_once_with(
+        user_ids=[1, 2, 3]
+    )
+    assert scores.dtype.str == "<f4"
+    assert present.tolist() == [True, False]
+    expected = 3.0 if metric == "dot" else 3.0 / (5 * np.sqrt(5))
+    assert scores[0] == pytest.approx(expected)
+    assert np.isnan(scores[1])
+
+
+@pytest.mark.asyncio
+async def test_score_candidates_needs_the_callers_feature():
+    # Given
+    repository = AsyncMock(spec=UserFeatureRepository)
+    repository.get_feature_bytes_by_user_ids.return_value = {
+        2: UserFeatureBytes(bvector=bytes(8), size=4, dtype="float16"),
+    }
+    service = PersonalizationService(
+        user_feature_repository=repository, user_repository=user_repository_mock
+    )
+
+    # When / Then
+    with pytest.raises(UserFeatureNotFoundException):
+        await service.score_candidates(user_id=1, user_ids=[2])
+
+
+@pytest.mark.asyncio
+async def test_stream_features_yields_decoded_partitions_in_id_order():
+    # Given
+    vector = np.arange(4).astype(">f2")
+
+    def make_row(id):
+        return SimpleNamespace(
+            id=id,
+            user_id=id + 100,
+            bvector=zstandard.ZstdCompressor().compress(vector.tobytes()),
+            size=4,
+            dtype="float16",
+            quantization="none",
+            codec="zstd",
+            byteorder="big",
+        )
+
+    async def partitions():
+        yield [make_row(11), make_row(12)]
+        yield [make_row(15)]
+
+    read_session = AsyncMock()
+    read_session.stream.return_value = MagicMock(partitions=partitions)
+
+    @asynccontextmanager
+    async def session_factory():
+        yield read_session
+
+    # When
+    with patch(
+        "app.domain.personalization.repository.feature.session_factory",
+        session_factory,
+    ):
+        chunks = [
+            chunk
+            async for chunk in UserFeatureRepository().stream_features(
+                size=4, after=10, chunk_size=2
+            )
+        ]
+
+    # Then
+    query = read_session.stream.await_args.args[0]
+    assert query.get_execution_options()["yield_per"] == 2
+    assert query.compile().params["id_1"] == 10
+    assert [ids for ids, _, _ in chunks] == [[11, 12], [15]]
+    assert chunks[1][1] == [115]
+    assert chunks[0][2][1].codec == "none"
+    assert chunks[0][2][1].bvector == vector.tobytes()
+
+
+@pytest.mark.asyncio
+async def test_import_user_features_skips_invalid_rows():
+    # Given
+    repository = AsyncMock(spec=UserFeatureRepository)
+    user_repository = AsyncMock(spec=UserRepository)
+    user_repository.get_existing_ids.return_value = {1, 2}
+    service = PersonalizationService(
+        user_feature_repository=repository, user_repository=user_repository
+    )
+    vectors = np.ones((4, 4), dtype=np.float16)
+    vectors[1, 2] = np.nan
+
+    async def chunks():
+        # 1 valid, 2 has a NaN, 0 is not an id, 3 is an unknown user
+        yield np.array([1, 2, 0, 3]), vectors
+
+    # When
+    with patch("app.core.db.transactional.session", AsyncMock()):
+        response = await service.import_user_features(chunks=chunks(), dtype="float16")
+
+    # Then
+    assert response.imported == 1
+    assert response.skipped_user_ids == [2, 0, 3]
+    user_repository.get_existing_ids.assert_awaited_once_with(ids=[1, 3])
+    upsert = repository.upsert_features.await_args.kwargs
+    assert upsert["user_ids"].tolist() == [1]
+    repository.invalidate_feature_caches.assert_awaited_once_with(user_ids=[1])
+
+
+@pytest.mark.asyncio
+async def test_upsert_features_updates_on_duplicate_user_id():
+    # Given
+    write_session = AsyncMock()
+
+    # When
+    with patch("app.domain.personalization.repository.feature.session", write_session):
+        await UserFeatureRepository().upsert_features(
+            user_ids=np.array([1, 2]),
+            vectors=np.ones((2, 4), dtype=np.float32),
+            dtype="float16",
+        )
+
+    # Then
+    sql = str(write_session.execute.await_args.args[0].compile(dialect=mysql.dialect()))
+    assert sql.count("(%s, %s,") == 2
+    assert "ON DUPLICATE KEY UPDATE" in sql
+    assert "bvector = VALUES(bvector)" in sql
+    assert "fingerprint = VALUES(fingerprint)" in sql
@@ -0,0 +1,140 @@
+import numpy as np
+import pytest
+
+from app.core.helpers.ann import HNSWIndex, IVFFlatIndex
+from app.core.helpers.vector_search import VectorMatrix
+
+
+def make_vectors(count: int = 2000, size: int = 16) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((20, size))
+    points = centers[rng.integers(20, size=count)] + 0.3 * rng.standard_normal(
+        (count, size)
+    )
+    return points.astype(np.float32)
+
+
+def make_index(kind: str, size: int = 16):
+    if kind == "ivf":
+        return IVFFlatIndex(size, lists=16, nprobe=4)
+    return HNSWIndex(size, m=8, ef_construction=64, ef=32)
+
+
+def recall(
+    index, vectors: np.ndarray, queries: np.ndarray, k: int = 10, start: int = 0
+) -> float:
+    exact = VectorMatrix(vectors.shape[1])
+    exact.upsert(np.arange(start, start + len(vectors)), vectors)
+    found = 0
+    for query in queries:
+        expected, _ = exact.search(query, k)
+        ids, _ = index.search(query, k)
+        found += len(set(expected.tolist()) & set(ids.tolist()))
+    return found / (k * len(queries))
+
+
+@pytest.mark.parametrize("kind", ["ivf", "hnsw"])
+def test_search_finds_most_exact_neighbours(kind):
+    # Given
+    vectors = make_vectors()
+    index = make_index(kind)
+    index.upsert(np.arange(len(vectors)), vectors)
+
+    # When
+    found = recall(index, vectors, vectors[:50])
+
+    # Then
+    assert found >= 0.9
+
+
+@pytest.mark.parametrize(
+    "kind, knob, low, high", [("ivf", "nprobe", 1, 16), ("hnsw", "ef", 10, 200)]
+)
+def test_search_knob_trades_recall(kind, knob, low, high):
+    # Given
+    vectors = make_vectors()
+    index = make_index(kind)
+    index.upsert(np.arange(len(vectors)), vectors)
+    query = vectors[3]
+    exact = VectorMatrix(16)
+    exact.upsert(np.arange(len(vectors)), vectors)
+    expected, _ = exact.search(query, 10)
+
+    # When
+    ids, _ = index.search(query, 10, **{knob: high})
+
+    # Then
+    assert ids.tolist() == expected.tolist()
+    assert len(index.search(query, 10, **{knob: low})[0]) <= 10
+
+
+@pytest.mark.parametrize("kind", ["ivf", "hnsw"])
+def test_removed_and_replaced_vectors_are_not_returned(kind):
+    # Given
+    vectors = make_vectors(count=300)
+    index = make_index(kind)
+    index.upsert(np.arange(300), vectors)
+
+    # When
+    index.remove([0])
+    index.upsert(np.array([1]), -vectors[1])
+    ids, _ = index.search(vectors[1], 5, exclude=[2])
+
+    # Then
+    assert len(index) == 299
+    assert 0 not in ids and 1 not in ids and 2 not in ids
+
+
+@pytest.mark.parametrize("kind", ["ivf", "hnsw"])
+def test_state_round_trip(kind):
+    # Given
+    vectors = make_vectors(count=300)
+    index = make_index(kind)
+    index.upsert(np.arange(300), vectors)
+    index.remove([5])
+
+    # When
+    restored = type(index).from_state(index.state())
+
+    # Then
+    assert len(restored) == len(index)
+    for query in vectors[:5]:
+        expected, _ = index.search(query, 5)
+        assert restored.search(query, 5)[0].tolist() == expected.tolist()
+
+
+def test_hnsw_compact_drops_tombstones():
+    # Given
+    vectors = make_vectors(count=300)
+    index = make_index("hnsw")
+    index.upsert(np.arange(300), vectors)
+    index.remove(range(100))
+
+    # When
+    compacted = index.compact()
+
+    # Then
+    assert index.tombstones == 100
+    assert compacted.tombstones == 0
+    assert sorted(compacted.ids().tolist()) == list(range(100, 300))
+    assert recall(compacted, vectors[100:], vectors[100:120], start=100) >= 0.9
+
+
+def test_ivf_filled_in_small_upserts_is_retrained_on_request():
+    # Given
+    vectors = make_vectors(count=1000)
+    index = make_index("ivf")
+
+    # When
+    for start in range(0, 1000, 5):
+        index.upsert(np.arange(start, start + 5), vectors[start : start + 5])
+    retrained = index.retrained()
+
+    # Then
+    # Upserts never retrain: the first batch's 5 centroids are kept
+    assert len(index.centroids) == 5
+    assert index.needs_training
+    assert len(retrained.centroids) == 16
+    assert not retrained.needs_training and not retrained.under_trained
+    assert len(retrained) == 1000
+    assert recall(retrained, vectors, vectors[:20]) >= 0.8
@@ -0,0 +1,115 @@
+from app.core.helpers.circuit_breaker import CircuitBreaker, CircuitState
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_breaker(clock: FakeClock, **kwargs) -> CircuitBreaker:
+    options = dict(
+        window_seconds=10,
+        min_calls=4,
+        failure_rate=0.5,
+        reset_seconds=5,
+        clock=clock,
+    )
+    options.update(kwargs)
+    return CircuitBreaker(**options)
+
+
+def test_breaker_opens_on_error_rate():
+    # Given
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+
+    # When
+    breaker.record_success(0.01)
+    breaker.record_success(0.01)
+    breaker.record_failure()
+    breaker.record_failure()
+
+    # Then
+    assert breaker.state == CircuitState.OPEN
+    assert breaker.allow() is False
+
+
+def test_breaker_opens_on_slow_calls():
+    # Given
+    clock = FakeClock()
+    breaker = make_breaker(clock, slow_call_seconds=1.0)
+
+    # When
+    for latency in (0.1, 2.0, 2.0, 0.1):
+        breaker.record_success(latency)
+
+    # Then
+    assert breaker.state == CircuitState.OPEN
+
+
+def test_breaker_forgets_calls_outside_window():
+    # Given
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_failure()
+
+    # When
+    clock.now = 11
+    breaker.record_failure()
+
+    # Then
+    assert breaker.state == CircuitState.CLOSED
+
+
+def test_breaker_half_open_probe_closes_on_success():
+    # Given
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    for _ in range(4):
+        breaker.record_failure()
+
+    # When
+    clock.now = 5
+    first_probe = breaker.allow()
+    second_probe = breaker.allow()
+    breaker.record_success(0.01)
+
+    # Then
+    assert first_probe is True
+    assert second_probe is False
+    assert breaker.state == CircuitState.CLOSED
+    assert breaker.allow() is True
+
+
+def test_breaker_half_open_probe_reopens_on_failure():
+    # Given
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    for _ in range(4):
+        breaker.record_failure()
+
+    # When
+    clock.now = 5
+    breaker.allow()
+    breaker.record_failure()
+
+    # Then
+    assert breaker.state == CircuitState.OPEN
+
+
+def test_breaker_percentile():
+    # Given
+    clock = FakeClock()
+    breaker = make_breaker(clock, min_calls=1000)
+
+    # When
+    for i in range(1, 101):
+        breaker.record_success(i / 1000)
+
+    # Then
+    assert 0.094 < breaker.percentile(95) < 0.096
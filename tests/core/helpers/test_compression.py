@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from app.core.helpers import compression
+from app.core.helpers.compression import (
+    CODECS,
+    check_codec,
+    compress,
+    decompress,
+    shuffle,
+)
+
+
+@pytest.mark.parametrize("codec", CODECS)
+@pytest.mark.parametrize("dtype", [">f2", ">f4"], ids=["float16", "float32"])
+def test_compress_round_trip(codec, dtype):
+    # Given
+    data = np.linspace(-1, 1, 1024).astype(dtype).tobytes()
+    itemsize = np.dtype(dtype).itemsize
+
+    # When
+    compressed = compress(data, codec, itemsize=itemsize)
+
+    # Then
+    assert decompress(compressed, codec, itemsize=itemsize) == data
+    if codec.startswith("shuffle-"):
+        assert len(compressed) < len(data)
+
+
+def test_shuffle_groups_bytes_by_position():
+    # Given
+    data = np.array([1, 2, 3], dtype=">u2").tobytes()
+
+    # When / Then
+    assert shuffle(data, 2) == bytes([0, 0, 0, 1, 2, 3])
+
+
+def test_check_codec_fails_when_its_package_is_missing(monkeypatch):
+    # Given
+    monkeypatch.setattr(
+        compression, "find_spec", lambda name: None if name == "lz4" else object()
+    )
+
+    # When / Then
+    check_codec("none")
+    check_codec("shuffle-zstd")
+    with pytest.raises(ImportError, match="lz4"):
+        check_codec("shuffle-lz4")
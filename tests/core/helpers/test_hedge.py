@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from app.core.helpers.hedge import hedged
+
+
+def make_attempt(result, *, delay: float = 0.0, calls: list | None = None):
+    async def attempt():
+        if calls is not None:
+            calls.append(result)
+        await asyncio.sleep(delay)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    return attempt
+
+
+@pytest.mark.asyncio
+async def test_hedged_returns_first_reply_without_hedging():
+    # Given
+    calls = []
+    attempts = [
+        make_attempt("primary", calls=calls),
+        make_attempt("hedge", calls=calls),
+    ]
+
+    # When
+    result = await hedged(attempts, delay=0.1)
+
+    # Then
+    assert result == "primary"
+    assert calls == ["primary"]
+
+
+@pytest.mark.asyncio
+async def test_hedged_sends_second_attempt_when_first_is_slow():
+    # Given
+    calls = []
+    attempts = [
+        make_attempt("primary", delay=1.0, calls=calls),
+        make_attempt("hedge", calls=calls),
+    ]
+
+    # When
+    result = await hedged(attempts, delay=0.01)
+
+    # Then
+    assert result == "hedge"
+    assert calls == ["primary", "hedge"]
+
+
+@pytest.mark.asyncio
+async def test_hedged_retries_immediately_after_failure():
+    # Given
+    attempts = [
+        make_attempt(ValueError("down")),
+        make_attempt("hedge"),
+    ]
+
+    # When
+    result = await hedged(attempts, delay=10)
+
+    # Then
+    assert result == "hedge"
+
+
+@pytest.mark.asyncio
+async def test_hedged_raises_when_every_attempt_fails():
+    # Given
+    attempts = [
+        make_attempt(ValueError("first")),
+        make_attempt(ValueError("second")),
+    ]
+
+    # When
+    with pytest.raises(ValueError) as e:
+        await hedged(attempts, delay=0.01)
+
+    # Then
+    assert str(e.value) == "second"
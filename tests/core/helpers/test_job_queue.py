@@ -0,0 +1,97 @@
+import asyncio
+from uuid import uuid4
+
+import pytest
+
+from app.application.personalization.v1.exception import EmbeddingException
+from app.core.helpers.job_queue import JobStatus, RedisJobQueue
+from app.core.helpers.redis import redis_client
+
+
+async def handler(job):
+    await asyncio.sleep(0.01)
+    if job.payload.get("fail"):
+        raise EmbeddingException(message="embedding failed")
+    return {"size": job.payload["size"]}
+
+
+@pytest.mark.asyncio
+async def test_job_queue_runs_jobs_and_reports_status():
+    # Given
+    queue = RedisJobQueue(redis_client, name=f"test_jobs:{uuid4().hex}", block_ms=100)
+    queue.start(handler, workers=2)
+
+    # When
+    ok = await queue.enqueue("create", {"size": 8})
+    failed = await queue.enqueue("update", {"fail": True})
+    ok_done = await queue.wait(ok.id, timeout=5)
+    failed_done = await queue.wait(failed.id, timeout=5)
+    await queue.close()
+
+    # Then
+    assert ok.status == JobStatus.PENDING
+    assert ok_done.status == JobStatus.SUCCEEDED
+    assert ok_done.result == {"size": 8}
+    assert failed_done.status == JobStatus.FAILED
+    assert failed_done.message == "embedding failed"
+    assert await redis_client.xlen(queue.stream) == 0
+
+
+@pytest.mark.asyncio
+async def test_job_queue_wait_returns_pending_job_after_timeout():
+    # Given
+    queue = RedisJobQueue(redis_client, name=f"test_jobs:{uuid4().hex}")
+    job = await queue.enqueue("create", {"size": 8})
+
+    # When
+    waited = await queue.wait(job.id, timeout=0.05)
+    missing = await queue.wait(uuid4().hex, timeout=0.05)
+
+    # Then
+    assert waited.status == JobStatus.PENDING
+    assert missing is None
+
+
+@pytest.mark.asyncio
+async def test_job_queue_keeps_running_jobs_from_being_claimed():
+    # Given
+    runs = []
+
+    async def slow_handler(job):
+        runs.append(job.id)
+        await asyncio.sleep(0.5)
+        return {}
+
+    queue = RedisJobQueue(
+        redis_client,
+        name=f"test_jobs:{uuid4().hex}",
+        block_ms=50,
+        visibility_timeout=0.2,
+    )
+    queue.start(slow_handler, workers=2)
+
+    # When
+    job = await queue.enqueue("create", {})
+    done = await queue.wait(job.id, timeout=5)
+    await queue.close()
+
+    # Then
+    assert done.status == JobStatus.SUCCEEDED
+    assert runs == [job.id]
+
+
+@pytest.mark.asyncio
+async def test_job_queue_starts_deferred_workers_with_first_job():
+    # Given
+    queue = RedisJobQueue(redis_client, name=f"test_jobs:{uuid4().hex}", block_ms=100)
+    queue.start_on_enqueue(handler, workers=1)
+    started_before = bool(queue._workers)
+
+    # When
+    job = await queue.enqueue("create", {"size": 8})
+    done = await queue.wait(job.id, timeout=5)
+    await queue.close()
+
+    # Then
+    assert not started_before
+    assert done.status == JobStatus.SUCCEEDED
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from app.core.helpers.quantization import (
+    decode_pq,
+    dequantize_int8,
+    encode_pq,
+    quantize_int8,
+    train_pq,
+)
+
+
+def make_vectors(count: int = 300, size: int = 32) -> np.ndarray:
+    return np.random.default_rng(0).standard_normal((count, size)).astype(np.float32)
+
+
+def test_int8_round_trip_within_half_a_step():
+    # Given
+    vectors = make_vectors()
+
+    # When
+    codes, scale, offset = quantize_int8(vectors)
+    decoded = dequantize_int8(codes, scale, offset)
+
+    # Then
+    assert codes.dtype == np.int8
+    assert codes.min() == -128 and codes.max() == 127
+    assert np.all(np.abs(vectors - decoded) <= scale[:, np.newaxis] / 2 + 1e-6)
+
+
+def test_int8_keeps_constant_vectors():
+    # Given
+    vectors = np.full((1, 8), 0.25, dtype=np.float32)
+
+    # When
+    codes, scale, offset = quantize_int8(vectors)
+
+    # Then
+    np.testing.assert_allclose(dequantize_int8(codes, scale, offset), vectors)
+
+
+def test_pq_codes_one_byte_per_subvector():
+    # Given
+    vectors = make_vectors()
+
+    # When
+    codebook = train_pq(vectors, subvectors=8, centroids=16, iterations=5)
+    codes = encode_pq(vectors, codebook)
+    decoded = decode_pq(codes, codebook)
+
+    # Then
+    assert codebook.shape == (8, 16, 4)
+    assert codes.shape == (300, 8) and codes.dtype == np.uint8
+    assert decoded.shape == vectors.shape
+    # Every subvector decodes to its nearest centroid
+    error = np.sum((vectors - decoded) ** 2)
+    random_codes = np.random.default_rng(1).integers(16, size=codes.shape)
+    assert error < np.sum((vectors - decode_pq(random_codes, codebook)) ** 2)
+
+
+def test_pq_rejects_uneven_subvectors():
+    # When / Then
+    with pytest.raises(ValueError):
+        train_pq(make_vectors(size=30), subvectors=8)
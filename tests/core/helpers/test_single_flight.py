@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from app.core.helpers.single_flight import SingleFlight
+
+
+def make_call(result, *, delay: float = 0.01, calls: list | None = None):
+    async def call():
+        if calls is not None:
+            calls.append(result)
+        await asyncio.sleep(delay)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    return call
+
+
+@pytest.mark.asyncio
+async def test_single_flight_shares_concurrent_calls():
+    # Given
+    flights = SingleFlight()
+    calls = []
+
+    # When
+    results = await asyncio.gather(
+        *(flights.do("user:1", make_call("vector", calls=calls)) for _ in range(5))
+    )
+
+    # Then
+    assert results == ["vector"] * 5
+    assert calls == ["vector"]
+    assert not flights.in_flight("user:1")
+
+
+@pytest.mark.asyncio
+async def test_single_flight_runs_again_after_call_finishes():
+    # Given
+    flights = SingleFlight()
+    calls = []
+
+    # When
+    await flights.do("user:1", make_call("first", calls=calls))
+    await flights.do("user:1", make_call("second", calls=calls))
+
+    # Then
+    assert calls == ["first", "second"]
+
+
+@pytest.mark.asyncio
+async def test_single_flight_keeps_keys_apart():
+    # Given
+    flights = SingleFlight()
+    calls = []
+
+    # When
+    results = await asyncio.gather(
+        flights.do("user:1", make_call("one", calls=calls)),
+        flights.do("user:2", make_call("two", calls=calls)),
+    )
+
+    # Then
+    assert results == ["one", "two"]
+    assert sorted(calls) == ["one", "two"]
+
+
+@pytest.mark.asyncio
+async def test_single_flight_shares_errors():
+    # Given
+    flights = SingleFlight()
+    calls = []
+
+    # When
+    results = await asyncio.gather(
+        flights.do("user:1", make_call(ValueError("boom"), calls=calls)),
+        flights.do("user:1", make_call("unused", calls=calls)),
+        return_exceptions=True,
+    )
+
+    # Then
+    assert len(calls) == 1
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+@pytest.mark.asyncio
+async def test_single_flight_survives_cancelled_caller():
+    # Given
+    flights = SingleFlight()
+    leader = asyncio.ensure_future(flights.do("user:1", make_call("vector")))
+    follower = asyncio.ensure_future(flights.do("user:1", make_call("unused")))
+    await asyncio.sleep(0)
+
+    # When
+    leader.cancel()
+    result = await follower
+
+    # Then
+    assert leader.cancelled()
+    assert result == "vector"
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from app.core.helpers.vector_search import VectorMatrix
+
+
+def make_vectors(count: int = 500, size: int = 16) -> np.ndarray:
+    return np.random.default_rng(0).standard_normal((count, size)).astype(np.float32)
+
+
+@pytest.mark.parametrize("metric", ["cosine", "dot"])
+def test_search_matches_a_full_sort(metric):
+    # Given
+    vectors = make_vectors()
+    matrix = VectorMatrix(16, capacity=4)
+    matrix.upsert(np.arange(100, 600), vectors)
+    query = vectors[7]
+
+    # When
+    ids, scores = matrix.search(query, 10, metric=metric)
+
+    # Then
+    expected = vectors @ query
+    if metric == "cosine":
+        expected /= np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+    order = np.argsort(-expected)[:10]
+    assert ids.tolist() == (order + 100).tolist()
+    np.testing.assert_allclose(scores, expected[order], rtol=1e-5)
+
+
+def test_search_excludes_ids_and_caps_k():
+    # Given
+    vectors = make_vectors(count=3)
+    matrix = VectorMatrix(16)
+    matrix.upsert(np.array([1, 2, 3]), vectors)
+
+    # When
+    ids, _ = matrix.search(vectors[0], 10, exclude=[1])
+
+    # Then
+    assert sorted(ids.tolist()) == [2, 3]
+
+
+def test_upsert_replaces_and_remove_keeps_rows_packed():
+    # Given
+    vectors = make_vectors(count=4)
+    matrix = VectorMatrix(16, capacity=2)
+    matrix.upsert(np.array([1, 2, 3, 4]), vectors)
+
+    # When
+    matrix.upsert(np.array([2, 2]), vectors[[0, 3]])
+    matrix.remove([1, 9])
+
+    # Then
+    assert len(matrix) == 3
+    assert 1 not in matrix
+    # The last row moved into the removed one and is still found by id
+    np.testing.assert_array_equal(matrix.get(4), vectors[3])
+    # The last of a repeated id wins
+    np.testing.assert_array_equal(matrix.get(2), vectors[3])
+    ids, scores = matrix.search(vectors[2], 1)
+    assert ids.tolist() == [3]
+    assert scores[0] == pytest.approx(1.0)
@@ -0,0 +1,145 @@
+import numpy as np
+import pytest
+
+from app.core.helpers.vector_search import VectorMatrix
+from app.core.helpers.vector_snapshot import (
+    ShardPool,
+    SnapshotIndex,
+    SnapshotWriter,
+    VectorSnapshot,
+)
+
+
+def make_vectors(count: int = 300, size: int = 16) -> np.ndarray:
+    return np.random.default_rng(0).standard_normal((count, size)).astype(np.float32)
+
+
+def write_snapshot(path: str, ids: np.ndarray, vectors: np.ndarray) -> None:
+    writer = SnapshotWriter(path, vectors.shape[1])
+    # Uneven chunks, as streamed from the database
+    for start, end in ((0, 7), (7, 200), (200, len(ids))):
+        writer.append(ids[start:end], vectors[start:end])
+    writer.close({"watermark": "2026-01-01T00:00:00"})
+
+
+@pytest.mark.parametrize("metric", ["cosine", "dot"])
+def test_snapshot_searches_like_an_in_memory_matrix(tmp_path, metric):
+    # Given
+    vectors = make_vectors()
+    ids = np.random.default_rng(1).permutation(1000)[:300]
+    path = str(tmp_path / "features.snapshot")
+    write_snapshot(path, ids, vectors)
+    matrix = VectorMatrix(16)
+    matrix.upsert(ids, vectors)
+
+    # When
+    snapshot = VectorSnapshot(path)
+    index = SnapshotIndex(snapshot)
+    found, scores = index.search(vectors[3], 10, metric=metric, exclude=[ids[5]])
+
+    # Then
+    expected, expected_scores = matrix.search(
+        vectors[3], 10, metric=metric, exclude=[ids[5]]
+    )
+    assert isinstance(snapshot.vectors, np.memmap)
+    assert snapshot.meta == {"watermark": "2026-01-01T00:00:00"}
+    assert found.tolist() == expected.tolist()
+    np.testing.assert_allclose(scores, expected_scores, rtol=1e-5)
+    np.testing.assert_array_equal(snapshot.get(int(ids[9])), vectors[9])
+    assert snapshot.rows([int(ids[9]), 5000]).tolist() == [9, -1]
+
+
+def test_delta_overrides_and_hides_snapshot_rows(tmp_path):
+    # Given
+    vectors = make_vectors(count=10)
+    path = str(tmp_path / "features.snapshot")
+    write_snapshot(path, np.arange(10), vectors)
+    index = SnapshotIndex(VectorSnapshot(path))
+
+    # When
+    index.upsert(np.array([1, 20]), np.stack([-vectors[1], vectors[1]]))
+    index.remove([2])
+    ids, _ = index.search(vectors[1], 3)
+
+    # Then
+    assert len(index) == 10
+    assert 2 not in index and 20 in index
+    assert ids[0] == 20
+    assert 1 not in ids.tolist()
+    np.testing.assert_array_equal(index.get(1), -vectors[1])
+    assert sorted(index.ids().tolist()) == [0, 1, 3, 4, 5, 6, 7, 8, 9, 20]
+
+
+def test_empty_snapshot_opens(tmp_path):
+    # Given
+    path = str(tmp_path / "features.snapshot")
+    SnapshotWriter(path, 16).close()
+
+    # When
+    index = SnapshotIndex(VectorSnapshot(path))
+    index.upsert(np.array([1]), make_vectors(count=1))
+
+    # Then
+    assert len(index) == 1
+    assert index.search(make_vectors(count=1)[0], 5)[0].tolist() == [1]
+
+
+def test_failed_write_keeps_the_previous_snapshot(tmp_path):
+    # Given
+    path = str(tmp_path / "features.snapshot")
+    write_snapshot(path, np.arange(300), make_vectors())
+
+    # When
+    with pytest.raises(RuntimeError):
+        with SnapshotWriter(path, 16) as writer:
+            writer.append(np.arange(3), make_vectors(count=3))
+            raise RuntimeError
+
+    # Then
+    assert len(VectorSnapshot(path)) == 300
+    assert [file.name for file in tmp_path.iterdir()] == ["features.snapshot"]
+
+
+@pytest.mark.parametrize("metric", ["cosine", "dot"])
+def test_sharded_search_matches_a_local_one(tmp_path, metric):
+    # Given
+    vectors = make_vectors()
+    path = str(tmp_path / "features.snapshot")
+    write_snapshot(path, np.arange(300), vectors)
+    pool = ShardPool(3, min_rows=0)
+    local = SnapshotIndex(VectorSnapshot(path))
+    sharded = SnapshotIndex(VectorSnapshot(path), pool=pool)
+    for index in (local, sharded):
+        index.remove([4])
+
+    # When
+    try:
+        ids, scores = sharded.search(vectors[4], 10, metric=metric, exclude=[7])
+    finally:
+        pool.close()
+
+    # Then
+    expected, expected_scores = local.search(vectors[4], 10, metric=metric, exclude=[7])
+    assert ids.tolist() == expected.tolist()
+    np.testing.assert_allclose(scores, expected_scores, rtol=1e-5)
+
+
+def test_sharded_search_of_a_replaced_snapshot_falls_back(tmp_path):
+    # Given
+    vectors = make_vectors()
+    path = str(tmp_path / "features.snapshot")
+    write_snapshot(path, np.arange(300), vectors)
+    snapshot = VectorSnapshot(path)
+    write_snapshot(path, np.arange(300) + 1000, vectors)
+    pool = ShardPool(2, min_rows=0)
+
+    # When
+    try:
+        found = pool.search(snapshot, vectors[0], 5)
+        ids, _ = SnapshotIndex(snapshot, pool=pool).search(vectors[0], 5)
+    finally:
+        pool.close()
+
+    # Then
+    assert found is None
+    assert ids[0] == 0
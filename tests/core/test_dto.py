@@ -0,0 +1,36 @@
+import json
+
+import numpy as np
+import pytest
+
+from app.core.dto import VectorJSONResponse
+
+
+@pytest.mark.parametrize("dtype", [">f2", ">f4", ">f8", "<f2"])
+def test_vector_json_response_matches_tolist(dtype):
+    # Given
+    vector = np.random.standard_normal((1, 2048)).astype(dtype)
+
+    # When
+    response = VectorJSONResponse(
+        content={"size": 2048, "dtype": "float16", "user_vector": vector}
+    )
+
+    # Then
+    assert json.loads(response.body) == {
+        "size": 2048,
+        "dtype": "float16",
+        "user_vector": vector.astype(np.float64).tolist(),
+    }
+    assert response.headers["content-type"] == "application/json"
+
+
+def test_vector_json_response_writes_non_finite_as_null():
+    # Given
+    vector = np.array([1.5, np.nan, -np.inf], dtype=">f2")
+
+    # When
+    response = VectorJSONResponse(content=vector)
+
+    # Then
+    assert json.loads(response.body) == [1.5, None, None]
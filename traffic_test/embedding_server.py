@@ -0,0 +1,288 @@
+"""Local stand-in for the embedding model server.
+
+Serves the same HTTP JSON, HTTP octet and gRPC EmbeddingService contracts as
+the real server with deterministic numpy vectors, so load tests and the test
+suite can measure this service's own overhead on one box.
+
+    python -m traffic_test.embedding_server --latency-ms 5 --jitter-ms 2
+    python -m traffic_test.embedding_server --record vectors.jsonl \
+        --upstream http://embedding:8002
+    python -m traffic_test.embedding_server --replay vectors.jsonl
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import random
+from dataclasses import dataclass
+
+import grpc
+import httpx
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, HTTPException, Response
+
+from app.application.personalization.v1.enums import BigEndian
+from app.application.personalization.v1.proto import embedding_pb2, embedding_pb2_grpc
+from app.application.personalization.v1.schema.request import UserEmbeddingRequest
+
+
+class StandInError(Exception):
+    pass
+
+
+@dataclass
+class StandInRecord:
+    bvector: bytes
+    latency: float  # seconds
+
+
+class EmbeddingStandIn:
+    """Deterministic embeddings with injected latency, jitter and errors.
+
+    The vector only depends on the request payload, so every transport returns
+    the same bytes for the same user. With `record_path` every served vector is
+    appended as a JSON line; with `upstream` the vectors are fetched from a
+    real server first, which makes record + upstream a way to capture real
+    traffic. With `replay_path` the recorded vectors and latencies are served
+    back and unknown payloads fail.
+    """
+
+    def __init__(
+        self,
+        *,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 0,
+        record_path: str | None = None,
+        replay_path: str | None = None,
+        upstream: str | None = None,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.seed = seed
+        self.record_path = record_path
+        self.upstream = upstream
+        self._random = random.Random(seed)
+        self._replay: dict[str, StandInRecord] = {}
+        if replay_path:
+            self._replay = self.load(replay_path)
+
+    @staticmethod
+    def key(params: dict) -> str:
+        payload = UserEmbeddingRequest.model_validate(params).model_dump()
+        return hashlib.blake2b(
+            json.dumps(payload, sort_keys=True).encode(), digest_size=16
+        ).hexdigest()
+
+    @staticmethod
+    def load(path: str) -> dict[str, StandInRecord]:
+        records = {}
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                records[row["key"]] = StandInRecord(
+                    bvector=base64.b64decode(row["bvector"]), latency=row["latency"]
+                )
+        return records
+
+    def vector(self, params: dict) -> bytes:
+        command = UserEmbeddingRequest.model_validate(params)
+        seed = int(self.key(params), 16) ^ self.seed
+        rng = np.random.default_rng(seed)
+        return (
+            rng.standard_normal((1, command.size))
+            .astype(BigEndian[command.dtype].value)
+            .tobytes()
+        )
+
+    async def embed(self, params: dict) -> bytes:
+        key = self.key(params)
+        if self._replay:
+            record = self._replay.get(key)
+            if record is None:
+                raise StandInError(f"no recorded embedding for {key}")
+            await asyncio.sleep(record.latency)
+            return record.bvector
+
+        delay = self.latency_ms + self._random.uniform(-1, 1) * self.jitter_ms
+        await asyncio.sleep(max(delay, 0.0) / 1000)
+        if self._random.random() < self.error_rate:
+            raise StandInError("injected embedding error")
+
+        if self.upstream:
+            bvector, latency = await self._fetch(params)
+        else:
+            bvector, latency = self.vector(params), max(delay, 0.0) / 1000
+
+        if self.record_path:
+            with open(self.record_path, "a") as f:
+                row = {
+                    "key": key,
+                    "bvector": base64.b64encode(bvector).decode(),
+                    "latency": latency,
+                }
+                f.write(json.dumps(row) + "\n")
+        return bvector
+
+    async def _fetch(self, params: dict) -> tuple[bytes, float]:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        async with httpx.AsyncClient() as client:
+            response = await client.post(
+                f"{self.upstream}/v1/embedding/user/0/octet", json=params
+            )
+        if response.status_code != 200:
+            raise StandInError(response.text)
+        return response.content, loop.time() - started
+
+    @staticmethod
+    def to_list(bvector: bytes, dtype: str) -> list[list[float]]:
+        np_vector = np.frombuffer(bvector, dtype=BigEndian[dtype].value)
+        return np.expand_dims(np_vector, axis=0).astype(np.float64).tolist()
+
+
+def create_app(stand_in: EmbeddingStandIn) -> FastAPI:
+    app = FastAPI(title="Embedding stand-in")
+
+    async def embed(params: UserEmbeddingRequest) -> bytes:
+        try:
+            return await stand_in.embed(params.model_dump())
+        except StandInError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+
+    @app.post("/v1/embedding/user/{user_id}")
+    async def embedding_user(user_id: str, params: UserEmbeddingRequest):
+        bvector = await embed(params)
+        return {"user_vector": stand_in.to_list(bvector, params.dtype)}
+
+    @app.post("/v1/embedding/user/{user_id}/octet")
+    async def embedding_user_octet(user_id: str, params: UserEmbeddingRequest):
+        bvector = await embed(params)
+        return Response(content=bvector, media_type="application/octet-stream")
+
+    return app
+
+
+class EmbeddingStandInServicer(embedding_pb2_grpc.EmbeddingServiceServicer):
+    def __init__(self, stand_in: EmbeddingStandIn):
+        self.stand_in = stand_in
+
+    @staticmethod
+    def _params(request: embedding_pb2.EmbeddingUserRequest) -> dict:
+        return {
+            "size": request.size,
+            "dtype": request.dtype,
+            "email": request.email,
+            "nickname": request.nickname,
+            "favorite": request.favorite,
+            "lat": request.lat,
+            "lng": request.lng,
+        }
+
+    async def EmbeddingUser(self, request, context):
+        try:
+            bvector = await self.stand_in.embed(self._params(request))
+        except StandInError as e:
+            await context.abort(grpc.StatusCode.UNAVAILABLE, str(e))
+        return embedding_pb2.EmbeddingUserResponse(bvector=bvector)
+
+    async def EmbeddingUsers(self, request, context):
+        try:
+            bvectors = await asyncio.gather(
+                *(self.stand_in.embed(self._params(r)) for r in request.requests)
+            )
+        except StandInError as e:
+            await context.abort(grpc.StatusCode.UNAVAILABLE, str(e))
+        return embedding_pb2.EmbeddingUsersResponse(bvectors=bvectors)
+
+    async def EmbeddingUserStream(self, request_iterator, context):
+        responses: asyncio.Queue = asyncio.Queue()
+
+        async def answer(item):
+            try:
+                bvector = await self.stand_in.embed(self._params(item.request))
+                response = embedding_pb2.EmbeddingUserStreamResponse(
+                    request_id=item.request_id, bvector=bvector
+                )
+            except StandInError as e:
+                response = embedding_pb2.EmbeddingUserStreamResponse(
+                    request_id=item.request_id, error=str(e)
+                )
+            await responses.put(response)
+
+        async def consume():
+            async with asyncio.TaskGroup() as group:
+                async for item in request_iterator:
+                    group.create_task(answer(item))
+            await responses.put(None)
+
+        consumer = asyncio.ensure_future(consume())
+        try:
+            while (response := await responses.get()) is not None:
+                yield response
+        finally:
+            consumer.cancel()
+
+
+async def start_grpc_server(
+    stand_in: EmbeddingStandIn, address: str = "127.0.0.1:0"
+) -> tuple[grpc.aio.Server, int]:
+    server = grpc.aio.server()
+    embedding_pb2_grpc.add_EmbeddingServiceServicer_to_server(
+        EmbeddingStandInServicer(stand_in), server
+    )
+    port = server.add_insecure_port(address)
+    await server.start()
+    return server, port
+
+
+async def serve(stand_in: EmbeddingStandIn, *, host: str, port: int, grpc_port: int):
+    grpc_server, grpc_port = await start_grpc_server(stand_in, f"{host}:{grpc_port}")
+    http_server = uvicorn.Server(
+        uvicorn.Config(create_app(stand_in), host=host, port=port, log_level="warning")
+    )
+    print(f"Embedding stand-in: http://{host}:{port}, grpc {host}:{grpc_port}")
+    try:
+        await http_server.serve()
+    finally:
+        await grpc_server.stop(grace=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="0.0.0.0")
+    # Where EMBEDDING_URL and EMBEDDING_GRPC_URL point by default
+    parser.add_argument("--port", type=int, default=8002)
+    parser.add_argument("--grpc-port", type=int, default=8004)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--record", help="append served vectors to this JSONL file")
+    parser.add_argument("--replay", help="serve vectors recorded with --record")
+    parser.add_argument("--upstream", help="real embedding server to record from")
+    args = parser.parse_args()
+
+    stand_in = EmbeddingStandIn(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        seed=args.seed,
+        record_path=args.record,
+        replay_path=args.replay,
+        upstream=args.upstream,
+    )
+    asyncio.run(
+        serve(stand_in, host=args.host, port=args.port, grpc_port=args.grpc_port)
+    )
+
+
+if __name__ == "__main__":
+    main()
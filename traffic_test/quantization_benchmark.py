@@ -0,0 +1,128 @@
+"""Accuracy and size of the feature storage modes.
+
+Quantizes a set of vectors with every mode UserFeatureRepository can store
+and reports bytes per vector, reconstruction error, cosine similarity to the
+original, recall@k of an exact inner-product search run on the decoded
+vectors, and batch dequantization throughput.
+
+    python -m traffic_test.quantization_benchmark --count 20000 --size 2048
+    python -m traffic_test.quantization_benchmark --vectors features.npy
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from app.core.helpers.quantization import (
+    decode_pq,
+    dequantize_int8,
+    encode_pq,
+    quantize_int8,
+    train_pq,
+)
+
+
+def make_vectors(count: int, size: int, *, clusters: int, seed: int) -> np.ndarray:
+    """Gaussian clusters, closer to real embeddings than pure noise"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, size))
+    assigned = rng.integers(clusters, size=count)
+    return (centers[assigned] + 0.5 * rng.standard_normal((count, size))).astype(
+        np.float32
+    )
+
+
+def recall_at_k(vectors: np.ndarray, decoded: np.ndarray, queries: int, k: int):
+    exact = np.argsort(-(vectors[:queries] @ vectors.T), axis=1)[:, :k]
+    approx = np.argsort(-(vectors[:queries] @ decoded.T), axis=1)[:, :k]
+    return np.mean(
+        [len(np.intersect1d(e, a)) / k for e, a in zip(exact, approx, strict=True)]
+    )
+
+
+def report(name, vectors, decoded, nbytes, decode_seconds, *, queries, k):
+    error = np.sum((vectors - decoded) ** 2) / np.sum(vectors**2)
+    cosine = np.sum(vectors * decoded, axis=1) / (
+        np.linalg.norm(vectors, axis=1) * np.linalg.norm(decoded, axis=1)
+    )
+    print(
+        f"{name:<14} {nbytes:>8} B {vectors[0].nbytes / nbytes:>6.1f}x"
+        f" {error:>9.5f} {cosine.mean():>8.5f}"
+        f" {recall_at_k(vectors, decoded, queries, k):>8.3f}"
+        f" {len(vectors) / decode_seconds:>12,.0f}/s"
+    )
+
+
+def timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vectors", help=".npy file of (n, size) vectors")
+    parser.add_argument("--count", type=int, default=10000)
+    parser.add_argument("--size", type=int, default=2048)
+    parser.add_argument("--clusters", type=int, default=64)
+    parser.add_argument("--subvectors", type=int, nargs="+", default=[64, 128, 256])
+    parser.add_argument("--centroids", type=int, default=256)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--train", type=int, default=5000, help="PQ training sample")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.vectors:
+        vectors = np.load(args.vectors).astype(np.float32)
+    else:
+        vectors = make_vectors(
+            args.count, args.size, clusters=args.clusters, seed=args.seed
+        )
+    count, size = vectors.shape
+    metrics = dict(queries=min(args.queries, count), k=args.k)
+
+    print(f"{count} vectors of {size} dims, recall@{args.k}")
+    print(
+        f"{'mode':<14} {'bytes':>10} {'ratio':>7} {'rel.err':>9}"
+        f" {'cosine':>8} {'recall':>8} {'decode':>14}"
+    )
+    for dtype in ("float32", "float16"):
+        decoded, seconds = timed(
+            lambda: vectors.astype(f">{np.dtype(dtype).str[1:]}").astype(np.float32)
+        )
+        report(
+            dtype, vectors, decoded, size * np.dtype(dtype).itemsize, seconds, **metrics
+        )
+
+    codes, scale, offset = quantize_int8(vectors)
+    decoded, seconds = timed(dequantize_int8, codes, scale, offset)
+    # Codes plus the scale and offset columns
+    report("int8", vectors, decoded, size + 8, seconds, **metrics)
+
+    sample = vectors[np.random.default_rng(args.seed).permutation(count)[: args.train]]
+    for subvectors in args.subvectors:
+        if size % subvectors:
+            print(f"pq/{subvectors:<11} skipped, {size} dims do not split evenly")
+            continue
+        codebook, trained = timed(
+            train_pq,
+            sample,
+            subvectors=subvectors,
+            centroids=args.centroids,
+            iterations=args.iterations,
+            seed=args.seed,
+        )
+        codes = encode_pq(vectors, codebook)
+        decoded, seconds = timed(decode_pq, codes, codebook)
+        report(f"pq/{subvectors}", vectors, decoded, subvectors, seconds, **metrics)
+        print(
+            f"{'':<14} codebook {codebook.astype('>f4').nbytes:,} B,"
+            f" trained in {trained:.1f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Latency and throughput of a snapshot search, in-process and sharded.
+
+Writes (or reuses) a snapshot of random clustered vectors, then runs the same
+queries through SnapshotIndex with no pool and with ShardPools of each
+shard count, from `--concurrency` threads like concurrent requests would.
+Reports median/p95 latency, queries per second and the speedup over the
+in-process scan. Scaling stops at the core count, or earlier once the scans
+saturate memory bandwidth.
+
+    python -m traffic_test.search_benchmark --count 300000 --size 2048
+    python -m traffic_test.search_benchmark --shards 1 2 4 8 --concurrency 8
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from app.core.helpers.vector_snapshot import (
+    ShardPool,
+    SnapshotIndex,
+    SnapshotWriter,
+    VectorSnapshot,
+)
+
+
+def write_snapshot(path: str, count: int, size: int, *, seed: int) -> None:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((64, size)).astype(np.float32)
+    with SnapshotWriter(path, size) as writer:
+        # Chunked, so a large snapshot never sits in memory whole
+        for start in range(0, count, 10000):
+            rows = min(10000, count - start)
+            vectors = centers[rng.integers(64, size=rows)] + 0.5 * rng.standard_normal(
+                (rows, size), dtype=np.float32
+            )
+            writer.append(np.arange(start, start + rows), vectors)
+
+
+def run(index: SnapshotIndex, queries: np.ndarray, *, k: int, concurrency: int):
+    def search(query):
+        started = time.perf_counter()
+        index.search(query, k)
+        return time.perf_counter() - started
+
+    # One untimed round: starts the shard processes and maps the file
+    for query in queries[:concurrency]:
+        search(query)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        latencies = np.array(list(executor.map(search, queries)))
+    return latencies, len(queries) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--snapshot", help="existing snapshot file to search")
+    parser.add_argument("--count", type=int, default=100000)
+    parser.add_argument("--size", type=int, default=2048)
+    parser.add_argument("--shards", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    path = args.snapshot
+    if path is None:
+        path = os.path.join(tempfile.gettempdir(), "search_benchmark.snapshot")
+        print(f"writing {args.count} x {args.size} snapshot to {path}")
+        write_snapshot(path, args.count, args.size, seed=args.seed)
+    snapshot = VectorSnapshot(path)
+    rng = np.random.default_rng(args.seed + 1)
+    queries = rng.standard_normal((args.queries, snapshot.size)).astype(np.float32)
+
+    print(f"{len(snapshot)} vectors of {snapshot.size}, {os.cpu_count()} cores")
+    print(f"{'shards':>6} {'p50 ms':>9} {'p95 ms':>9} {'qps':>9} {'speedup':>8}")
+    baseline = None
+    for shards in [0, *args.shards]:
+        pool = ShardPool(shards, min_rows=0) if shards else None
+        try:
+            latencies, qps = run(
+                SnapshotIndex(snapshot, pool=pool),
+                queries,
+                k=args.k,
+                concurrency=args.concurrency,
+            )
+        finally:
+            if pool is not None:
+                pool.close()
+        baseline = baseline or qps
+        print(
+            f"{shards or 'local':>6} {np.median(latencies) * 1000:>9.2f}"
+            f" {np.percentile(latencies, 95) * 1000:>9.2f} {qps:>9.1f}"
+            f" {qps / baseline:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()